@@ -4,9 +4,20 @@ This module contains functions that relate neurons to corpus elements like
 words and sentences
 
 """
-from collections import defaultdict
+import heapq
 
 import numpy as np
+from scipy.sparse import csr_matrix
+
+
+def _check_thresholds(num_tokens, min_threshold):
+    if num_tokens != 0 and min_threshold is not None:
+        raise ValueError(
+            "Cannot specify both num_tokens and min_threshold at the same time"
+        )
+    elif min_threshold is None:
+        min_threshold = 0.1
+    return min_threshold
 
 
 def get_top_words(tokens, activations, neuron, num_tokens=0, min_threshold=None):
@@ -45,48 +56,407 @@ def get_top_words(tokens, activations, neuron, num_tokens=0, min_threshold=None)
         List of tuples, where each tuple is a (token, score) element
 
     """
+    return get_top_words_for_neurons(
+        tokens,
+        activations,
+        [neuron],
+        num_tokens=num_tokens,
+        min_threshold=min_threshold,
+    )[neuron]
 
-    if num_tokens != 0 and min_threshold is not None:
-        raise ValueError(
-            "Cannot specify both num_tokens and min_threshold at the same time"
+
+def get_top_words_for_neurons(
+    tokens, activations, neurons, num_tokens=0, min_threshold=None
+):
+    """
+    Get top activating words for several neurons at once.
+
+    Same as ``get_top_words``, but the corpus is only processed once for all
+    the given neurons: tokens are mapped to integer type ids once, and the
+    per-type scores of all neurons are aggregated with a single sparse
+    matrix product.
+
+    Parameters
+    ----------
+    tokens : dict
+        Dictionary containing atleast one list with the key ``source``. Usually
+        returned from ``data.loader.load_data``
+    activations : list of numpy.ndarray
+        List of *sentence representations*, where each *sentence representation*
+        is a numpy matrix of shape
+        ``[num tokens in sentence x concatenated representation size]``. Usually
+        retured from ``data.loader.load_activations``
+    neurons : list of int
+        Indices of the neurons relative to ``X``
+    num_tokens: int, optional
+        Number of top tokens to return per neuron. Defaults to 0, which returns
+        all tokens with a non-neglible contribution to the variance. Cannot be
+        specified with min_threshold
+    min_threshold: float, optional
+        Return top tokens that have a normalized score above the threshold. Ranges
+        from 0 to 1. Defaults to 0.1 which returns all tokens that have a score of
+        above 0.1. Cannot be specified with num_tokens
+
+    Returns
+    -------
+    top_words : dict
+        Dictionary with the neurons as keys, and lists of (token, score) tuples
+        as values. See ``get_top_words``.
+
+    """
+    neurons = list(neurons)
+    index = CorpusIndex(
+        tokens,
+        [sentence_activations[:, neurons] for sentence_activations in activations],
+    )
+    top_words = index.get_top_words(
+        range(len(neurons)), num_tokens=num_tokens, min_threshold=min_threshold
+    )
+    return {neuron: top_words[idx] for idx, neuron in enumerate(neurons)}
+
+
+def get_top_activations(
+    tokens, activations, neurons, num_occurrences=10, use_absolute=False
+):
+    """
+    Get the top activating token occurrences for several neurons.
+
+    Unlike ``get_top_words``, which aggregates scores per token type, this
+    method returns the individual token occurrences (with their sentences)
+    with the highest activations. ``activations`` are processed one sentence
+    at a time, keeping a bounded heap of the best occurrences per neuron, so
+    they can be streamed from disk (e.g. a generator) and are never sorted
+    completely.
+
+    Parameters
+    ----------
+    tokens : dict
+        Dictionary containing atleast one list with the key ``source``. Usually
+        returned from ``data.loader.load_data``
+    activations : iterable of numpy.ndarray
+        Iterable of *sentence representations*, where each *sentence
+        representation* is a numpy matrix of shape
+        ``[num tokens in sentence x concatenated representation size]``. Usually
+        retured from ``data.loader.load_activations``
+    neurons : list of int
+        Indices of the neurons
+    num_occurrences : int, optional
+        Number of top occurrences to return per neuron. Defaults to 10.
+    use_absolute : bool, optional
+        Whether to rank occurrences by the absolute value of the activations.
+        Defaults to False.
+
+    Returns
+    -------
+    top_activations : dict
+        Dictionary with the neurons as keys, and lists of
+        ``(token, activation, sentence_idx, token_idx, sentence)`` tuples in
+        decreasing order of activation as values, where ``token_idx`` is the
+        index of the token in the sentence ``tokens["source"][sentence_idx]``.
+
+    """
+    neurons = list(neurons)
+    if num_occurrences <= 0:
+        return {neuron: [] for neuron in neurons}
+
+    heaps = [[] for _ in neurons]
+    # Smallest value in every full heap, tokens below it can be skipped
+    thresholds = np.full(len(neurons), -np.inf)
+
+    for sentence_idx, sentence_activations in enumerate(activations):
+        values = np.asarray(sentence_activations)[:, neurons]
+        ranking_values = np.abs(values) if use_absolute else values
+        for token_idx, neuron_idx in zip(*np.nonzero(ranking_values >= thresholds)):
+            heap = heaps[neuron_idx]
+            # Earlier occurrences win ties
+            item = (
+                ranking_values[token_idx, neuron_idx],
+                -sentence_idx,
+                -token_idx,
+                values[token_idx, neuron_idx],
+            )
+            if len(heap) < num_occurrences:
+                heapq.heappush(heap, item)
+            else:
+                heapq.heappushpop(heap, item)
+            if len(heap) == num_occurrences:
+                thresholds[neuron_idx] = heap[0][0]
+
+    top_activations = {}
+    for neuron, heap in zip(neurons, heaps):
+        top_activations[neuron] = []
+        for _, sentence_idx, token_idx, activation in sorted(heap, reverse=True):
+            sentence_idx, token_idx = -sentence_idx, -token_idx
+            sentence = tokens["source"][sentence_idx]
+            top_activations[neuron].append(
+                (sentence[token_idx], activation, sentence_idx, token_idx, sentence)
+            )
+    return top_activations
+
+
+class CorpusIndex:
+    """
+    Reusable index over a corpus and its activations.
+
+    The index is built once from the tokens and activations of a corpus, and
+    can then answer repeated queries (top words, activations of a token type,
+    occurrences of a token type) without processing the corpus again. It
+    holds:
+
+    * the flattened activation matrix of size [``NUM_TOKENS`` x
+      ``NUM_NEURONS``]. If ``activations`` is already a single matrix, it is
+      used as is (e.g. a memory-mapped array) without copying,
+    * integer type ids for every token, in order of first appearance of the
+      types,
+    * the positions of all occurrences of every type,
+    * the start offsets of every sentence in the flattened tokens and
+    * the mean and standard deviation of every neuron over all tokens.
+
+    Parameters
+    ----------
+    tokens : dict
+        Dictionary containing atleast one list with the key ``source``. Usually
+        returned from ``data.loader.load_data``
+    activations : list of numpy.ndarray or numpy.ndarray
+        List of *sentence representations*, where each *sentence representation*
+        is a numpy matrix of shape
+        ``[num tokens in sentence x concatenated representation size]``. Usually
+        retured from ``data.loader.load_activations``. Alternatively, a single
+        matrix with the activations of all sentences concatenated.
+    batch_size : int, optional
+        Number of tokens that are processed together when computing the
+        neuron statistics. Defaults to 4096.
+
+    """
+
+    def __init__(self, tokens, activations, batch_size=4096):
+        self.sentences = tokens["source"]
+        sentence_lengths = [len(sentence) for sentence in self.sentences]
+        self.sentence_offsets = np.concatenate(([0], np.cumsum(sentence_lengths)))
+
+        if isinstance(activations, np.ndarray) and activations.ndim == 2:
+            self.activations = activations
+        else:
+            self.activations = np.concatenate(activations)
+        if self.activations.shape[0] != self.sentence_offsets[-1]:
+            raise ValueError(
+                "Number of tokens (%d) does not match number of activations (%d)"
+                % (self.sentence_offsets[-1], self.activations.shape[0])
+            )
+
+        # Map tokens to type ids in order of first appearance
+        self.type_to_id = {}
+        self.token_ids = np.array(
+            [
+                self.type_to_id.setdefault(token, len(self.type_to_id))
+                for sentence in self.sentences
+                for token in sentence
+            ],
+            dtype=np.int64,
         )
-    elif min_threshold is None:
-        min_threshold = 0.1
+        self.types = list(self.type_to_id)
 
-    activation_values = [
-        sentence_activations[:, neuron] for sentence_activations in activations
-    ]
-    activation_values = np.concatenate(activation_values)
-
-    tokens = [token for sentence in tokens["source"] for token in sentence]
-    mean = np.mean(activation_values)
-    std = np.std(activation_values)
-
-    token_wise_scores = np.abs((activation_values - mean) / std)
-    type_wise_scores_aggregation = defaultdict(lambda: (0, 0))
-    for idx, token in enumerate(tokens):
-        curr_sum, curr_count = type_wise_scores_aggregation[token]
-        type_wise_scores_aggregation[token] = (
-            curr_sum + token_wise_scores[idx],
-            curr_count + 1,
+        # Positions of all occurrences of type i are
+        # type_positions[type_offsets[i] : type_offsets[i + 1]]
+        self.type_counts = np.bincount(self.token_ids, minlength=len(self.types))
+        self.type_offsets = np.concatenate(([0], np.cumsum(self.type_counts)))
+        self.type_positions = np.argsort(self.token_ids, kind="stable")
+        self._type_token_matrix = csr_matrix(
+            (
+                np.ones(self.token_ids.shape[0]),
+                (self.token_ids, np.arange(self.token_ids.shape[0])),
+            ),
+            shape=(len(self.types), self.token_ids.shape[0]),
         )
 
-    # Normalize by count
-    type_wise_scores = [
-        (k, v[0] / v[1]) for k, v in type_wise_scores_aggregation.items()
-    ]
+        self.means, self.stds = self._get_neuron_statistics(batch_size)
+
+    @property
+    def num_tokens(self):
+        return self.activations.shape[0]
+
+    @property
+    def num_neurons(self):
+        return self.activations.shape[1]
+
+    def _get_neuron_statistics(self, batch_size):
+        sums = np.zeros(self.num_neurons, dtype=np.float64)
+        for start in range(0, self.num_tokens, batch_size):
+            sums += self.activations[start : start + batch_size].sum(
+                axis=0, dtype=np.float64
+            )
+        means = sums / self.num_tokens
+
+        squared_sums = np.zeros(self.num_neurons, dtype=np.float64)
+        for start in range(0, self.num_tokens, batch_size):
+            centered = self.activations[start : start + batch_size] - means
+            squared_sums += np.square(centered).sum(axis=0)
+
+        return means, np.sqrt(squared_sums / self.num_tokens)
+
+    def get_position(self, token_idx):
+        """
+        Returns the ``(sentence_idx, token_idx_in_sentence)`` location of the
+        token at index ``token_idx`` of the flattened corpus.
+        """
+        sentence_idx = (
+            np.searchsorted(self.sentence_offsets, token_idx, side="right") - 1
+        )
+        return int(sentence_idx), int(token_idx - self.sentence_offsets[sentence_idx])
+
+    def get_occurrences(self, token):
+        """
+        Returns the indices (in the flattened corpus) of all occurrences of the
+        given token type.
+        """
+        type_id = self.type_to_id[token]
+        return self.type_positions[
+            self.type_offsets[type_id] : self.type_offsets[type_id + 1]
+        ]
+
+    def get_type_activations(self, token, neurons=None):
+        """
+        Returns the activations of all occurrences of the given token type.
+
+        Parameters
+        ----------
+        token : str
+            Token type to get the activations for
+        neurons : list of int, optional
+            Neurons to get the activations of. Defaults to all neurons.
+
+        Returns
+        -------
+        activations : numpy.ndarray
+            Matrix of size [``NUM_OCCURRENCES`` x ``NUM_NEURONS``]
+
+        """
+        occurrences = self.get_occurrences(token)
+        if neurons is None:
+            return self.activations[occurrences]
+        return self.activations[occurrences][:, neurons]
+
+    def get_top_words(self, neurons, num_tokens=0, min_threshold=None):
+        """
+        Get top activating words for the given neurons.
+
+        See ``analysis.corpus.get_top_words`` for a description of the scores.
+
+        Parameters
+        ----------
+        neurons : int or list of int
+            Index or indices of the neurons
+        num_tokens: int, optional
+            Number of top tokens to return per neuron. Defaults to 0, which
+            returns all tokens with a non-neglible contribution to the
+            variance. Cannot be specified with min_threshold
+        min_threshold: float, optional
+            Return top tokens that have a normalized score above the threshold.
+            Ranges from 0 to 1. Defaults to 0.1. Cannot be specified with
+            num_tokens
+
+        Returns
+        -------
+        top_words : list of tuples or dict
+            List of (token, score) tuples if a single neuron is given,
+            otherwise a dictionary with the neurons as keys and these lists
+            as values.
+
+        """
+        min_threshold = _check_thresholds(num_tokens, min_threshold)
+        single_neuron = np.isscalar(neurons)
+        neurons = [neurons] if single_neuron else list(neurons)
+
+        token_wise_scores = np.abs(
+            (self.activations[:, neurons] - self.means[neurons]) / self.stds[neurons]
+        )
+
+        # Sum scores per type for all neurons at once, and normalize by count
+        type_wise_scores = (
+            self._type_token_matrix @ token_wise_scores
+        ) / self.type_counts.reshape(-1, 1)
+
+        top_words = {}
+        for neuron_idx, neuron in enumerate(neurons):
+            scores = type_wise_scores[:, neuron_idx]
+
+            # Normalize scores by max
+            scores = scores / scores.max()
+
+            # Sort and filter scores, ties are kept in order of first appearance
+            sorted_type_ids = np.argsort(-scores, kind="stable")
+            sorted_type_ids = sorted_type_ids[scores[sorted_type_ids] > min_threshold]
+
+            if num_tokens > 0:
+                sorted_type_ids = sorted_type_ids[:num_tokens]
+
+            top_words[neuron] = [
+                (self.types[type_id], scores[type_id]) for type_id in sorted_type_ids
+            ]
+
+        if single_neuron:
+            return top_words[neurons[0]]
+        return top_words
+
+    def get_top_activations(self, neurons, num_occurrences=10, use_absolute=False):
+        """
+        Get the top activating token occurrences for the given neurons.
+
+        The top occurrences are selected with a partial sort over the
+        flattened activations. See ``analysis.corpus.get_top_activations`` for
+        details.
+
+        Parameters
+        ----------
+        neurons : int or list of int
+            Index or indices of the neurons
+        num_occurrences : int, optional
+            Number of top occurrences to return per neuron. Defaults to 10.
+        use_absolute : bool, optional
+            Whether to rank occurrences by the absolute value of the
+            activations. Defaults to False.
+
+        Returns
+        -------
+        top_activations : list of tuples or dict
+            List of ``(token, activation, sentence_idx, token_idx, sentence)``
+            tuples if a single neuron is given, otherwise a dictionary with the
+            neurons as keys and these lists as values.
 
-    # Normalize scores by max
-    max_score = max([s for _, s in type_wise_scores])
-    type_wise_scores = [(k, v / max_score) for k, v in type_wise_scores]
+        """
+        single_neuron = np.isscalar(neurons)
+        neurons = [neurons] if single_neuron else list(neurons)
+        num_occurrences = min(num_occurrences, self.num_tokens)
 
-    # Sort and filter scores
-    sorted_types_scores = sorted(type_wise_scores, key=lambda x: -x[1])
-    sorted_types_scores = [
-        (k, v) for (k, v) in sorted_types_scores if v > min_threshold
-    ]
+        # [NUM_NEURONS x NUM_TOKENS], so that every neuron is partitioned
+        # over contiguous memory
+        values = np.ascontiguousarray(self.activations[:, neurons].T)
+        ranking_values = np.abs(values) if use_absolute else values
+        top_positions = np.argpartition(-ranking_values, num_occurrences - 1, axis=1)[
+            :, :num_occurrences
+        ]
 
-    if num_tokens > 0:
-        sorted_types_scores = sorted_types_scores[:num_tokens]
+        top_activations = {}
+        for neuron_idx, neuron in enumerate(neurons):
+            positions = top_positions[neuron_idx]
+            # Sort by decreasing activation, earlier occurrences first on ties
+            positions = positions[
+                np.lexsort((positions, -ranking_values[neuron_idx, positions]))
+            ]
+            top_activations[neuron] = []
+            for position in positions:
+                sentence_idx, token_idx = self.get_position(position)
+                sentence = self.sentences[sentence_idx]
+                top_activations[neuron].append(
+                    (
+                        sentence[token_idx],
+                        values[neuron_idx, position],
+                        sentence_idx,
+                        token_idx,
+                        sentence,
+                    )
+                )
 
-    return sorted_types_scores
+        if single_neuron:
+            return top_activations[neurons[0]]
+        return top_activations
@@ -14,6 +14,7 @@ from typing import Pattern
 import neurox.data.loader as data_loader
 import neurox.data.utils as data_utils
 import numpy as np
+import torch
 
 
 def _create_binary_data(tokens, activations, binary_filter, balance_data=False):
@@ -28,13 +29,17 @@ def _create_binary_data(tokens, activations, binary_filter, balance_data=False):
     activations: list
         A list of sentence-wise activations
     binary_filter: a set of words or a regex object or a function
+        Functions are evaluated once per unique word, and are therefore
+        expected to only depend on the word itself.
 
     Returns
     -------
     annotated_dataset : tuple of (tokens, labels and activations)
         A list of selected positive and negative class words, their labels (the
         string "positive" for examples matching the filter and "negative" for
-        others) and their activations
+        others) and a matrix of their activations of size
+        [``NUM_WORDS`` x ``NUM_NEURONS``], with the same type (numpy or torch)
+        as the sentence activations
 
     Example
     -------
@@ -42,65 +47,120 @@ def _create_binary_data(tokens, activations, binary_filter, balance_data=False):
     _create_binary_data(tokens, activations, {'is', 'can'}) select occrrences of 'is' and 'can' as a positive class
     """
 
-    filter_fn = None
+    if not isinstance(binary_filter, (set, Pattern, Callable)):
+        raise NotImplementedError("ERROR: does not belong to any configuration")
+
+    print("Creating binary dataset ...")
+    # Map every token to the id of its type, so that the filter only has to be
+    # evaluated once per unique type
+    type_to_id = {}
+    token_ids = np.fromiter(
+        (
+            type_to_id.setdefault(word, len(type_to_id))
+            for sentence in tokens["source"]
+            for word in sentence
+        ),
+        dtype=np.int64,
+    )
+    types = list(type_to_id)
+    sentence_offsets = np.cumsum([0] + [len(sentence) for sentence in tokens["source"]])
+
     if isinstance(binary_filter, set):
-        filter_fn = lambda x: x in binary_filter
+        type_is_positive = np.fromiter(
+            (t in binary_filter for t in types), dtype=bool, count=len(types)
+        )
     elif isinstance(binary_filter, Pattern):
-        filter_fn = lambda x: binary_filter.match(x)
-    elif isinstance(binary_filter, Callable):
-        filter_fn = binary_filter
+        type_is_positive = np.fromiter(
+            (binary_filter.match(t) is not None for t in types),
+            dtype=bool,
+            count=len(types),
+        )
     else:
-        raise NotImplementedError("ERROR: does not belong to any configuration")
-
-    positive_class_words = []
-    positive_class_activations = []
-    negative_class_words = []
-    negative_class_activations = []
+        type_is_positive = np.fromiter(
+            (bool(binary_filter(t)) for t in types), dtype=bool, count=len(types)
+        )
 
-    print("Creating binary dataset ...")
-    for s_idx, sentences in enumerate(tokens["source"]):
-        for w_idx, word in enumerate(sentences):
-            if filter_fn(word):
-                positive_class_words.append(word)
-                positive_class_activations.append(activations[s_idx][w_idx])
-            else:
-                negative_class_words.append(word)
-                negative_class_activations.append(activations[s_idx][w_idx])
+    # Positions of the tokens in the flattened corpus
+    is_positive = type_is_positive[token_ids]
+    positive_positions = np.flatnonzero(is_positive)
+    negative_positions = np.flatnonzero(~is_positive)
 
-    if len(negative_class_words) == 0 or len(positive_class_words) == 0:
+    if len(negative_positions) == 0 or len(positive_positions) == 0:
         raise ValueError("Positive or Negative class examples are zero")
-    elif len(negative_class_words) < len(positive_class_words):
+    elif len(negative_positions) < len(positive_positions):
         print(
             "WARNING: the negative class examples are less than the positive class examples"
         )
         print(
             "Postive class examples: ",
-            len(positive_class_words),
+            len(positive_positions),
             "Negative class examples: ",
-            len(negative_class_words),
+            len(negative_positions),
         )
 
-    if balance_data:
-        (
-            negative_class_words,
-            negative_class_activations,
-        ) = data_utils._balance_negative_class(
-            negative_class_words, negative_class_activations, len(positive_class_words)
+    if balance_data and len(negative_positions) > len(positive_positions):
+        # Only the positions are sampled, so activations of dropped negative
+        # examples are never touched. Sampled positions keep their original
+        # order.
+        print("Balancing Negative class ...")
+        negative_positions = np.sort(
+            np.random.choice(negative_positions, len(positive_positions), replace=False)
         )
 
-    print("Number of Positive examples: ", len(positive_class_words))
+    print("Number of Positive examples: ", len(positive_positions))
 
-    labels = (["positive"] * len(positive_class_words)) + ["negative"] * len(
-        negative_class_words
+    selected_positions = np.concatenate((positive_positions, negative_positions))
+    words = [types[i] for i in token_ids[selected_positions].tolist()]
+    labels = (["positive"] * len(positive_positions)) + ["negative"] * len(
+        negative_positions
     )
 
     return (
-        positive_class_words + negative_class_words,
+        words,
         labels,
-        positive_class_activations + negative_class_activations,
+        _gather_rows(activations, sentence_offsets, selected_positions),
     )
 
 
+def _gather_rows(activations, sentence_offsets, positions):
+    """
+    Gathers the activations of the tokens at the given positions of the
+    flattened corpus into a single preallocated matrix.
+
+    Sentences are processed one at a time, so ``activations`` can be any
+    sequence that loads sentences lazily, and sentences without any selected
+    token are not accessed at all. The result is a torch tensor if the
+    sentence activations are torch tensors, and a numpy array otherwise.
+    """
+    order = np.argsort(positions, kind="stable")
+    sorted_positions = positions[order]
+    # Range of ``order`` that falls into every sentence
+    sentence_bounds = np.searchsorted(sorted_positions, sentence_offsets)
+
+    gathered_activations = None
+    for s_idx in np.flatnonzero(np.diff(sentence_bounds)).tolist():
+        start, end = sentence_bounds[s_idx], sentence_bounds[s_idx + 1]
+        token_idx = sorted_positions[start:end] - sentence_offsets[s_idx]
+        rows = order[start:end]
+
+        sentence_activations = activations[s_idx]
+        if torch.is_tensor(sentence_activations):
+            token_idx, rows = torch.from_numpy(token_idx), torch.from_numpy(rows)
+        if gathered_activations is None:
+            shape = (len(positions),) + tuple(sentence_activations.shape[1:])
+            if torch.is_tensor(sentence_activations):
+                gathered_activations = torch.empty(
+                    shape, dtype=sentence_activations.dtype
+                )
+            else:
+                gathered_activations = np.empty(
+                    shape, dtype=np.asarray(sentence_activations).dtype
+                )
+        gathered_activations[rows] = sentence_activations[token_idx]
+
+    return gathered_activations
+
+
 def annotate_data(
     source_path,
     activations_path,
@@ -140,9 +200,9 @@ def annotate_data(
     )
 
     words, labels, activations = _create_binary_data(tokens, activations, binary_filter)
-    activations = [
-        np.swapaxes(a.reshape((a.shape[1], num_layers, -1)), 0, 1) for a in activations
-    ]
+    # Every word is saved as a single token sentence, in batches of size
+    # [NUM_LAYERS x BATCH_SIZE x NUM_NEURONS_PER_LAYER]
+    activations = activations.reshape((len(words), num_layers, -1)).swapaxes(0, 1)
     data_utils.save_files(
         words,
         labels,
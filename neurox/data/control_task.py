@@ -1,3 +1,4 @@
+import hashlib
 from collections import Counter
 
 import numpy as np
@@ -9,6 +10,7 @@ def create_sequence_labeling_dataset(
     test_source=None,
     case_sensitive=True,
     sample_from="same",
+    seed=None,
 ):
     """
     Method that prepares labels for a control task, as defined in §2.1 of `Hewitt and Liang (2019) <https://aclanthology.org/D19-1275.pdf>`
@@ -31,6 +33,13 @@ def create_sequence_labeling_dataset(
         defaults to 'same'. The distribution from which control task labels are sampled.
         'same': Labels are sampled from the same distribution as the main task labels.
         'uniform': Labels are sampled from a uniform distribution.
+    seed : int, optional
+        If provided, the label of every token type is derived from a hash of
+        the seed and the type itself, so that a type gets the same label
+        regardless of the other tokens in the datasets, as long as the label
+        distribution is the same (e.g. when creating control task labels for
+        several shards separately). Otherwise, labels
+        for all types are drawn at once from numpy's global random state.
 
     Returns
     -------
@@ -50,28 +59,57 @@ def create_sequence_labeling_dataset(
     if sample_from == "uniform":
         ct_label_distr = [1 / len(ct_label_distr) for i in ct_labels]
 
-    # create control task labels
-    word_types_to_ct_label = dict()
+    # factorize all tokens across datasets, in order of first appearance
     datasets = [train_tokens["source"]]
     if dev_source is not None:
         datasets.append(dev_source)
     if test_source is not None:
         datasets.append(test_source)
+
+    word_types_to_id = dict()
+    type_ids = np.fromiter(
+        (
+            word_types_to_id.setdefault(
+                tok if case_sensitive else tok.lower(), len(word_types_to_id)
+            )
+            for source_dataset in datasets
+            for sent in source_dataset
+            for tok in sent
+        ),
+        dtype=np.int64,
+    )
+
+    # draw the control task labels of all types at once
+    if seed is None:
+        type_labels = np.random.choice(
+            ct_labels, size=len(word_types_to_id), p=ct_label_distr
+        )
+    else:
+        uniform_samples = np.array(
+            [_hash_to_uniform(seed, word_type) for word_type in word_types_to_id]
+        )
+        cdf = np.cumsum(ct_label_distr)
+        cdf /= cdf[-1]
+        type_labels = np.searchsorted(cdf, uniform_samples, side="right")
+    token_labels = type_labels[type_ids].tolist()
+
+    # map the labels back to the sentences of every dataset
     result = []
+    offset = 0
     for source_dataset in datasets:
         ct_target = []
         for sent in source_dataset:
-            ct_labels_for_sent = []
-            for tok in sent:
-                tok = tok if case_sensitive else tok.lower()
-                if tok in word_types_to_ct_label:
-                    ct_labels_for_sent.append(word_types_to_ct_label[tok])
-                else:
-                    label_for_tok = np.random.choice(ct_labels, p=ct_label_distr)
-                    ct_labels_for_sent.append(label_for_tok)
-                    word_types_to_ct_label[tok] = label_for_tok
-            ct_target.append(ct_labels_for_sent)
+            ct_target.append(token_labels[offset : offset + len(sent)])
+            offset += len(sent)
         assert len(source_dataset) == len(ct_target)
         assert all([len(s) == len(t) for s, t in zip(source_dataset, ct_target)])
         result.append({"source": source_dataset, "target": ct_target})
     return result
+
+
+def _hash_to_uniform(seed, word_type):
+    """Maps a seed and a token type to a reproducible number in [0, 1)"""
+    digest = hashlib.blake2b(
+        f"{seed}:{word_type}".encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "little") / 2**64
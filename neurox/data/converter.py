@@ -0,0 +1,151 @@
+"""Activations Converter
+
+Module to convert activations saved in any of the formats supported by
+``data.loader.load_activations`` (e.g. the legacy OpenNMT-py ``pt`` and
+pickled ``acts`` formats) into the contiguous ``hdf5`` layout described in
+``data.writer``. Loading legacy formats requires assembling every sentence
+from per-token (and per-layer) arrays, while the contiguous layout is read
+with a single read, so activations that are used repeatedly only need to be
+converted once.
+
+The converter can also be used from the command line:
+
+.. code-block:: bash
+
+    python -m neurox.data.converter activations.pt activations.hdf5 \\
+        --num_neurons_per_layer 500
+"""
+import argparse
+
+import h5py
+import numpy as np
+
+from neurox.data import loader
+
+
+def convert_activations(
+    activations_path,
+    output_path,
+    num_neurons_per_layer=None,
+    is_brnn=False,
+    dtype=None,
+    batch_size=4096,
+):
+    """
+    Converts activations into the contiguous ``hdf5`` layout.
+
+    Parameters
+    ----------
+    activations_path : str
+        Path to the activations file. Can be of any type supported by
+        ``data.loader.load_activations``
+    output_path : str
+        Path of the converted activations file, with an ``.hdf5`` extension
+    num_neurons_per_layer : int, optional
+        Number of neurons per layer. Required for t7/pt/acts activations, see
+        ``data.loader.load_activations``
+    is_brnn : bool, optional
+        If the model used to extract activations was bidirectional (default: False)
+    dtype : str, optional
+        'float16' or 'float32' to enforce half-precision or full-precision
+        floats. Defaults to None, which keeps the dtype of the loaded
+        activations.
+    batch_size : int, optional
+        Minimum number of tokens written to the output file at once. Defaults
+        to 4096.
+
+    Returns
+    -------
+    num_layers : int
+        Number of layers in the converted activations
+
+    """
+    if not output_path.endswith(".hdf5"):
+        raise ValueError(
+            f"Output filename ({output_path}) does not end with .hdf5, but output file type is hdf5."
+        )
+
+    activations, num_layers = loader.load_activations(
+        activations_path, num_neurons_per_layer=num_neurons_per_layer, is_brnn=is_brnn
+    )
+    activations = [np.asarray(a) for a in activations]
+    num_layers = int(num_layers)
+    representation_size = activations[0].shape[1]
+    if representation_size % num_layers != 0:
+        raise ValueError(
+            f"Representation size ({representation_size}) is not divisible by the number of layers ({num_layers})."
+        )
+    if dtype is None:
+        dtype = activations[0].dtype
+
+    sentence_lengths = [a.shape[0] for a in activations]
+    sentence_offsets = np.concatenate(([0], np.cumsum(sentence_lengths)))
+
+    print("Writing contiguous activations to %s..." % (output_path))
+    with h5py.File(output_path, "w") as output_file:
+        # Token-major layout, as read by ``data.loader.load_activations``
+        dataset = output_file.create_dataset(
+            "activations",
+            (sentence_offsets[-1], num_layers, representation_size // num_layers),
+            dtype=dtype,
+        )
+
+        # Write groups of sentences with at least ``batch_size`` tokens at once
+        start_idx = 0
+        while start_idx < len(activations):
+            end_idx = start_idx + 1
+            while (
+                end_idx < len(activations)
+                and sentence_offsets[end_idx] - sentence_offsets[start_idx] < batch_size
+            ):
+                end_idx += 1
+            batch = np.concatenate(activations[start_idx:end_idx])
+            dataset[
+                sentence_offsets[start_idx] : sentence_offsets[end_idx]
+            ] = batch.reshape((batch.shape[0], num_layers, -1))
+            start_idx = end_idx
+
+        output_file.create_dataset(
+            "sentence_offsets", data=sentence_offsets.astype(np.int64)
+        )
+
+    return num_layers
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert activations into the contiguous hdf5 layout"
+    )
+    parser.add_argument("activations_path", help="Path to the activations file")
+    parser.add_argument("output_path", help="Output file path with an .hdf5 extension")
+    parser.add_argument(
+        "--num_neurons_per_layer",
+        type=int,
+        default=None,
+        help="Number of neurons per layer, required for t7, pt and acts activations",
+    )
+    parser.add_argument(
+        "--is_brnn",
+        action="store_true",
+        help="Activations were extracted from a bidirectional model",
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=["float16", "float32"],
+        default=None,
+        help="Output dtype of the converted activations. Defaults to the dtype of the input activations",
+    )
+
+    args = parser.parse_args()
+
+    convert_activations(
+        args.activations_path,
+        args.output_path,
+        num_neurons_per_layer=args.num_neurons_per_layer,
+        is_brnn=args.is_brnn,
+        dtype=args.dtype,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -68,10 +68,19 @@ def load_activations(
             num_neurons_per_layer is not None
         ), "pt activations require num_neurons_per_layer"
         activations = torch.load(activations_path)
-        activations = [
-            torch.stack([torch.cat(token) for token in sentence]).cpu()
-            for sentence in activations
-        ]
+        # Concatenate the layers of all tokens with a single call, and split
+        # the result into per-sentence views
+        sentence_lengths = [len(sentence) for sentence in activations]
+        all_acts = torch.cat(
+            [
+                layer_acts
+                for sentence in activations
+                for token in sentence
+                for layer_acts in token
+            ]
+        ).cpu()
+        all_acts = all_acts.view(sum(sentence_lengths), -1)
+        activations = list(torch.split(all_acts, sentence_lengths))
         num_layers = len(activations[0][0]) / num_neurons_per_layer
     elif file_ext == "acts":
         print("Loading generic activations from %s..." % (activations_path))
@@ -85,36 +94,59 @@ def load_activations(
         print("Combining layers " + str([a[0] for a in activations]))
         activations = [a[1] for a in activations]
         num_layers = len(activations)
-        num_sentences = len(activations[0])
-        concatenated_activations = []
-        for sentence_idx in range(num_sentences):
-            sentence_acts = []
-            for layer_idx in range(num_layers):
-                sentence_acts.append(np.vstack(activations[layer_idx][sentence_idx]))
-            concatenated_activations.append(np.concatenate(sentence_acts, axis=1))
-        activations = concatenated_activations
+        sentence_lengths = [len(sentence) for sentence in activations[0]]
+
+        # Stack the tokens of every layer with a single call each, and place
+        # the layers next to each other in one contiguous matrix
+        layer_acts = [
+            np.vstack([token for sentence in layer for token in sentence])
+            for layer in activations
+        ]
+        all_acts = np.empty(
+            (layer_acts[0].shape[0], sum(a.shape[1] for a in layer_acts)),
+            dtype=np.result_type(*layer_acts),
+        )
+        offset = 0
+        for a in layer_acts:
+            all_acts[:, offset : offset + a.shape[1]] = a
+            offset += a.shape[1]
+        activations = np.split(all_acts, np.cumsum(sentence_lengths)[:-1])
     elif file_ext == "hdf5":
         print("Loading hdf5 activations from %s..." % (activations_path))
         representations = h5py.File(activations_path, "r")
-        sentence_to_index = json.loads(representations.get("sentence_to_index")[0])
-        activations = []
-        if dtype == None:
-            dtype = representations[list(sentence_to_index.values())[0]].dtype
-        # TODO: Check order
-        for _, value in sentence_to_index.items():
-            sentence_acts = torch.FloatTensor(representations[value])
-            num_layers, sentence_length, embedding_size = (
-                sentence_acts.shape[0],
-                sentence_acts.shape[1],
-                sentence_acts.shape[2],
-            )
-            num_neurons_per_layer = embedding_size
-            sentence_acts = np.swapaxes(sentence_acts, 0, 1)
-            sentence_acts = sentence_acts.reshape(
-                sentence_length, num_layers * embedding_size
-            )
-            activations.append(sentence_acts.numpy().astype(dtype))
-        num_layers = len(activations[0][0]) / num_neurons_per_layer
+        if "sentence_offsets" in representations:
+            # Contiguous layout: read all activations at once and split them
+            # into per-sentence views
+            all_acts = representations["activations"]
+            num_tokens, num_layers, num_neurons_per_layer = all_acts.shape
+            if dtype == None:
+                dtype = all_acts.dtype
+            all_acts = all_acts[()].reshape(num_tokens, -1).astype(dtype, copy=False)
+            sentence_offsets = representations["sentence_offsets"][()]
+            activations = [
+                all_acts[start:end]
+                for start, end in zip(sentence_offsets[:-1], sentence_offsets[1:])
+            ]
+        else:
+            sentence_to_index = json.loads(representations.get("sentence_to_index")[0])
+            activations = []
+            if dtype == None:
+                dtype = representations[list(sentence_to_index.values())[0]].dtype
+            # TODO: Check order
+            for _, value in sentence_to_index.items():
+                sentence_acts = torch.FloatTensor(representations[value])
+                num_layers, sentence_length, embedding_size = (
+                    sentence_acts.shape[0],
+                    sentence_acts.shape[1],
+                    sentence_acts.shape[2],
+                )
+                num_neurons_per_layer = embedding_size
+                sentence_acts = np.swapaxes(sentence_acts, 0, 1)
+                sentence_acts = sentence_acts.reshape(
+                    sentence_length, num_layers * embedding_size
+                )
+                activations.append(sentence_acts.numpy().astype(dtype))
+            num_layers = len(activations[0][0]) / num_neurons_per_layer
     elif file_ext == "json":
         dtype = "float32" if dtype == None else dtype
         print("Loading json activations from %s..." % (activations_path))
@@ -185,6 +217,9 @@ def filter_activations_by_layers(
     as follows: forward layer 1 neurons, backward layer 1 neurons, forward layer
     2 neurons ...
 
+    If the selected layers form a single contiguous block of neurons, the
+    returned sentence representations are views of the original ones.
+
     """
     _layers = filter_layers.split(",")
 
@@ -199,7 +234,7 @@ def filter_activations_by_layers(
     filtered_train_activations = None
     filtered_test_activations = None
 
-    layers_idx = []
+    layer_ranges = []
     for brnn_idx, b in enumerate(layer_prefixes):
         for l in layers:
             if "%s%d" % (b, l) in _layers:
@@ -210,11 +245,25 @@ def filter_activations_by_layers(
                     "Including neurons from %s%d(#%d to #%d)"
                     % (b, l, start_idx, end_idx)
                 )
-                layers_idx.append(np.arange(start_idx, end_idx))
-    layers_idx = np.concatenate(layers_idx)
+                # Layers that directly follow each other are selected as a
+                # single block of neurons
+                if layer_ranges and layer_ranges[-1][1] == start_idx:
+                    layer_ranges[-1] = (layer_ranges[-1][0], end_idx)
+                else:
+                    layer_ranges.append((start_idx, end_idx))
+
+    def _filter_sentence(sentence_activations):
+        if len(layer_ranges) == 1:
+            # A single block of neurons can be selected without any copies
+            start_idx, end_idx = layer_ranges[0]
+            return sentence_activations[:, start_idx:end_idx]
+        return np.concatenate(
+            [sentence_activations[:, start:end] for start, end in layer_ranges],
+            axis=1,
+        )
 
-    filtered_train_activations = [a[:, layers_idx] for a in train_activations]
-    filtered_test_activations = [a[:, layers_idx] for a in test_activations]
+    filtered_train_activations = [_filter_sentence(a) for a in train_activations]
+    filtered_test_activations = [_filter_sentence(a) for a in test_activations]
 
     return filtered_train_activations, filtered_test_activations
 
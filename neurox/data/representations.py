@@ -3,11 +3,130 @@
 This module contains functions that will help in managing extracted
 representations, specifically on sub-word based data.
 """
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from tqdm import tqdm
 
 
-def bpe_get_avg_activations(tokens, activations):
+def _get_bpe_word_boundaries(sentence_idx, source, source_aux):
+    """
+    Returns the indices of the first and last subword of every word, assuming
+    that every non-terminal subword ends with "@@".
+    """
+    ends = np.flatnonzero([not subword.endswith("@@") for subword in source_aux])
+    assert len(ends) == len(source)
+
+    starts = np.concatenate(([0], ends[:-1] + 1))[: len(ends)]
+    return starts, ends
+
+
+def _get_char_word_boundaries(sentence_idx, source, source_aux):
+    """
+    Returns the indices of the first and last character of every word, where
+    words are separated by a single "_" character.
+    """
+    num_words = len(source)
+    assert (
+        source_aux.count("_") + 1 - source.count("_") == num_words
+    ), "Number of words dont match! (line: %d, source: %d, aux: %d)\n%s\n%s" % (
+        sentence_idx + 1,
+        num_words,
+        source_aux.count("_") + 1,
+        " ".join(source),
+        " ".join(source_aux),
+    )
+
+    word_lengths = np.array([len(word) for word in source], dtype=np.int64)
+    # Every word is followed by a separator
+    ends = np.cumsum(word_lengths + 1) - 2
+    starts = ends - word_lengths + 1
+    return starts, ends
+
+
+def _get_segment_averages(sentence_activations, starts, ends):
+    """
+    Averages the activations from ``starts[i]`` to ``ends[i]`` (inclusive) for
+    every segment ``i`` with a single reduction.
+    """
+    if len(starts) == 0:
+        return np.zeros((0, sentence_activations.shape[1]))
+
+    # Reduce over [start, end + 1) pairs and drop the sums of the gaps between
+    # segments
+    reduce_idx = np.empty(2 * len(starts), dtype=np.int64)
+    reduce_idx[0::2] = starts
+    reduce_idx[1::2] = ends + 1
+    if reduce_idx[-1] == sentence_activations.shape[0]:
+        reduce_idx = reduce_idx[:-1]
+    sums = np.add.reduceat(
+        sentence_activations.astype(np.float64, copy=False), reduce_idx, axis=0
+    )[0::2]
+
+    return sums / (ends - starts + 1)[:, None]
+
+
+def _get_segment_last(sentence_activations, ends, is_brnn):
+    """
+    Picks the forward activations of the last element of every segment, and
+    the backward activations of the element following the previous segment.
+    """
+    num_neurons = sentence_activations.shape[1]
+    rnn_boundary = int(num_neurons / 2)
+    if not is_brnn:
+        rnn_boundary = num_neurons
+
+    new_activations = np.zeros((len(ends), num_neurons))
+    # 0 - num_neurons/2: Forward
+    # num_neurons/2 - : Backward
+    new_activations[:, :rnn_boundary] = sentence_activations[ends, :rnn_boundary]
+    if is_brnn:
+        prev_idx = np.concatenate(([0], ends[:-1] + 1))[: len(ends)]
+        new_activations[:, rnn_boundary:] = sentence_activations[
+            prev_idx, rnn_boundary:
+        ]
+    return new_activations
+
+
+def _aggregate_activations(
+    tokens,
+    activations,
+    get_word_boundaries,
+    aggregate_fn,
+    num_workers=1,
+    show_progress=False,
+):
+    """
+    Shared core of the subword aggregation functions. Word boundaries are
+    computed for every sentence with ``get_word_boundaries``, and the
+    sentence's activations are then reduced with
+    ``aggregate_fn(sentence_activations, starts, ends)``. Sentences are
+    processed in parallel if ``num_workers`` is larger than 1.
+    """
+
+    def _aggregate_sentence(sentence_idx):
+        starts, ends = get_word_boundaries(
+            sentence_idx,
+            tokens["source"][sentence_idx],
+            tokens["source_aux"][sentence_idx],
+        )
+        sentence_activations = np.asarray(activations[sentence_idx])
+        return aggregate_fn(sentence_activations, starts, ends)
+
+    sentence_indices = range(len(tokens["source_aux"]))
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            all_activations = executor.map(_aggregate_sentence, sentence_indices)
+            if show_progress:
+                all_activations = tqdm(all_activations, total=len(sentence_indices))
+            return list(all_activations)
+
+    if show_progress:
+        sentence_indices = tqdm(sentence_indices)
+    return [_aggregate_sentence(sentence_idx) for sentence_idx in sentence_indices]
+
+
+def bpe_get_avg_activations(tokens, activations, num_workers=1):
     """Aggregates activations by averaging assuming BPE-based tokenization.
 
     Given loaded tokens data and activations, this function aggeregates
@@ -25,6 +144,8 @@ def bpe_get_avg_activations(tokens, activations):
         ``target``. Usually the output of ``data.loader.load_aux_data``.
     activations : list of numpy.ndarray
         Activations returned from ``loader.load_activations``.
+    num_workers : int, optional
+        Number of threads to process sentences with. Defaults to 1.
 
     Returns
     -------
@@ -33,44 +154,16 @@ def bpe_get_avg_activations(tokens, activations):
         found in the untokenized text.
 
     """
-    all_activations = []
-    num_neurons = activations[0].size(1)
-
-    for i in range(0, len(tokens["source_aux"])):
-        sourceIndex = 0
-        thisBPE = ""
-        source = tokens["source"][i]
-        source_aux = tokens["source_aux"][i]
-        num_words = len(source)
-        new_activations = np.zeros((num_words, num_neurons))
-
-        word_boundaries = []
-
-        for j in range(0, len(tokens["source_aux"][i])):
-            currSourceWord = tokens["source"][i][sourceIndex]
-            thisBPE = thisBPE + tokens["source_aux"][i][j]
-
-            if thisBPE != currSourceWord:
-                thisBPE = thisBPE[:-2]
-            else:
-                word_boundaries.append(j)
-                sourceIndex = sourceIndex + 1
-                thisBPE = ""
-
-        assert len(word_boundaries) == num_words
+    return _aggregate_activations(
+        tokens,
+        activations,
+        _get_bpe_word_boundaries,
+        _get_segment_averages,
+        num_workers=num_workers,
+    )
 
-        prev_idx = 0
-        for word_idx, boundary in enumerate(word_boundaries):
-            avg_vector = np.average(activations[i][prev_idx : boundary + 1, :], axis=0)
-            new_activations[word_idx, :] = avg_vector
-            prev_idx = boundary + 1
-
-        all_activations.append(new_activations)
-
-    return all_activations
 
-
-def bpe_get_last_activations(tokens, activations, is_brnn=True):
+def bpe_get_last_activations(tokens, activations, is_brnn=True, num_workers=1):
     """Aggregates activations by picking the last subword assuming BPE-based tokenization.
 
     Given loaded tokens data and activations, this function aggeregates
@@ -91,6 +184,8 @@ def bpe_get_last_activations(tokens, activations, is_brnn=True):
     is_brnn : bool, optional
         Whether the model from which activations were extracted was bidirectional.
         Only applies for RNN models.
+    num_workers : int, optional
+        Number of threads to process sentences with. Defaults to 1.
 
     Returns
     -------
@@ -99,55 +194,18 @@ def bpe_get_last_activations(tokens, activations, is_brnn=True):
         found in the untokenized text.
 
     """
-    all_activations = []
-    num_neurons = activations[0].size(1)
-
-    for i in range(0, len(tokens["source_aux"])):
-        sourceIndex = 0
-        thisBPE = ""
-        source = tokens["source"][i]
-        source_aux = tokens["source_aux"][i]
-        num_words = len(source)
-        new_activations = np.zeros((num_words, num_neurons))
-
-        word_boundaries = []
-
-        for j in range(0, len(tokens["source_aux"][i])):
-            currSourceWord = tokens["source"][i][sourceIndex]
-            thisBPE = thisBPE + tokens["source_aux"][i][j]
-
-            if thisBPE != currSourceWord:
-                thisBPE = thisBPE[:-2]
-            else:
-                word_boundaries.append(j)
-                sourceIndex = sourceIndex + 1
-                thisBPE = ""
-
-        assert len(word_boundaries) == num_words
-
-        rnn_boundary = int(num_neurons / 2)
-        if not is_brnn:
-            rnn_boundary = num_neurons
-
-        prev_idx = 0
-        for word_idx, boundary in enumerate(word_boundaries):
-            # 0 - num_neurons/2: Forward
-            # num_neurons/2 - : Backward
-            new_activations[word_idx, :rnn_boundary] = activations[i][
-                boundary, :rnn_boundary
-            ]
-            if is_brnn:
-                new_activations[word_idx, rnn_boundary:] = activations[i][
-                    prev_idx, rnn_boundary:
-                ]
-            prev_idx = boundary + 1
-
-        all_activations.append(new_activations)
-
-    return all_activations
-
-
-def char_get_avg_activations(tokens, activations):
+    return _aggregate_activations(
+        tokens,
+        activations,
+        _get_bpe_word_boundaries,
+        lambda sentence_activations, starts, ends: _get_segment_last(
+            sentence_activations, ends, is_brnn
+        ),
+        num_workers=num_workers,
+    )
+
+
+def char_get_avg_activations(tokens, activations, num_workers=1):
     """Aggregates activations by averaging assuming Character-based tokenization.
 
     Given loaded tokens data and activations, this function aggeregates
@@ -164,6 +222,8 @@ def char_get_avg_activations(tokens, activations):
         ``target``. Usually the output of ``data.loader.load_aux_data``.
     activations : list of numpy.ndarray
         Activations returned from ``loader.load_activations``.
+    num_workers : int, optional
+        Number of threads to process sentences with. Defaults to 1.
 
     Returns
     -------
@@ -172,51 +232,17 @@ def char_get_avg_activations(tokens, activations):
         found in the untokenized text.
 
     """
-    all_activations = []
-    num_neurons = activations[0].size(1)
-
-    for i in tqdm(range(0, len(tokens["source_aux"]))):
-        sourceIndex = 0
-        thisChar = ""
-        source = tokens["source"][i]
-        source_aux = tokens["source_aux"][i]
-        num_words = len(source)
-        new_activations = np.zeros((num_words, num_neurons))
-
-        word_boundaries = []
-
-        for word_idx, word in enumerate(tokens["source"][i]):
-            if word_idx == 0:
-                word_boundaries.append(len(word) - 1)
-            else:
-                word_boundaries.append(len(word) + 1 + word_boundaries[-1])
-
-        if len(word_boundaries) != num_words:
-            print(i, len(word_boundaries), num_words)
-        assert len(word_boundaries) == num_words
-        assert (
-            tokens["source_aux"][i].count("_") + 1 - tokens["source"][i].count("_")
-            == num_words
-        ), "Number of words dont match! (line: %d, source: %d, aux: %d)\n%s\n%s" % (
-            i + 1,
-            num_words,
-            tokens["source_aux"][i].count("_") + 1,
-            " ".join(tokens["source"][i]),
-            " ".join(tokens["source_aux"][i]),
-        )
+    return _aggregate_activations(
+        tokens,
+        activations,
+        _get_char_word_boundaries,
+        _get_segment_averages,
+        num_workers=num_workers,
+        show_progress=True,
+    )
 
-        prev_idx = 0
-        for word_idx, boundary in enumerate(word_boundaries):
-            avg_vector = np.average(activations[i][prev_idx : boundary + 1, :], axis=0)
-            new_activations[word_idx, :] = avg_vector
-            prev_idx = boundary + 2
 
-        all_activations.append(new_activations)
-
-    return all_activations
-
-
-def char_get_last_activations(tokens, activations, is_brnn=True):
+def char_get_last_activations(tokens, activations, is_brnn=True, num_workers=1):
     """Aggregates activations by picking the last subword assuming Character-based tokenization.
 
     Given loaded tokens data and activations, this function aggeregates
@@ -236,6 +262,8 @@ def char_get_last_activations(tokens, activations, is_brnn=True):
     is_brnn : bool, optional
         Whether the model from which activations were extracted was bidirectional.
         Only applies for RNN models.
+    num_workers : int, optional
+        Number of threads to process sentences with. Defaults to 1.
 
     Returns
     -------
@@ -244,60 +272,16 @@ def char_get_last_activations(tokens, activations, is_brnn=True):
         found in the untokenized text.
 
     """
-    all_activations = []
-    num_neurons = activations[0].size(1)
-
-    for i in tqdm(range(0, len(tokens["source_aux"]))):
-        sourceIndex = 0
-        thisChar = ""
-        source = tokens["source"][i]
-        source_aux = tokens["source_aux"][i]
-        num_words = len(source)
-        new_activations = np.zeros((num_words, num_neurons))
-
-        word_boundaries = []
-
-        for word_idx, word in enumerate(tokens["source"][i]):
-            if word_idx == 0:
-                word_boundaries.append(len(word) - 1)
-            else:
-                word_boundaries.append(len(word) + 1 + word_boundaries[-1])
-
-        if len(word_boundaries) != num_words:
-            print(i, len(word_boundaries), num_words)
-        assert len(word_boundaries) == num_words
-        assert (
-            tokens["source_aux"][i].count("_") + 1 - tokens["source"][i].count("_")
-            == num_words
-        ), "Number of words dont match! (line: %d, source: %d, aux: %d)\n%s\n%s" % (
-            i + 1,
-            num_words,
-            tokens["source_aux"][i].count("_") + 1,
-            " ".join(tokens["source"][i]),
-            " ".join(tokens["source_aux"][i]),
-        )
-
-        rnn_boundary = int(num_neurons / 2)
-        if not is_brnn:
-            rnn_boundary = num_neurons
-
-        prev_idx = 0
-
-        for word_idx, boundary in enumerate(word_boundaries):
-            # 0 - num_neurons/2: Forward
-            # num_neurons/2 - : Backward
-            new_activations[word_idx, :rnn_boundary] = activations[i][
-                boundary, :rnn_boundary
-            ]
-            if is_brnn:
-                new_activations[word_idx, rnn_boundary:] = activations[i][
-                    prev_idx, rnn_boundary:
-                ]
-            prev_idx = boundary + 1
-
-        all_activations.append(new_activations)
-
-    return all_activations
+    return _aggregate_activations(
+        tokens,
+        activations,
+        _get_char_word_boundaries,
+        lambda sentence_activations, starts, ends: _get_segment_last(
+            sentence_activations, ends, is_brnn
+        ),
+        num_workers=num_workers,
+        show_progress=True,
+    )
 
 
 def sent_get_last_activations(tokens, activations):
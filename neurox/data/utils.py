@@ -12,8 +12,8 @@ def _balance_negative_class(words, activations, positive_class_size):
     ----------
     words: list
         A list of words
-    activations: list
-        A list of word-wise activations
+    activations: list or numpy.ndarray
+        A list of word-wise activations, or a matrix with one row per word
     positive_class_size: number of words to select
 
     Returns
@@ -29,14 +29,16 @@ def _balance_negative_class(words, activations, positive_class_size):
         return words, activations
 
     print("Balancing Negative class ...")
-    indices = list(range((len(words))))
-    np.random.shuffle(indices)
+    # Keep the sampled instances in their original order
+    indices = np.sort(
+        np.random.choice(len(words), positive_class_size, replace=False)
+    ).tolist()
 
-    swords = []
-    sactivations = []
-    for i in range(positive_class_size):
-        swords.append(words[indices[i]])
-        sactivations.append(activations[indices[i]])
+    swords = [words[i] for i in indices]
+    if isinstance(activations, np.ndarray):
+        sactivations = activations[indices]
+    else:
+        sactivations = [activations[i] for i in indices]
 
     return swords, sactivations
 
@@ -49,6 +51,7 @@ def save_files(
     output_type="hdf5",
     decompose_layers=False,
     filter_layers=None,
+    batch_size=4096,
 ):
     """
     Save word and label files in the text format and activations in the specified format (default hdf5 format)
@@ -59,10 +62,17 @@ def save_files(
         A list of words
     labels: list
         A list of labels for every word
-    activations: list
-        A list of word-wise activations
+    activations: list or numpy.ndarray
+        A list of word-wise activations, each of size
+        [``NUM_LAYERS`` x ``1`` x ``EMBEDDING_SIZE``], or a single array
+        (numpy or torch) of size [``NUM_LAYERS`` x ``NUM_WORDS`` x
+        ``EMBEDDING_SIZE``]. Arrays are written in batches, which stores all
+        activations contiguously for hdf5 outputs.
     output_prefix: string
         Specify prefix of the output files
+    batch_size: int, optional
+        Number of words written at once if ``activations`` is a single array.
+        Defaults to 4096.
 
     Returns
     -------
@@ -85,7 +95,15 @@ def save_files(
         filter_layers=filter_layers,
     )
 
-    for word_idx, word in enumerate(words):
-        writer.write_activations(word_idx, [word], activations[word_idx])
+    if isinstance(activations, list):
+        for word_idx, word in enumerate(words):
+            writer.write_activations(word_idx, [word], activations[word_idx])
+    else:
+        for start_idx in range(0, len(words), batch_size):
+            writer.write_batch(
+                start_idx,
+                words[start_idx : start_idx + batch_size],
+                activations[:, start_idx : start_idx + batch_size, :],
+            )
 
     writer.close()
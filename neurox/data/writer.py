@@ -12,6 +12,15 @@ two file types are supported:
      sentence. The value of the dataset is a tensor with dimensions
      ``num_layers x sentence_length x embedding_size``, where ``embedding_size``
      may include multiple layers
+
+   Files written in batches (see ``ActivationsWriter.write_batch``) use a
+   contiguous layout instead, which avoids creating one dataset per sentence:
+
+   * ``activations`` dataset: A single tensor with dimensions
+     ``num_tokens x num_layers x embedding_size`` with the activations of all
+     sentences concatenated
+   * ``sentence_offsets`` dataset: Vector of size ``N+1``, where the tokens of
+     sentence ``i`` are at ``sentence_offsets[i]:sentence_offsets[i+1]``
 2. ``json``: This is a human-readable format. There is some loss of precision,
    since each activation value is saved using 8 decimal places. Concretely, this
    results in a jsonl file, where each line is a json string corresponding to a
@@ -37,6 +46,7 @@ import collections
 import json
 
 import h5py
+import numpy as np
 
 
 class ActivationsWriter:
@@ -85,6 +95,22 @@ class ActivationsWriter:
         """Method to write a single sentence's activations to file"""
         raise NotImplementedError("Use a specific writer or the `get_writer` method.")
 
+    def write_batch(self, start_idx, words, activations):
+        """
+        Method to write the activations of a batch of words to file, where
+        every word is saved as a sentence of its own. Word ``i`` of the batch
+        gets the sentence index ``start_idx + i``.
+
+        ``activations`` is expected to be of size
+        [``NUM_LAYERS`` x ``NUM_WORDS`` x ``EMBEDDING_SIZE``]. Writers that
+        support it store the whole batch at once, otherwise every word is
+        written with ``write_activations``.
+        """
+        for word_idx, word in enumerate(words):
+            self.write_activations(
+                start_idx + word_idx, [word], activations[:, [word_idx], :]
+            )
+
     def close(self):
         """Method to close the udnerlying files."""
         raise NotImplementedError("Use a specific writer or the `get_writer` method.")
@@ -193,6 +219,20 @@ class ActivationsWriterManager(ActivationsWriter):
                 sentence_idx, extracted_words, activations[self.layers, :, :]
             )
 
+    def write_batch(self, start_idx, words, activations):
+        if self.writers is None:
+            self.open(activations.shape[0])
+
+        if self.decompose_layers:
+            for writer_idx, layer_idx in enumerate(self.layers):
+                self.writers[writer_idx].write_batch(
+                    start_idx, words, activations[[layer_idx], :, :]
+                )
+        else:
+            self.writers[0].write_batch(
+                start_idx, words, activations[self.layers, :, :]
+            )
+
     def close(self):
         for writer in self.writers:
             writer.close()
@@ -210,10 +250,15 @@ class HDF5ActivationsWriter(ActivationsWriter):
     def open(self):
         self.activations_file = h5py.File(self.filename, "w")
         self.sentence_to_index = {}
+        self.sentence_offsets = None
 
     def write_activations(self, sentence_idx, extracted_words, activations):
         if self.activations_file is None:
             self.open()
+        if self.sentence_offsets is not None:
+            raise ValueError(
+                "Cannot write single sentences to a file written in batches."
+            )
         self.activations_file.create_dataset(
             str(sentence_idx), activations.shape, dtype=self.dtype, data=activations
         )
@@ -228,11 +273,49 @@ class HDF5ActivationsWriter(ActivationsWriter):
         sentence = final_sentence
         self.sentence_to_index[sentence] = str(sentence_idx)
 
+    def write_batch(self, start_idx, words, activations):
+        if self.activations_file is None:
+            self.open()
+        if self.sentence_to_index:
+            raise ValueError(
+                "Cannot write batches to a file written one sentence at a time."
+            )
+
+        # Token-major layout, so that every sentence is a contiguous block
+        activations = np.swapaxes(np.asarray(activations), 0, 1)
+        num_words = activations.shape[0]
+        if self.sentence_offsets is None:
+            self.activations_file.create_dataset(
+                "activations",
+                (0,) + activations.shape[1:],
+                maxshape=(None,) + activations.shape[1:],
+                dtype=self.dtype,
+                chunks=True,
+            )
+            self.sentence_offsets = [0]
+
+        num_written = len(self.sentence_offsets) - 1
+        if start_idx != num_written:
+            raise ValueError(
+                f"Batches must be written in order, expected start index {num_written} but got {start_idx}."
+            )
+
+        dataset = self.activations_file["activations"]
+        num_tokens = dataset.shape[0]
+        dataset.resize(num_tokens + num_words, axis=0)
+        dataset[num_tokens:] = activations
+        self.sentence_offsets.extend(range(num_tokens + 1, num_tokens + num_words + 1))
+
     def close(self):
-        sentence_index_dataset = self.activations_file.create_dataset(
-            "sentence_to_index", (1,), dtype=h5py.special_dtype(vlen=str)
-        )
-        sentence_index_dataset[0] = json.dumps(self.sentence_to_index)
+        if self.sentence_offsets is not None:
+            self.activations_file.create_dataset(
+                "sentence_offsets", data=np.array(self.sentence_offsets, dtype=np.int64)
+            )
+        else:
+            sentence_index_dataset = self.activations_file.create_dataset(
+                "sentence_to_index", (1,), dtype=h5py.special_dtype(vlen=str)
+            )
+            sentence_index_dataset[0] = json.dumps(self.sentence_to_index)
         self.activations_file.close()
 
 
@@ -249,29 +332,46 @@ class JSONActivationsWriter(ActivationsWriter):
     def open(self):
         self.activations_file = open(self.filename, "w", encoding="utf-8")
 
-    def write_activations(self, sentence_idx, extracted_words, activations):
-        if self.activations_file is None:
-            self.open()
+    @staticmethod
+    def _get_features(extracted_words, activations):
+        # Convert all values to python floats at once instead of per element
+        values = np.asarray(activations, dtype=np.float64).tolist()
 
-        output_json = collections.OrderedDict()
-        output_json["linex_index"] = sentence_idx
         all_out_features = []
-
         for word_idx, extracted_word in enumerate(extracted_words):
             all_layers = []
-            for layer_idx in range(activations.shape[0]):
+            for layer_idx in range(len(values)):
                 layers = collections.OrderedDict()
                 layers["index"] = layer_idx
-                layers["values"] = [
-                    round(x.item(), 8) for x in activations[layer_idx, word_idx, :]
-                ]
+                layers["values"] = [round(x, 8) for x in values[layer_idx][word_idx]]
                 all_layers.append(layers)
             out_features = collections.OrderedDict()
             out_features["token"] = extracted_word
             out_features["layers"] = all_layers
             all_out_features.append(out_features)
-        output_json["features"] = all_out_features
+        return all_out_features
+
+    def write_activations(self, sentence_idx, extracted_words, activations):
+        if self.activations_file is None:
+            self.open()
+
+        output_json = collections.OrderedDict()
+        output_json["linex_index"] = sentence_idx
+        output_json["features"] = self._get_features(extracted_words, activations)
         self.activations_file.write(json.dumps(output_json) + "\n")
 
+    def write_batch(self, start_idx, words, activations):
+        if self.activations_file is None:
+            self.open()
+
+        all_out_features = self._get_features(words, activations)
+        lines = []
+        for word_idx, out_features in enumerate(all_out_features):
+            output_json = collections.OrderedDict()
+            output_json["linex_index"] = start_idx + word_idx
+            output_json["features"] = [out_features]
+            lines.append(json.dumps(output_json) + "\n")
+        self.activations_file.write("".join(lines))
+
     def close(self):
         self.activations_file.close()
@@ -3,8 +3,12 @@
 This module provides a set of methods to ablate both layers and individual
 neurons from a given set.
 """
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
+from . import linear_probe
+
 
 def keep_specific_neurons(X, neuron_list):
     """
@@ -134,6 +138,45 @@ def zero_out_activations_remove_neurons(X, neurons_to_remove):
     return _X
 
 
+def create_neuron_masks(num_neurons, neuron_lists, mode="keep"):
+    """
+    Create boolean neuron masks for a set of ablation experiments.
+
+    The masks can be passed to
+    ``interpretation.linear_probe.evaluate_probe_with_masks`` to evaluate
+    several ablations in a single pass over the activations, without creating
+    a zeroed-out copy of ``X`` for every experiment.
+
+    Parameters
+    ----------
+    num_neurons : int
+        Total number of neurons in the activations
+    neuron_lists : list of lists
+        One list of neurons per experiment
+    mode : str, optional
+        If ``"keep"``, only the given neurons are active in a mask (same as
+        ``zero_out_activations_keep_neurons``). If ``"remove"``, the given
+        neurons are masked (same as ``zero_out_activations_remove_neurons``).
+        Defaults to ``"keep"``.
+
+    Returns
+    -------
+    masks : numpy.ndarray
+        Boolean Numpy Matrix of size [``len(neuron_lists)`` x ``NUM_NEURONS``],
+        which is True for every neuron that is not ablated
+
+    """
+    if mode not in ["keep", "remove"]:
+        raise ValueError("mode must be one of 'keep' or 'remove'")
+
+    keep = mode == "keep"
+    masks = np.full((len(neuron_lists), num_neurons), not keep, dtype=bool)
+    for mask, neurons in zip(masks, neuron_lists):
+        mask[np.asarray(neurons, dtype=np.int64)] = keep
+
+    return masks
+
+
 def filter_activations_by_layers(
     X, layers_to_keep, num_layers, bidirectional_filtering="none"
 ):
@@ -168,11 +211,18 @@ def filter_activations_by_layers(
     as follows: forward layer 0 neurons, backward layer 0 neurons, forward layer
     0 neurons ...
 
+    If the selected neurons form a single contiguous block (e.g. a single
+    layer, or several consecutive layers), the returned value is a view, so
+    modifying it will modify the original matrix. Otherwise, every contiguous
+    block of neurons is copied once. ``X`` can also be any object that supports
+    numpy-style slicing, such as a ``numpy.memmap`` or a ``h5py.Dataset``, in
+    which case only the selected neurons are read.
+
     """
     bidirectional_filtering = bidirectional_filtering.lower()
     assert bidirectional_filtering in ["none", "forward", "backward"]
 
-    neurons_to_keep = []
+    neuron_ranges = []
     for layer in layers_to_keep:
         if bidirectional_filtering == "none":
             num_neurons_per_layer = X.shape[1] // num_layers
@@ -187,7 +237,281 @@ def filter_activations_by_layers(
             start = layer * num_neurons_per_layer * 2 + num_neurons_per_layer
             end = start + num_neurons_per_layer
 
-        neurons_to_keep.append(list(range(start, end)))
-    neurons_to_keep = np.concatenate(neurons_to_keep)
+        neuron_ranges.append((start, end))
+
+    return _filter_activations_by_ranges(X, _merge_neuron_ranges(neuron_ranges))
+
+
+def _merge_neuron_ranges(neuron_ranges):
+    """
+    Merges ``(start, end)`` ranges of neurons that directly follow each other,
+    so that consecutive layers are selected as a single block.
+    """
+    merged_ranges = []
+    for start, end in neuron_ranges:
+        if merged_ranges and merged_ranges[-1][1] == start:
+            merged_ranges[-1] = (merged_ranges[-1][0], end)
+        else:
+            merged_ranges.append((start, end))
+    return merged_ranges
+
+
+def _filter_activations_by_ranges(X, neuron_ranges):
+    """
+    Selects the given ``(start, end)`` ranges of neurons from ``X``. A single
+    range is returned as a view, otherwise every range is copied once into a
+    preallocated matrix.
+    """
+    if len(neuron_ranges) == 1:
+        start, end = neuron_ranges[0]
+        return X[:, start:end]
+
+    num_neurons = sum(end - start for start, end in neuron_ranges)
+    filtered_X = np.empty((X.shape[0], num_neurons), dtype=X.dtype)
+    offset = 0
+    for start, end in neuron_ranges:
+        filtered_X[:, offset : offset + end - start] = X[:, start:end]
+        offset += end - start
+    return filtered_X
+
+
+# Training data of the worker processes of an ablation sweep. It is set once
+# per worker by the pool initializer instead of being sent with every task.
+_sweep_worker_data = {}
+
+
+def _init_sweep_worker(X_train, y_train, task_type, train_kwargs):
+    _sweep_worker_data["X_train"] = X_train
+    _sweep_worker_data["y_train"] = y_train
+    _sweep_worker_data["task_type"] = task_type
+    _sweep_worker_data["train_kwargs"] = train_kwargs
+
+
+def _train_sweep_probe(neurons):
+    X_train = filter_activations_keep_neurons(_sweep_worker_data["X_train"], neurons)
+    if _sweep_worker_data["task_type"] == "regression":
+        train_fn = linear_probe.train_linear_regression_probe
+    else:
+        train_fn = linear_probe.train_logistic_regression_probe
+    return train_fn(
+        X_train, _sweep_worker_data["y_train"], **_sweep_worker_data["train_kwargs"]
+    )
+
+
+def _get_sweep_experiments(ordering, sizes, num_neurons, selections, modes, seed):
+    """
+    Returns ``(selection, mode, size, neurons)`` tuples for every experiment of
+    a sweep, where ``neurons`` is the sorted list of neurons that are not
+    ablated.
+    """
+    ordering = np.asarray(ordering, dtype=np.int64)
+    all_neurons = np.arange(num_neurons)
+    rng = np.random.RandomState(seed)
+
+    experiments = []
+    for size in sizes:
+        if isinstance(size, (float, np.floating)):
+            if not 0 <= size <= 1:
+                raise ValueError("Percentages must be between 0 and 1")
+            count = int(round(size * num_neurons))
+        else:
+            count = int(size)
+        if not 0 <= count <= len(ordering):
+            raise ValueError(
+                "Cannot select %d neurons from an ordering of %d neurons"
+                % (count, len(ordering))
+            )
+
+        for selection in selections:
+            if selection == "top":
+                selected = ordering[:count]
+            elif selection == "bottom":
+                selected = ordering[len(ordering) - count :]
+            elif selection == "random":
+                selected = rng.choice(num_neurons, count, replace=False)
+            else:
+                raise ValueError("selection must be one of 'top', 'bottom' or 'random'")
+
+            for mode in modes:
+                if mode == "keep":
+                    neurons = np.sort(selected)
+                elif mode == "remove":
+                    neurons = np.setdiff1d(all_neurons, selected)
+                else:
+                    raise ValueError("mode must be one of 'keep' or 'remove'")
+                experiments.append((selection, mode, size, neurons))
+
+    return experiments
+
+
+def run_ablation_sweep(
+    ordering,
+    sizes,
+    X_test,
+    y_test,
+    probe=None,
+    X_train=None,
+    y_train=None,
+    retrain=False,
+    selections=("top", "bottom", "random"),
+    modes=("keep", "remove"),
+    task_type="classification",
+    idx_to_class=None,
+    metric="accuracy",
+    num_workers=1,
+    seed=None,
+    batch_size=4096,
+    train_kwargs=None,
+):
+    """
+    Evaluate a probe under a sweep of neuron ablations.
+
+    For every size in ``sizes``, the top, bottom and/or random neurons of the
+    given ordering are selected, and either only these neurons are kept or
+    these neurons are removed. Each experiment is evaluated
+
+    * with the given trained ``probe``, by zeroing out the ablated neurons. No
+      copies of ``X_test`` are made and all experiments are scored in a single
+      pass over the data (see
+      ``interpretation.linear_probe.evaluate_probe_with_masks``).
+    * if ``retrain`` is True, with a new probe trained on the remaining
+      neurons. The probes are trained in parallel across ``num_workers``
+      processes and then scored together in a single pass over the data (see
+      ``interpretation.linear_probe.evaluate_neuron_subset_probes``).
+
+    Parameters
+    ----------
+    ordering : list or numpy.ndarray
+        Neuron ordering in decreasing order of importance, e.g. the output of
+        ``interpretation.linear_probe.get_neuron_ordering`` or the
+        ``get_neuron_ordering`` method of ``interpretation.probeless``,
+        ``interpretation.iou_probe`` or ``interpretation.gaussian_probe``
+    sizes : list
+        Number of neurons to select for every experiment. Integers are treated
+        as counts, floats as the fraction of all neurons.
+    X_test : numpy.ndarray
+        Numpy Matrix of size [``NUM_TOKENS`` x ``NUM_NEURONS``] to evaluate on.
+        Usually the output of ``interpretation.utils.create_tensors``
+    y_test : numpy.ndarray
+        Numpy Vector of size [``NUM_TOKENS``] with the gold labels
+    probe : interpretation.linear_probe.LinearProbe, optional
+        Probe trained on all neurons. If provided, every experiment is
+        evaluated without retraining.
+    X_train : numpy.ndarray, optional
+        Training activations, required if ``retrain`` is True
+    y_train : numpy.ndarray, optional
+        Training labels, required if ``retrain`` is True
+    retrain : bool, optional
+        Whether to train a new probe for every experiment. Experiments that
+        keep no neurons cannot be retrained. Defaults to False.
+    selections : list of str, optional
+        Any of ``"top"``, ``"bottom"`` and ``"random"``. Defaults to all three.
+    modes : list of str, optional
+        Any of ``"keep"`` and ``"remove"``. Defaults to both.
+    task_type : str, optional
+        Either "classification" or "regression", used for retraining. Defaults
+        to "classification".
+    idx_to_class : dict, optional
+        Class index to name mapping. If provided, per-class scores are also
+        computed. Defaults to None.
+    metric : str, optional
+        Metric to use for evaluation scores. For supported metrics see
+        ``interpretation.metrics``
+    num_workers : int, optional
+        Number of processes to retrain probes with. Defaults to 1, which trains
+        all probes in the current process.
+    seed : int, optional
+        Seed for the selection of random neurons. Defaults to None.
+    batch_size : int, optional
+        Batch size for the evaluation. Defaults to 4096
+    train_kwargs : dict, optional
+        Additional arguments for
+        ``interpretation.linear_probe.train_logistic_regression_probe`` or
+        ``interpretation.linear_probe.train_linear_regression_probe``
+
+    Returns
+    -------
+    results : list of dicts
+        One dictionary per experiment with the keys ``selection``, ``mode``,
+        ``size``, ``neurons`` (the neurons that were not ablated),
+        ``retrained`` and ``scores``, where ``scores`` is in the same format as
+        returned by ``interpretation.linear_probe.evaluate_probe``
 
-    return filter_activations_keep_neurons(X, neurons_to_keep)
+    """
+    if probe is None and not retrain:
+        raise ValueError("Either a trained probe or retrain=True is required")
+    if retrain and (X_train is None or y_train is None):
+        raise ValueError("Retraining requires X_train and y_train")
+
+    experiments = _get_sweep_experiments(
+        ordering, sizes, X_test.shape[1], selections, modes, seed
+    )
+    neuron_lists = [neurons for _, _, _, neurons in experiments]
+    if retrain:
+        for selection, mode, size, neurons in experiments:
+            if len(neurons) == 0:
+                raise ValueError(
+                    "Cannot retrain a probe without neurons (selection: %s, mode:"
+                    " %s, size: %s)" % (selection, mode, size)
+                )
+
+    results = []
+    if probe is not None:
+        print("Evaluating %d ablations without retraining" % len(experiments))
+        masks = create_neuron_masks(X_test.shape[1], neuron_lists, mode="keep")
+        scores = linear_probe.evaluate_probe_with_masks(
+            probe,
+            X_test,
+            y_test,
+            masks,
+            idx_to_class=idx_to_class,
+            batch_size=batch_size,
+            metric=metric,
+        )
+        results.extend(
+            (experiment, False, experiment_scores)
+            for experiment, experiment_scores in zip(experiments, scores)
+        )
+
+    if retrain:
+        print("Retraining %d probes" % len(experiments))
+        initargs = (X_train, y_train, task_type, train_kwargs or {})
+        if num_workers > 1:
+            with ProcessPoolExecutor(
+                max_workers=num_workers,
+                initializer=_init_sweep_worker,
+                initargs=initargs,
+            ) as executor:
+                probes = list(executor.map(_train_sweep_probe, neuron_lists))
+        else:
+            _init_sweep_worker(*initargs)
+            try:
+                probes = [_train_sweep_probe(neurons) for neurons in neuron_lists]
+            finally:
+                _sweep_worker_data.clear()
+
+        scores = linear_probe.evaluate_neuron_subset_probes(
+            probes,
+            neuron_lists,
+            X_test,
+            y_test,
+            idx_to_class=idx_to_class,
+            batch_size=batch_size,
+            metric=metric,
+        )
+        results.extend(
+            (experiment, True, experiment_scores)
+            for experiment, experiment_scores in zip(experiments, scores)
+        )
+
+    return [
+        {
+            "selection": selection,
+            "mode": mode,
+            "size": size,
+            "neurons": neurons,
+            "retrained": retrained,
+            "scores": experiment_scores,
+        }
+        for (selection, mode, size, neurons), retrained, experiment_scores in results
+    ]
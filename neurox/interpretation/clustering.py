@@ -5,22 +5,292 @@ activations.
 """
 import numpy as np
 from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 from scipy.spatial.distance import pdist, squareform
 
 
+class CorrelationAccumulator:
+    """
+    Accumulates the statistics needed for neuron correlations over chunks of
+    activations.
+
+    The number of tokens, the mean activation of every neuron and the
+    co-moments (sums of centered cross products) of all pairs of neurons are
+    updated chunk by chunk in float64, using the pairwise update of Chan et
+    al., so that the data never has to be in memory at once. Accumulators
+    built on separate shards of the data (e.g. in different processes) can be
+    combined with ``merge``.
+
+    The accumulator can be passed instead of the activations to
+    ``create_correlation_clusters``, ``extract_independent_neurons`` and
+    ``scikit_extract_independent_neurons``.
+
+    Parameters
+    ----------
+    num_neurons : int, optional
+        Number of neurons. Inferred from the first chunk if not provided.
+
+    """
+
+    def __init__(self, num_neurons=None):
+        self.num_tokens = 0
+        self.means = None
+        self.comoments = None
+        if num_neurons is not None:
+            self._initialize(num_neurons)
+
+    def _initialize(self, num_neurons):
+        self.means = np.zeros(num_neurons, dtype=np.float64)
+        self.comoments = np.zeros((num_neurons, num_neurons), dtype=np.float64)
+
+    @property
+    def num_neurons(self):
+        return None if self.means is None else self.means.shape[0]
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """
+        Creates an accumulator from an iterable of activation chunks, each of
+        size [``NUM_CHUNK_TOKENS`` x ``NUM_NEURONS``], e.g. the per-sentence
+        activations returned by ``data.loader.load_activations``.
+        """
+        accumulator = cls()
+        for chunk in chunks:
+            accumulator.update(chunk)
+        return accumulator
+
+    def _combine(self, num_tokens, means, comoments):
+        if self.means is None:
+            self._initialize(means.shape[0])
+        if means.shape[0] != self.num_neurons:
+            raise ValueError(
+                "Expected %d neurons, got %d" % (self.num_neurons, means.shape[0])
+            )
+
+        total_tokens = self.num_tokens + num_tokens
+        delta = means - self.means
+        self.comoments += comoments
+        self.comoments += np.outer(delta, delta) * (
+            self.num_tokens * num_tokens / total_tokens
+        )
+        self.means += delta * (num_tokens / total_tokens)
+        self.num_tokens = total_tokens
+
+    def update(self, X):
+        """
+        Adds a chunk of activations of size [``NUM_CHUNK_TOKENS`` x
+        ``NUM_NEURONS``] to the statistics.
+
+        Returns
+        -------
+        accumulator : CorrelationAccumulator
+            The updated accumulator
+
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.shape[0] > 0:
+            means = X.mean(axis=0)
+            centered = X - means
+            self._combine(X.shape[0], means, centered.T @ centered)
+        return self
+
+    def merge(self, other):
+        """
+        Adds the statistics of another accumulator, e.g. one computed on a
+        different shard of the data.
+
+        Returns
+        -------
+        accumulator : CorrelationAccumulator
+            The updated accumulator
+
+        """
+        if other.num_tokens > 0:
+            self._combine(other.num_tokens, other.means, other.comoments)
+        return self
+
+    def covariance(self):
+        """
+        Returns the unbiased covariance matrix of size [``NUM_NEURONS`` x
+        ``NUM_NEURONS``].
+        """
+        return self.comoments / (self.num_tokens - 1)
+
+    def correlation(self):
+        """
+        Returns the correlation matrix of size [``NUM_NEURONS`` x
+        ``NUM_NEURONS``]. Correlations with constant neurons are set to 0.
+        """
+        norms = np.sqrt(np.diagonal(self.comoments))
+        scale = np.outer(norms, norms)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            correlations = self.comoments / scale
+        correlations[scale == 0] = 0
+        np.clip(correlations, -1, 1, out=correlations)
+        np.fill_diagonal(correlations, 1)
+        return correlations
+
+
+def _get_column_statistics(X, batch_size):
+    # Two passes over the tokens: means first, then centered sums of squares
+    num_tokens, num_neurons = X.shape
+    sums = np.zeros(num_neurons, dtype=np.float64)
+    for start in range(0, num_tokens, batch_size):
+        sums += X[start : start + batch_size].sum(axis=0, dtype=np.float64)
+    means = sums / num_tokens
+
+    squared_sums = np.zeros(num_neurons, dtype=np.float64)
+    for start in range(0, num_tokens, batch_size):
+        centered = X[start : start + batch_size] - means
+        squared_sums += np.square(centered).sum(axis=0)
+
+    return means, np.sqrt(squared_sums)
+
+
+def _get_correlation_rows(X, means, norms, rows, columns, batch_size):
+    """
+    Computes the correlations of the neurons in the slice ``rows`` with the
+    neurons in the slice ``columns`` in float32, accumulating the centered
+    cross products over batches of tokens. Correlations involving constant
+    neurons are set to 0.
+    """
+    cross_products = np.zeros(
+        (rows.stop - rows.start, columns.stop - columns.start), dtype=np.float32
+    )
+    for start in range(0, X.shape[0], batch_size):
+        batch = X[start : start + batch_size]
+        centered_rows = (batch[:, rows] - means[rows]).astype(np.float32)
+        centered_columns = (batch[:, columns] - means[columns]).astype(np.float32)
+        cross_products += centered_rows.T @ centered_columns
+
+    scale = np.outer(norms[rows], norms[columns]).astype(np.float32)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlations = cross_products / scale
+    correlations[scale == 0] = 0
+    return np.clip(correlations, -1, 1, out=correlations)
+
+
+def _get_correlation_rows_getter(X, batch_size):
+    """
+    Returns the number of neurons and a function that computes the
+    correlations of the neurons in the slice ``rows`` with the neurons in
+    the slice ``columns``, either from activations or from a
+    ``CorrelationAccumulator``.
+    """
+    if isinstance(X, CorrelationAccumulator):
+        correlations = X.correlation()
+        return X.num_neurons, lambda rows, columns: correlations[rows, columns].astype(
+            np.float32
+        )
+
+    means, norms = _get_column_statistics(X, batch_size)
+    return X.shape[1], lambda rows, columns: _get_correlation_rows(
+        X, means, norms, rows, columns, batch_size
+    )
+
+
+def _get_condensed_dissimilarities(X, use_abs_correlation, block_size, batch_size):
+    """
+    Computes the correlation based dissimilarities between all pairs of neurons
+    as a condensed distance vector (see ``scipy.spatial.distance.squareform``).
+    Only ``block_size`` rows of the correlation matrix are in memory at once.
+    The correlation blocks are float32, but the vector itself is float64
+    since ``scipy.cluster.hierarchy.linkage`` would convert it otherwise.
+    """
+    num_neurons, get_correlation_rows = _get_correlation_rows_getter(X, batch_size)
+
+    dissimilarities = np.empty(num_neurons * (num_neurons - 1) // 2, dtype=np.float64)
+    for row_start in range(0, num_neurons, block_size):
+        row_end = min(row_start + block_size, num_neurons)
+        correlations = get_correlation_rows(
+            slice(row_start, row_end), slice(row_start, num_neurons)
+        )
+        if use_abs_correlation:
+            np.abs(correlations, out=correlations)
+
+        for row in range(row_start, row_end):
+            # Entries for (row, row + 1), ..., (row, num_neurons - 1)
+            offset = num_neurons * row - row * (row + 1) // 2
+            dissimilarities[offset : offset + num_neurons - row - 1] = (
+                1 - correlations[row - row_start, row - row_start + 1 :]
+            )
+
+    return dissimilarities
+
+
+def _get_neighbor_clusters(
+    X, use_abs_correlation, clustering_threshold, num_neighbors, block_size, batch_size
+):
+    """
+    Approximate clustering using the ``num_neighbors`` most correlated
+    neurons of every neuron. Neurons are connected to their neighbors with
+    a dissimilarity below ``clustering_threshold``, and every connected
+    component forms a cluster (i.e. single linkage on the neighbor graph).
+    """
+    num_neurons, get_correlation_rows = _get_correlation_rows_getter(X, batch_size)
+    num_neighbors = min(num_neighbors, num_neurons - 1)
+
+    sources, targets = [], []
+    for row_start in range(0, num_neurons, block_size):
+        row_end = min(row_start + block_size, num_neurons)
+        rows = np.arange(row_start, row_end)
+        similarities = get_correlation_rows(
+            slice(row_start, row_end), slice(0, num_neurons)
+        )
+        if use_abs_correlation:
+            np.abs(similarities, out=similarities)
+        similarities[np.arange(rows.shape[0]), rows] = -np.inf
+
+        neighbors = np.argpartition(-similarities, num_neighbors - 1, axis=1)[
+            :, :num_neighbors
+        ]
+        neighbor_dissimilarities = 1 - np.take_along_axis(
+            similarities, neighbors, axis=1
+        )
+        is_edge = neighbor_dissimilarities <= clustering_threshold
+        sources.append(np.repeat(rows, num_neighbors)[is_edge.ravel()])
+        targets.append(neighbors[is_edge])
+
+    sources = np.concatenate(sources)
+    targets = np.concatenate(targets)
+    graph = csr_matrix(
+        (np.ones(sources.shape[0], dtype=np.int8), (sources, targets)),
+        shape=(num_neurons, num_neurons),
+    )
+    _, labels = connected_components(graph, directed=False)
+
+    # Cluster labels start from 1, similar to scipy's fcluster
+    return labels + 1
+
+
 def create_correlation_clusters(
-    X, use_abs_correlation=True, clustering_threshold=0.5, method="average"
+    X,
+    use_abs_correlation=True,
+    clustering_threshold=0.5,
+    method="average",
+    num_neighbors=None,
+    block_size=256,
+    batch_size=4096,
 ):
     """
     Create clusters based on neuron activation correlation. All neurons in the
     same cluster have "highly correlated" neurons that fire similarly on similar
     inputs.
 
+    Correlations are computed in float32 for ``block_size`` neurons at a time,
+    accumulating over batches of tokens, and are directly converted into the
+    (float64) condensed dissimilarity vector needed for hierarchical
+    clustering. The full ``NUM_NEURONS x NUM_NEURONS`` correlation matrix is
+    never created.
+
     Parameters
     ----------
-    X : numpy.ndarray
+    X : numpy.ndarray or interpretation.clustering.CorrelationAccumulator
         Matrix of size [ NUM_TOKENS x NUM_NEURONS]. Usually the output of
-        interpretation.utils.create_tensors
+        interpretation.utils.create_tensors. Alternatively, a
+        ``CorrelationAccumulator`` with statistics accumulated over chunks of
+        activations.
     use_abs_correlation : bool, optional
         Whether to use absolute correlation values. Two neurons that are correlated
         in the opposite direction may represent the same "knowledge" in a large
@@ -28,6 +298,23 @@ def create_correlation_clusters(
     clustering_threshold : float, optional
         Hyperparameter for clustering. This is used as the threshold to convert
         hierarchical clusters into flat clusters.
+    method : str, optional
+        Linkage method for hierarchical clustering. See
+        ``scipy.cluster.hierarchy.linkage`` for supported methods. Ignored if
+        ``num_neighbors`` is set. Defaults to "average".
+    num_neighbors : int, optional
+        If set, an approximate clustering is computed instead of the exact
+        hierarchical clustering: every neuron is linked to those of its
+        ``num_neighbors`` most correlated neurons whose dissimilarity is below
+        ``clustering_threshold``, and connected neurons form a cluster. This
+        needs memory linear in the number of neurons, and is meant for
+        neuron counts where the condensed dissimilarity matrix does not fit
+        in memory. Defaults to None, i.e. exact clustering.
+    block_size : int, optional
+        Number of neurons whose correlations are computed together. Defaults
+        to 256.
+    batch_size : int, optional
+        Number of tokens that are processed together. Defaults to 4096.
 
     Returns
     -------
@@ -35,26 +322,33 @@ def create_correlation_clusters(
         List of cluster labels for every neuron
 
     """
-    # Compute correlations
-    corr = np.corrcoef(X.T)
-    corr = np.nan_to_num(corr)
-    corr = (corr + corr.T) / 2
-    np.fill_diagonal(corr, 1)
-    print("Correlation matrix size (#neurons x #neurons):", corr.shape)
+    num_neurons = X.num_neurons if isinstance(X, CorrelationAccumulator) else X.shape[1]
+    print("Number of neurons to cluster:", num_neurons)
 
-    # Cluster based on correlations
-    if use_abs_correlation:
-        dissimilarity = 1 - np.abs(corr)
+    if num_neighbors is not None:
+        labels = _get_neighbor_clusters(
+            X,
+            use_abs_correlation,
+            clustering_threshold,
+            num_neighbors,
+            block_size,
+            batch_size,
+        )
     else:
-        dissimilarity = 1 - corr
-    hierarchy = linkage(squareform(dissimilarity), method=method)
-    labels = fcluster(hierarchy, clustering_threshold, criterion="distance")
+        # Cluster based on correlations
+        dissimilarity = _get_condensed_dissimilarities(
+            X, use_abs_correlation, block_size, batch_size
+        )
+        hierarchy = linkage(dissimilarity, method=method)
+        labels = fcluster(hierarchy, clustering_threshold, criterion="distance")
     print("Number of clusters detected: %d" % np.max(labels))
 
     return labels
 
 
-def extract_independent_neurons(X, use_abs_correlation=True, clustering_threshold=0.5):
+def extract_independent_neurons(
+    X, use_abs_correlation=True, clustering_threshold=0.5, num_neighbors=None
+):
     """
     Extract independent neurons from the given set of neurons.
 
@@ -68,9 +362,11 @@ def extract_independent_neurons(X, use_abs_correlation=True, clustering_threshol
 
     Parameters
     ----------
-    X : numpy.ndarray
+    X : numpy.ndarray or interpretation.clustering.CorrelationAccumulator
         Matrix of size [ NUM_TOKENS x NUM_NEURONS]. Usually the output of
-        interpretation.utils.create_tensors
+        interpretation.utils.create_tensors. Alternatively, a
+        ``CorrelationAccumulator`` with statistics accumulated over chunks of
+        activations.
     use_abs_correlation : bool, optional
         Whether to use absolute correlation values. Two neurons that are correlated
         in the opposite direction may represent the same "knowledge" in a large
@@ -78,6 +374,10 @@ def extract_independent_neurons(X, use_abs_correlation=True, clustering_threshol
     clustering_threshold : float, optional
         Hyperparameter for clustering. This is used as the threshold to convert
         hierarchical clusters into flat clusters.
+    num_neighbors : int, optional
+        If set, neurons are clustered approximately based on their
+        ``num_neighbors`` most correlated neurons. See
+        ``interpretation.clustering.create_correlation_clusters``.
 
     Returns
     -------
@@ -85,7 +385,9 @@ def extract_independent_neurons(X, use_abs_correlation=True, clustering_threshol
         List of non-redundant indepenent neurons
 
     """
-    clusters = create_correlation_clusters(X, use_abs_correlation, clustering_threshold)
+    clusters = create_correlation_clusters(
+        X, use_abs_correlation, clustering_threshold, num_neighbors=num_neighbors
+    )
 
     independent_neurons = []
 
@@ -123,9 +425,11 @@ def scikit_extract_independent_neurons(X, clustering_threshold=0.5):
 
     Parameters
     ----------
-    X : numpy.ndarray
+    X : numpy.ndarray or interpretation.clustering.CorrelationAccumulator
         Matrix of size [ NUM_TOKENS x NUM_NEURONS]. Usually the output of
-        interpretation.utils.create_tensors
+        interpretation.utils.create_tensors. Alternatively, a
+        ``CorrelationAccumulator`` with statistics accumulated over chunks of
+        activations.
     clustering_threshold : float, optional
         Hyperparameter for clustering. This is used as the threshold to convert
         hierarchical clusters into flat clusters.
@@ -138,7 +442,10 @@ def scikit_extract_independent_neurons(X, clustering_threshold=0.5):
         List of cluster labels for every neuron
 
     """
-    c = pdist(X.T, metric="correlation")
+    if isinstance(X, CorrelationAccumulator):
+        c = squareform(1 - X.correlation(), checks=False)
+    else:
+        c = pdist(X.T, metric="correlation")
     hi = linkage(c, method="average")
     clusters = fcluster(hi, clustering_threshold, criterion="distance")
 
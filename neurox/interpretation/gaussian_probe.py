@@ -13,8 +13,6 @@ import numpy as np
 
 import torch
 
-import torch.distributions.multivariate_normal as mn
-
 from . import metrics
 
 """
@@ -24,74 +22,96 @@ https://github.com/technion-cs-nlp/Individual-Neurons-Pitfalls/blob/main/Gaussia
 
 
 class GaussianProbe:
-    def __init__(self, X, y):
+    def __init__(self, X=None, y=None):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-        self.train_features = torch.tensor(X).to(self.device)
+        self.feature_sets = {}
+        self.label_sets = {}
+        self.categorical_sets = {}
 
+        if X is None:
+            # Statistics are provided later, see GaussianProbe.from_chunks
+            return
+
+        self.train_features = torch.tensor(X).to(self.device)
         self.train_labels = torch.tensor(y).to(self.device).long()
-        self.labels_dim = len(set(self.train_labels.tolist()))
 
-        # self._get_categorical()
-        self._get_mean_and_cov()
+        self._fit([(self.train_features, self.train_labels)])
 
-        self.feature_sets = {"train": self.train_features}
-        self.label_sets = {"train": self.train_labels}
-        self.categorical_sets = {}
-        self.train_categorical = self._get_categorical("train")
+        self.feature_sets["train"] = self.train_features
+        self.label_sets["train"] = self.train_labels
         self.categorical_sets["train"] = self.train_categorical
 
-    def _get_categorical(self, set_name):
-        counts = torch.histc(self.label_sets[set_name].float(), bins=self.labels_dim)
-        categorical = (counts / self.label_sets[set_name].size()[0]).to(self.device)
-        return categorical
-
-    def _get_mean_and_cov(self):
-        self.features_by_label = [
-            self.train_features[
-                (self.train_labels == label).nonzero(as_tuple=False)
-            ].squeeze(1)
-            for label in range(self.labels_dim)
-        ]
-        empirical_means = torch.stack(
-            [features.mean(dim=0) for features in self.features_by_label]
+    @classmethod
+    def from_chunks(cls, chunks):
+        """
+        Creates a probe from chunks of training data.
+
+        Only the per-class token counts, activation sums and sums of outer
+        products are accumulated over the chunks, so the memory needed for
+        training is independent of the number of tokens. The training data is
+        not kept in the probe.
+
+        Parameters
+        ----------
+        chunks : iterable of tuples
+            Iterable of ``(X, y)`` tuples, where ``X`` is a matrix of size
+            [``NUM_CHUNK_TOKENS`` x ``NUM_NEURONS``] and ``y`` a vector of size
+            [``NUM_CHUNK_TOKENS``] with 0-indexed class labels.
+
+        Returns
+        -------
+        probe : interpretation.gaussian_probe.GaussianProbe
+            Trained probe
+
+        """
+        probe = cls()
+        probe._fit(chunks)
+        probe.categorical_sets["train"] = probe.train_categorical
+        return probe
+
+    def _fit(self, chunks):
+        counts, sums, outer_sums, shift = _accumulate_statistics(chunks, self.device)
+        empty_labels = (counts == 0).nonzero(as_tuple=True)[0].tolist()
+        if empty_labels:
+            raise ValueError(
+                "Gaussian probe requires training data for every class, found no"
+                " instances of classes %s" % (empty_labels)
+            )
+
+        self.labels_dim = counts.shape[0]
+        self.train_categorical = (counts / counts.sum()).float()
+        self._get_mean_and_cov(counts, sums, outer_sums, shift)
+
+    def _get_mean_and_cov(self, counts, sums, outer_sums, shift):
+        num_features = sums.shape[1]
+        N_v = counts  # [label_dim]
+
+        # Statistics are accumulated on shifted activations to avoid
+        # cancellation errors, the covariances are shift invariant
+        shifted_means = sums / N_v.unsqueeze(1)
+        empirical_means = shift + shifted_means  # [label_dim,feature_dim]
+        S = outer_sums - N_v.view(-1, 1, 1) * (
+            shifted_means.unsqueeze(2) * shifted_means.unsqueeze(1)
         )
-        empirical_covs = [
-            torch.tensor(np.cov(features.cpu(), rowvar=False))
-            for features in self.features_by_label
-        ]
         mu_0 = empirical_means  # [label_dim,feature_dim]
 
-        lambda_0 = torch.stack(
-            [torch.diag(torch.diagonal(cov)) for cov in empirical_covs]
-        ).to(self.device)
-        v_0 = torch.tensor(self.train_features.shape[1] + 2).to(self.device)  # int
+        # Diagonal of the unbiased empirical covariances
+        lambda_0 = torch.diag_embed(
+            torch.diagonal(S, dim1=1, dim2=2) / (N_v - 1).unsqueeze(1)
+        )
+        v_0 = torch.tensor(num_features + 2).to(self.device)  # int
         k_0 = torch.tensor(0.01).to(self.device)
-        N_v = torch.tensor(
-            [features.shape[0] for features in self.features_by_label]
-        ).to(
-            self.device
-        )  # [label_dim]
         k_n = k_0 + N_v  # [label_dim]
         v_n = v_0 + N_v  # [label_dim]
         mu_n = (k_0 * mu_0 + N_v.unsqueeze(1) * empirical_means) / k_n.unsqueeze(
             1
         )  # [label_dim,feature_dim]
-        S = []
-        for label in range(self.labels_dim):
-            features_minus_mean = self.features_by_label[label] - empirical_means[label]
-            S.append(features_minus_mean.T @ features_minus_mean)
-        S = torch.stack(S).to(self.device)
         lambda_n = lambda_0 + S
         self.mu_star = mu_n
-        sigma_star = lambda_n / (v_n + self.train_features.shape[1] + 2).view(
-            self.labels_dim, 1, 1
-        )
-        min_eig = []
-        for sigma in sigma_star:
-            eigs = torch.eig(sigma).eigenvalues[:, 0]
-            min_eig.append(eigs.min())
-        min_eig = torch.tensor(min_eig).to(self.device)
+        sigma_star = lambda_n / (v_n + num_features + 2).view(self.labels_dim, 1, 1)
+        # sigma_star is symmetric, so its eigenvalues are real
+        min_eig = torch.linalg.eigvalsh(sigma_star).min(dim=1).values
         sigma_star[min_eig < 0] -= (
             min_eig.view(sigma_star.shape[0], 1, 1)[min_eig < 0]
             * torch.eye(sigma_star.shape[1]).to(self.device)
@@ -100,33 +120,59 @@ class GaussianProbe:
         self.sigma_star = sigma_star
 
     def _get_distributions(self, selected_features):
-        self.distributions = []
-        for label in range(self.labels_dim):
-            if self.train_categorical[label].item() == 0:
-                self.distributions.append(torch.distributions.normal.Normal(0.0, 0.0))
-            else:
-                self.distributions.append(
-                    mn.MultivariateNormal(
-                        self.mu_star[label, selected_features].double(),
-                        self.sigma_star[label, selected_features][:, selected_features],
-                    )
+        # Cache the Cholesky factors of the class covariances restricted to
+        # the selected features, they are reused until the selection changes
+        selection = tuple(int(feature) for feature in selected_features)
+        if getattr(self, "_selection", None) == selection:
+            return
+
+        active_labels = (self.train_categorical > 0).nonzero(as_tuple=True)[0]
+        selection_idx = torch.tensor(selection, dtype=torch.long, device=self.device)
+        sigma = self.sigma_star[active_labels][:, selection_idx][:, :, selection_idx]
+        cholesky = torch.linalg.cholesky(sigma.double())
+
+        self._selection = selection
+        self._selection_idx = selection_idx
+        self._active_labels = active_labels
+        self._means = self.mu_star[active_labels][:, selection_idx].double()
+        self._cholesky = cholesky
+        self._log_dets = 2 * torch.diagonal(cholesky, dim1=1, dim2=2).log().sum(dim=1)
+
+    def _compute_log_probs(self, features, selected_features, batch_size=4096):
+        # Joint log probability of every class and the given features. The
+        # Gaussian log likelihoods of all classes are computed with a single
+        # batched triangular solve per batch of tokens.
+        self._get_distributions(selected_features)
+        num_selected = len(self._selection)
+        log_2pi = np.log(2 * np.pi)
+
+        log_probs = torch.zeros(
+            (features.shape[0], self.labels_dim), dtype=torch.double, device=self.device
+        )
+        with torch.no_grad():
+            for start in range(0, features.shape[0], batch_size):
+                batch = features[start : start + batch_size, self._selection_idx]
+                # [C, B, k] differences to the class means
+                diffs = batch.double().unsqueeze(0) - self._means.unsqueeze(1)
+                whitened = torch.linalg.solve_triangular(
+                    self._cholesky, diffs.transpose(1, 2), upper=False
+                )
+                mahalanobis = whitened.square().sum(dim=1)  # [C, B]
+                log_likelihoods = -0.5 * (
+                    num_selected * log_2pi + self._log_dets.unsqueeze(1) + mahalanobis
                 )
+                log_probs[
+                    start : start + batch_size, self._active_labels
+                ] = log_likelihoods.T
+
+            return log_probs + self.train_categorical.log()
 
     def _compute_probs(self, selected_features, set_name):
-        features = self.feature_sets[set_name]
-        with torch.no_grad():
-            log_probs = []
-            for i in range(self.labels_dim):
-                if self.train_categorical[i] == 0:
-                    log_probs.append(torch.zeros(features.shape[0], dtype=torch.double))
-                else:
-                    log_probs.append(
-                        self.distributions[i].log_prob(features[:, selected_features])
-                    )
-            log_probs = torch.stack(log_probs, dim=1)
-            log_prob_times_cat = log_probs + self.train_categorical.log()
-            self.not_normalized_probs = log_prob_times_cat
-            self.normalizer = log_prob_times_cat.logsumexp(dim=1)
+        log_prob_times_cat = self._compute_log_probs(
+            self.feature_sets[set_name], selected_features
+        )
+        self.not_normalized_probs = log_prob_times_cat
+        self.normalizer = log_prob_times_cat.logsumexp(dim=1)
         self.probs = log_prob_times_cat - self.normalizer.unsqueeze(1)
 
     def _predict(self, set_name: str):
@@ -145,6 +191,58 @@ class GaussianProbe:
         return preds, labels, accuracy, mutual_inf.item(), (mutual_inf / entropy).item()
 
 
+def _accumulate_statistics(chunks, device):
+    """
+    Accumulates per-class token counts, activation sums and sums of outer
+    products (in float64) over chunks of ``(X, y)``. All sums are computed on
+    activations shifted by the mean of the first chunk.
+    """
+    counts, sums, outer_sums, shift = None, None, None, None
+    for X, y in chunks:
+        X = torch.as_tensor(X).to(device).double()
+        y = torch.as_tensor(y).to(device).long()
+        if X.shape[0] == 0:
+            continue
+
+        if shift is None:
+            shift = X.mean(dim=0)
+            num_features = X.shape[1]
+            counts = torch.zeros(0, dtype=torch.double, device=device)
+            sums = torch.zeros((0, num_features), dtype=torch.double, device=device)
+            outer_sums = torch.zeros(
+                (0, num_features, num_features), dtype=torch.double, device=device
+            )
+
+        num_labels = max(counts.shape[0], int(y.max()) + 1)
+        if num_labels > counts.shape[0]:
+            num_new_labels = num_labels - counts.shape[0]
+            counts = torch.cat((counts, counts.new_zeros(num_new_labels)))
+            sums = torch.cat((sums, sums.new_zeros((num_new_labels, num_features))))
+            outer_sums = torch.cat(
+                (
+                    outer_sums,
+                    outer_sums.new_zeros((num_new_labels, num_features, num_features)),
+                )
+            )
+
+        X = X - shift
+        counts += torch.bincount(y, minlength=num_labels).double()
+        sums.index_add_(0, y, X)
+        for label in y.unique().tolist():
+            label_features = X[y == label]
+            outer_sums[label] += label_features.T @ label_features
+
+    if shift is None:
+        raise ValueError("No training data provided")
+
+    return counts, sums, outer_sums, shift
+
+
+def _iterate_batches(X, y, batch_size):
+    for start in range(0, X.shape[0], batch_size):
+        yield X[start : start + batch_size], y[start : start + batch_size]
+
+
 def train_probe(X, y):
     """
     Train a Gaussian probe.
@@ -173,6 +271,31 @@ def train_probe(X, y):
     return GaussianProbe(X, y)
 
 
+def train_probe_streaming(chunks):
+    """
+    Train a Gaussian probe on chunks of data.
+
+    Same as ``train_probe``, but the training data is streamed. Only per-class
+    sufficient statistics are accumulated over the chunks in float64, so the
+    memory needed is of the order of ``NUM_CLASSES x NUM_NEURONS x
+    NUM_NEURONS`` regardless of the number of tokens.
+
+    Parameters
+    ----------
+    chunks : iterable of tuples
+        Iterable of ``(X, y)`` tuples, where ``X`` is a matrix of size
+        [``NUM_CHUNK_TOKENS`` x ``NUM_NEURONS``] and ``y`` a vector of size
+        [``NUM_CHUNK_TOKENS``] with 0-indexed class labels for every token.
+
+    Returns
+    -------
+    probe : interpretation.gaussian_probe.GaussianProbe
+        Trained probe for the given task.
+
+    """
+    return GaussianProbe.from_chunks(chunks)
+
+
 def evaluate_probe(
     probe,
     X_test,
@@ -180,6 +303,7 @@ def evaluate_probe(
     metric="accuracy",
     return_predictions=False,
     selected_neurons=None,
+    batch_size=4096,
 ):
     """
     Evaluates a trained probe.
@@ -208,6 +332,10 @@ def evaluate_probe(
     metrics : str, optional
         Metric to use for evaluation scores. For supported metrics see
         ``interpretation.metrics``
+    selected_neurons : list, optional
+        Neurons to evaluate the probe with. Defaults to all neurons.
+    batch_size : int, optional
+        Number of tokens that are evaluated together. Defaults to 4096.
     Returns
     -------
     scores : dict
@@ -219,22 +347,68 @@ def evaluate_probe(
         3-tuple for every input sample, representing
         ``(source_token, predicted_class, was_predicted_correctly)``
     """
-    if selected_neurons == None:
-        selected_neurons = list(np.arange(X_test.shape[1]))
-    probe.test_features = torch.tensor(X_test).to(probe.device)
+    return evaluate_probe_streaming(
+        probe,
+        _iterate_batches(X_test, y_test, batch_size),
+        metric=metric,
+        return_predictions=return_predictions,
+        selected_neurons=selected_neurons,
+    )
+
 
-    probe.test_labels = torch.tensor(y_test).to(probe.device).long()
-    probe.feature_sets["test"] = probe.test_features
-    probe.label_sets["test"] = probe.test_labels
+def evaluate_probe_streaming(
+    probe,
+    chunks,
+    metric="accuracy",
+    return_predictions=False,
+    selected_neurons=None,
+):
+    """
+    Evaluates a trained probe on chunks of data.
+
+    Same as ``evaluate_probe``, but the evaluation data is streamed, so only
+    one chunk of activations is held in memory at any time.
+
+    Parameters
+    ----------
+    probe : interpretation.gaussian_probe.GaussianProbe
+        Trained probe model
+    chunks : iterable of tuples
+        Iterable of ``(X, y)`` tuples, where ``X`` is a matrix of size
+        [``NUM_CHUNK_TOKENS`` x ``NUM_NEURONS``] and ``y`` a vector of size
+        [``NUM_CHUNK_TOKENS``] with 0-indexed class labels for every token.
+    metric : str, optional
+        Metric to use for evaluation scores. For supported metrics see
+        ``interpretation.metrics``
+    return_predictions : bool, optional
+        If set to True, actual predictions are also returned along with scores
+        for further use. Defaults to False.
+    selected_neurons : list, optional
+        Neurons to evaluate the probe with. Defaults to all neurons.
 
-    probe.test_categorical = probe._get_categorical("test")
+    Returns
+    -------
+    score : float
+        The overall score on the given data.
+    predictions : torch.Tensor, optional
+        If ``return_predictions`` is set to True, the predicted class for
+        every input token.
 
-    probe.categorical_sets["test"] = probe.test_categorical
+    """
+    if selected_neurons is None:
+        selected_neurons = list(range(probe.mu_star.shape[1]))
 
     probe._get_distributions(selected_neurons)
 
-    probe._compute_probs(selected_neurons, "test")
-    preds, labels, test_acc, test_mi, test_nmi = probe._predict("test")
+    preds, labels = [], []
+    for X, y in chunks:
+        features = torch.as_tensor(X).to(probe.device)
+        log_probs = probe._compute_log_probs(features, selected_neurons)
+        preds.append(log_probs.argmax(dim=1).cpu())
+        labels.append(torch.as_tensor(y).long().cpu())
+    preds = torch.cat(preds)
+    labels = torch.cat(labels)
+
     result = metrics.compute_score(preds, labels, metric)
 
     if return_predictions:
@@ -242,44 +416,183 @@ def evaluate_probe(
     return result
 
 
-def get_neuron_ordering(probe, num_of_neurons):
+def get_neuron_ordering(probe, num_of_neurons, batch_size=4096, chunks=None):
     """
     Get global ordering of neurons from a trained probe.
     This method returns the global ordering of neurons in a model based on
     the Gaussian Method.
 
+    Neurons are selected greedily: at every step, the neuron that maximizes the
+    mutual information between the (already selected + candidate) neurons and
+    the labels on the training data is added to the selection. Instead of
+    refitting the class distributions for every candidate, the Cholesky
+    factors of the per-class covariances of the selected neurons are extended
+    by one row per step, and all candidates are scored together from their
+    conditional means and variances given the selected neurons.
+
+    .. note::
+        Only the Cholesky factors (``NUM_CLASSES x num_of_neurons x
+        NUM_NEURONS`` values) are kept across steps. The residuals of every
+        batch of tokens are recomputed from the data at every step, so the
+        data is iterated once per selected neuron.
+
     Parameters
     ----------
     probe : interpretation.gaussian_probe.GaussianProbe
         Trained probe model
-    num_of_neurons: the number of neurons you want, the method requires a not too large number (<400)
+    num_of_neurons : int
+        Number of neurons to select
+    batch_size : int, optional
+        Number of tokens that are scored together. Temporary memory grows with
+        ``NUM_CLASSES x batch_size x NUM_NEURONS``. Defaults to 4096. Ignored
+        if ``chunks`` are given.
+    chunks : iterable of tuples or callable, optional
+        Re-iterable object (e.g. a list) of ``(X, y)`` tuples with the data to
+        select the neurons on, or a function without arguments that returns a
+        new iterable of such tuples, e.g. to stream the data from disk. The
+        data is iterated once per selected neuron, so one-shot iterators such
+        as generators are not supported. Required for probes trained with
+        ``train_probe_streaming``, defaults to the training data of the probe
+        otherwise.
+
     Returns
     -------
     neuron_ordering : list
-        Numpy array of size ``NUM_NEURONS`` with neurons in decreasing order
+        List of size ``num_of_neurons`` with neurons in decreasing order
         of importance.
 
     """
+    if chunks is None:
+        if not hasattr(probe, "train_features"):
+            raise ValueError(
+                "Probe was trained without keeping the training data, chunks of"
+                " data are required to select neurons"
+            )
+
+        def get_chunks():
+            return _iterate_batches(
+                probe.train_features, probe.train_labels, batch_size
+            )
+
+    elif callable(chunks):
+        get_chunks = chunks
+    else:
+        if iter(chunks) is chunks:
+            raise ValueError(
+                "chunks are iterated once per selected neuron, pass a"
+                " re-iterable object or a function that returns the chunks"
+                " instead of an iterator"
+            )
+
+        def get_chunks():
+            return chunks
+
+    device = probe.device
+    num_neurons = probe.mu_star.shape[1]
+    num_of_neurons = min(num_of_neurons, num_neurons)
+
+    # Classes without training tokens can never be predicted, so they are
+    # left out completely
+    active_labels = (probe.train_categorical > 0).nonzero(as_tuple=True)[0]
+    num_labels = active_labels.shape[0]
+    label_map = torch.full((probe.labels_dim,), -1, dtype=torch.long, device=device)
+    label_map[active_labels] = torch.arange(num_labels, device=device)
+    log_priors = probe.train_categorical[active_labels].double().log()
+
+    mu = probe.mu_star[active_labels].double()  # [C, N]
+    sigma = probe.sigma_star[active_labels].double()  # [C, N, N]
+
+    # cond_vars[c, m]: variance of neuron m given the selected neurons
+    # factors[c, :k, m]: L^-1 sigma[c, selected, m], where L is the Cholesky
+    # factor of sigma[c, selected][:, selected] with diagonal stds[c, :k]
+    cond_vars = torch.diagonal(sigma, dim1=1, dim2=2).clone()
+    min_vars = cond_vars * 1e-10
+    factors = torch.zeros(
+        (num_labels, num_of_neurons, num_neurons), dtype=torch.double, device=device
+    )
+    stds = torch.zeros((num_labels, num_of_neurons), dtype=torch.double, device=device)
+
+    log_2pi = np.log(2 * np.pi)
     selected_neurons = []
-    for num_of_neuron in range(0, num_of_neurons):
-        best_neuron = -1
-        best_acc = 0.0
-        best_mi, best_nmi = float("-inf"), float("-inf")
-
-        acc_on_best_mi = 0.0
-        mi_on_best_acc, nmi_on_best_acc = 0.0, 0.0
-        for neuron in range(probe.train_features.shape[1]):
-            if neuron in selected_neurons:
-                continue
-            probe._get_distributions(selected_neurons + [neuron])
-            probe._compute_probs(selected_neurons + [neuron], "train")
-            preds, labels, acc, mi, nmi = probe._predict("train")
-
-            if mi > best_mi:
-                best_mi = mi
-                best_nmi = nmi
-                best_neuron = neuron
-                acc_on_best_mi = acc
-
-        selected_neurons.append(best_neuron)
+    with torch.no_grad():
+        for step in range(num_of_neurons):
+            valid = (cond_vars > min_vars).all(dim=0)
+            safe_vars = torch.where(
+                cond_vars > min_vars, cond_vars, torch.ones_like(cond_vars)
+            )
+            log_vars = safe_vars.log()
+
+            # Cholesky factor of the selected neurons, and the log likelihood
+            # normalizer of the selected neurons for every class
+            cholesky = factors[:, :step, selected_neurons].transpose(1, 2)
+            cholesky.diagonal(dim1=1, dim2=2).copy_(stds[:, :step])
+            log_normalizers = log_priors - 0.5 * (
+                step * log_2pi + 2 * stds[:, :step].log().sum(dim=1)
+            )
+
+            scores = torch.zeros(num_neurons, dtype=torch.double, device=device)
+            candidate_terms = (log_2pi + log_vars).unsqueeze(1)  # [C, 1, N]
+            for X, y in get_chunks():
+                features = torch.as_tensor(X).to(device).double()
+                labels = label_map[torch.as_tensor(y).to(device).long()]
+
+                # Residuals of all neurons after regressing out the selected
+                # neurons, and the whitened selected neurons
+                residuals = features.unsqueeze(0) - mu.unsqueeze(1)  # [C, B, N]
+                log_likelihoods = log_normalizers.unsqueeze(1).expand(
+                    -1, features.shape[0]
+                )  # [C, B]
+                if step > 0:
+                    whitened = torch.linalg.solve_triangular(
+                        cholesky,
+                        residuals[:, :, selected_neurons].transpose(1, 2),
+                        upper=False,
+                    )  # [C, k, B]
+                    log_likelihoods = log_likelihoods - 0.5 * whitened.square().sum(
+                        dim=1
+                    )
+                    residuals.baddbmm_(
+                        whitened.transpose(1, 2), factors[:, :step], alpha=-1
+                    )
+
+                # Joint log probability of label and (selected + candidate)
+                # neurons for every class, token and candidate
+                joint = residuals.square_()
+                joint.div_(safe_vars.unsqueeze(1)).add_(candidate_terms).mul_(-0.5)
+                joint.add_(log_likelihoods.unsqueeze(2))
+
+                true_joint = joint.gather(
+                    0, labels.view(1, -1, 1).expand(1, -1, num_neurons)
+                ).squeeze(0)
+                scores += true_joint.sum(dim=0) - joint.logsumexp(dim=0).sum(dim=0)
+
+            # Sum of log posteriors of the true labels is a monotonic function
+            # of the mutual information on the training data
+            valid[selected_neurons] = False
+            valid &= ~torch.isnan(scores)
+            if valid.any():
+                scores[~valid] = float("-inf")
+                best_neuron = scores.argmax().item()
+            else:
+                best_neuron = next(
+                    n for n in range(num_neurons) if n not in selected_neurons
+                )
+
+            # Extend the Cholesky factors with the new neuron
+            std = safe_vars[:, best_neuron].sqrt()  # [C]
+            new_factor = (
+                sigma[:, best_neuron, :]
+                - torch.einsum(
+                    "ck,ckn->cn",
+                    factors[:, :step, best_neuron],
+                    factors[:, :step, :],
+                )
+            ) / std.unsqueeze(1)
+            factors[:, step, :] = new_factor
+            stds[:, step] = std
+            cond_vars -= new_factor**2
+            cond_vars[:, best_neuron] = 0
+
+            selected_neurons.append(best_neuron)
+
     return selected_neurons
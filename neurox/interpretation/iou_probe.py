@@ -6,24 +6,71 @@ This module implements the Intersection over Union method to rank neurons based
         Mu, J., & Andreas, J. (2020). Compositional explanations of neurons. Advances in Neural Information Processing Systems, 33, 17153-17163.
 
 """
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-from sklearn.metrics import average_precision_score
 
 
-def get_neuron_ordering(X_train, y_train, threshold=0.05):
+def _average_precision(X, y):
+    """
+    Computes the average precision of every column of ``X`` as a score for
+    the binary labels ``y``. Equivalent to calling
+    ``sklearn.metrics.average_precision_score(y, X[:, i])`` for every column
+    ``i``, but all columns are sorted at once.
+    """
+    num_tokens = X.shape[0]
+    num_positives = y.sum()
+    if num_positives == 0:
+        return np.zeros(X.shape[1])
+
+    order = np.argsort(-X, axis=0, kind="stable")
+    sorted_X = np.take_along_axis(X, order, axis=0)
+    sorted_y = y[order]
+
+    true_positives = np.cumsum(sorted_y, axis=0)
+    precision = true_positives / np.arange(1, num_tokens + 1).reshape(-1, 1)
+
+    # Tokens with the same activation value share a threshold, so all of them
+    # get the precision at the end of their group of ties
+    is_group_end = np.ones(X.shape, dtype=bool)
+    is_group_end[:-1] = sorted_X[:-1] != sorted_X[1:]
+    group_ends = np.where(
+        is_group_end, np.arange(num_tokens).reshape(-1, 1), num_tokens
+    )
+    group_ends = np.minimum.accumulate(group_ends[::-1], axis=0)[::-1]
+    precision = np.take_along_axis(precision, group_ends, axis=0)
+
+    return (precision * sorted_y).sum(axis=0) / num_positives
+
+
+def get_neuron_ordering(
+    X_train, y_train, threshold=0.05, block_size=128, num_workers=1
+):
     """
     Returns a list of top neurons w.r.t a tag e.g. noun
 
+    Neurons are ranked by the average precision of their activations as
+    scores for the positive class (label ``1``). The average precision is
+    computed for blocks of ``block_size`` neurons at once, and blocks can be
+    processed in parallel with ``num_workers`` threads.
+
     Parameters
     ----------
     X_train : numpy.ndarray
         Numpy Matrix of size [``NUM_TOKENS`` x ``NUM_NEURONS``]. Usually the
         output of ``interpretation.utils.create_tensors``
     y_train : numpy.ndarray
-        Numpy Vector of size [``NUM_TOKENS``] with class labels for each input
-        token. Usually the output of ``interpretation.utils.create_tensors``.
+        Numpy Vector of size [``NUM_TOKENS``] with binary class labels (0 or
+        1) for each input token. Usually the output of
+        ``interpretation.utils.create_tensors``.
     threshold : float
         The minimum absolute activation value below which the neuron is ignored for ranking purposes
+    block_size : int, optional
+        Number of neurons that are scored together. Larger blocks are faster
+        but need more memory. Defaults to 128.
+    num_workers : int, optional
+        Number of threads used to score blocks of neurons in parallel.
+        Defaults to 1.
 
     Returns
     -------
@@ -31,10 +78,27 @@ def get_neuron_ordering(X_train, y_train, threshold=0.05):
         list of ``NUM_NEURONS`` neuron indices, in decreasing order of importance.
 
     """
-    X_train[np.abs(X_train) < threshold] = 0
-    scores = []
-    for i in range(X_train.shape[1]):
-        scores.append(average_precision_score(y_train, X_train[:, i]))
-    scores = np.array(scores)
+    y = np.asarray(y_train)
+    if not np.isin(y, [0, 1]).all():
+        raise ValueError(
+            "IoU probe requires binary labels (0 or 1), found labels %s"
+            % (np.unique(y).tolist())
+        )
+    y = y == 1
+
+    def score_block(start):
+        # Thresholding is applied on a copy so that X_train is not modified
+        block = np.array(X_train[:, start : start + block_size], dtype=np.float64)
+        block[np.abs(block) < threshold] = 0
+        return _average_precision(block, y)
+
+    block_starts = range(0, X_train.shape[1], block_size)
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            scores = list(executor.map(score_block, block_starts))
+    else:
+        scores = [score_block(start) for start in block_starts]
+
+    scores = np.concatenate(scores)
     ranking = np.argsort(scores)[::-1]
     return ranking
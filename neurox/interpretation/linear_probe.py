@@ -6,6 +6,9 @@ both layer-wise and neuron-wise analysis.
 .. seealso::
         `Dalvi, Fahim, et al. "What is one grain of sand in the desert? analyzing individual neurons in deep nlp models." Proceedings of the AAAI Conference on Artificial Intelligence. Vol. 33. No. 01. 2019. <https://ojs.aaai.org/index.php/AAAI/article/view/4592>`_
 """
+import itertools
+import time
+
 import numpy as np
 import torch
 import torch.nn as nn
@@ -28,6 +31,57 @@ class LinearProbe(nn.Module):
         return out
 
 
+class LayerwiseLinearProbe(nn.Module):
+    """Torch model for a set of independent per-layer linear probes
+
+    The weights of all per-layer probes are stored as a single block-diagonal
+    set of parameters, so that one forward pass over the concatenated
+    activations computes the outputs of every layer's probe.
+    """
+
+    def __init__(self, num_layers, num_neurons_per_layer, num_classes):
+        """Initialize one linear model per layer"""
+        super(LayerwiseLinearProbe, self).__init__()
+        self.num_layers = num_layers
+        self.num_neurons_per_layer = num_neurons_per_layer
+        self.num_classes = num_classes
+
+        # Use the default initialization of a standard linear layer for every
+        # individual layer probe
+        layer_probes = [
+            nn.Linear(num_neurons_per_layer, num_classes) for _ in range(num_layers)
+        ]
+        self.weight = nn.Parameter(torch.stack([p.weight.data for p in layer_probes]))
+        self.bias = nn.Parameter(torch.stack([p.bias.data for p in layer_probes]))
+
+    def forward(self, x):
+        """Run a forward pass on all per-layer models
+
+        ``x`` is expected to be of size [``BATCH_SIZE`` x ``NUM_NEURONS``] and
+        the output is of size [``BATCH_SIZE`` x ``NUM_LAYERS`` x ``NUM_CLASSES``]
+        """
+        x = x.view(x.shape[0], self.num_layers, self.num_neurons_per_layer)
+        return torch.einsum("bln,lcn->blc", x, self.weight) + self.bias
+
+    def get_layer_probe(self, layer):
+        """Extract a standalone ``LinearProbe`` for the given layer"""
+        probe = LinearProbe(self.num_neurons_per_layer, self.num_classes)
+        probe.linear.weight.data.copy_(self.weight.data[layer])
+        probe.linear.bias.data.copy_(self.bias.data[layer])
+        return probe
+
+    @classmethod
+    def from_layer_probes(cls, layer_probes):
+        """Combine a list of per-layer ``LinearProbe`` models"""
+        weights = [list(p.parameters())[0].data.cpu().float() for p in layer_probes]
+        biases = [list(p.parameters())[1].data.cpu().float() for p in layer_probes]
+        num_classes, num_neurons_per_layer = weights[0].shape
+        probe = cls(len(layer_probes), num_neurons_per_layer, num_classes)
+        probe.weight.data.copy_(torch.stack(weights))
+        probe.bias.data.copy_(torch.stack(biases))
+        return probe
+
+
 ################################# Regularizers #################################
 def l1_penalty(var):
     """
@@ -84,6 +138,12 @@ def _train_probe(
     num_epochs=10,
     batch_size=32,
     learning_rate=0.001,
+    X_dev=None,
+    y_dev=None,
+    metric=None,
+    patience=None,
+    lr_scheduler=None,
+    epoch_callback=None,
 ):
     """
     Internal helper method to train a linear probe.
@@ -122,6 +182,36 @@ def _train_probe(
         Batch size for the input to the linear model. Defaults to 32
     learning_rate : float, optional
         Learning rate for optimizing the linear model.
+    X_dev : numpy.ndarray, optional
+        Numpy Matrix of size [``NUM_DEV_TOKENS`` x ``NUM_NEURONS``] used for
+        validation after every epoch. If provided along with ``y_dev``, the
+        probe from the epoch with the best validation score is returned.
+        Defaults to None, i.e. no validation.
+    y_dev : numpy.ndarray, optional
+        Numpy Vector of size [``NUM_DEV_TOKENS``] with the labels for
+        ``X_dev``.
+    metric : str, optional
+        Metric to use for validation scores. For supported metrics see
+        ``interpretation.metrics``. Higher scores are considered better.
+        Defaults to "accuracy" for classification and "pearson" for regression.
+    patience : int, optional
+        Number of epochs without an improvement in the validation score after
+        which training is stopped early. Requires ``X_dev`` and ``y_dev``.
+        Defaults to None, i.e. all ``num_epochs`` are run.
+    lr_scheduler : function, optional
+        Function that takes the optimizer and returns a
+        ``torch.optim.lr_scheduler`` instance, e.g.
+        ``lambda opt: torch.optim.lr_scheduler.StepLR(opt, step_size=2)``.
+        The scheduler is stepped after every epoch.
+        ``torch.optim.lr_scheduler.ReduceLROnPlateau`` schedulers are stepped
+        with the validation score, so they should be created with
+        ``mode="max"``. Defaults to None, i.e. a constant learning rate.
+    epoch_callback : function, optional
+        Function that is called after every epoch with a dictionary containing
+        the ``epoch`` (1-indexed), the average ``loss``, the ``num_tokens``
+        seen, the training throughput in ``tokens_per_second``, the current
+        ``learning_rate`` and the validation ``score`` (None without
+        validation data). If the callback returns True, training is stopped.
 
     Returns
     -------
@@ -137,6 +227,14 @@ def _train_probe(
     if lambda_l1 is None or lambda_l2 is None:
         raise ValueError("Regularization weights cannot be None")
 
+    if (X_dev is None) != (y_dev is None):
+        raise ValueError("Validation requires both X_dev and y_dev")
+    use_validation = X_dev is not None
+    if patience is not None and not use_validation:
+        raise ValueError("Early stopping requires validation data")
+    if metric is None:
+        metric = "pearson" if task_type == "regression" else "accuracy"
+
     print("Creating model...")
     if task_type == "classification":
         num_classes = len(set(y_train))
@@ -162,13 +260,19 @@ def _train_probe(
         raise ValueError("Invalid `task_type`")
 
     optimizer = torch.optim.Adam(probe.parameters(), lr=learning_rate)
+    scheduler = lr_scheduler(optimizer) if lr_scheduler is not None else None
 
     X_tensor = torch.from_numpy(X_train)
     y_tensor = torch.from_numpy(y_train)
 
+    best_score = None
+    best_state = None
+    num_epochs_without_improvement = 0
+
     for epoch in range(num_epochs):
         num_tokens = 0
         avg_loss = 0
+        epoch_start_time = time.perf_counter()
         for inputs, labels in progressbar(
             utils.batch_generator(X_tensor, y_tensor, batch_size=batch_size),
             desc="epoch [%d/%d]" % (epoch + 1, num_epochs),
@@ -197,12 +301,69 @@ def _train_probe(
             optimizer.step()
 
             avg_loss += loss.item()
+        epoch_time = time.perf_counter() - epoch_start_time
 
         print(
             "Epoch: [%d/%d], Loss: %.4f"
             % (epoch + 1, num_epochs, avg_loss / num_tokens)
         )
 
+        score = None
+        if use_validation:
+            score = metrics.compute_score(
+                _predict(probe, X_dev, batch_size=max(batch_size, 4096)),
+                y_dev,
+                metric,
+            )
+            print("Validation score (%s): %0.4f" % (metric, score))
+
+            if best_score is None or score > best_score:
+                best_score = score
+                best_state = {
+                    k: v.detach().clone() for k, v in probe.state_dict().items()
+                }
+                num_epochs_without_improvement = 0
+            else:
+                num_epochs_without_improvement += 1
+
+        learning_rate = optimizer.param_groups[0]["lr"]
+        if scheduler is not None:
+            if isinstance(scheduler, torch.optim.lr_scheduler.ReduceLROnPlateau):
+                if score is None:
+                    raise ValueError(
+                        "ReduceLROnPlateau scheduling requires validation data"
+                    )
+                scheduler.step(score)
+            else:
+                scheduler.step()
+
+        stop_training = False
+        if epoch_callback is not None:
+            stop_training = epoch_callback(
+                {
+                    "epoch": epoch + 1,
+                    "loss": avg_loss / num_tokens,
+                    "num_tokens": num_tokens,
+                    "tokens_per_second": num_tokens / max(epoch_time, 1e-9),
+                    "learning_rate": learning_rate,
+                    "score": score,
+                }
+            )
+
+        if patience is not None and num_epochs_without_improvement >= patience:
+            print(
+                "Stopping early after %d epochs without improvement"
+                % (num_epochs_without_improvement)
+            )
+            break
+        if stop_training:
+            print("Stopping early as requested by the epoch callback")
+            break
+
+    if best_state is not None:
+        print("Using probe with best validation score: %0.4f" % (best_score))
+        probe.load_state_dict(best_state)
+
     return probe
 
 
@@ -214,6 +375,12 @@ def train_logistic_regression_probe(
     num_epochs=10,
     batch_size=32,
     learning_rate=0.001,
+    X_dev=None,
+    y_dev=None,
+    metric=None,
+    patience=None,
+    lr_scheduler=None,
+    epoch_callback=None,
 ):
     """
     Train a logistic regression probe.
@@ -248,6 +415,36 @@ def train_logistic_regression_probe(
         Batch size for the input to the linear model. Defaults to 32
     learning_rate : float, optional
         Learning rate for optimizing the linear model.
+    X_dev : numpy.ndarray, optional
+        Numpy Matrix of size [``NUM_DEV_TOKENS`` x ``NUM_NEURONS``] used for
+        validation after every epoch. If provided along with ``y_dev``, the
+        probe from the epoch with the best validation score is returned.
+        Defaults to None, i.e. no validation.
+    y_dev : numpy.ndarray, optional
+        Numpy Vector of size [``NUM_DEV_TOKENS``] with the labels for
+        ``X_dev``.
+    metric : str, optional
+        Metric to use for validation scores. For supported metrics see
+        ``interpretation.metrics``. Higher scores are considered better.
+        Defaults to "accuracy" for classification and "pearson" for regression.
+    patience : int, optional
+        Number of epochs without an improvement in the validation score after
+        which training is stopped early. Requires ``X_dev`` and ``y_dev``.
+        Defaults to None, i.e. all ``num_epochs`` are run.
+    lr_scheduler : function, optional
+        Function that takes the optimizer and returns a
+        ``torch.optim.lr_scheduler`` instance, e.g.
+        ``lambda opt: torch.optim.lr_scheduler.StepLR(opt, step_size=2)``.
+        The scheduler is stepped after every epoch.
+        ``torch.optim.lr_scheduler.ReduceLROnPlateau`` schedulers are stepped
+        with the validation score, so they should be created with
+        ``mode="max"``. Defaults to None, i.e. a constant learning rate.
+    epoch_callback : function, optional
+        Function that is called after every epoch with a dictionary containing
+        the ``epoch`` (1-indexed), the average ``loss``, the ``num_tokens``
+        seen, the training throughput in ``tokens_per_second``, the current
+        ``learning_rate`` and the validation ``score`` (None without
+        validation data). If the callback returns True, training is stopped.
 
     Returns
     -------
@@ -264,6 +461,12 @@ def train_logistic_regression_probe(
         num_epochs=num_epochs,
         batch_size=batch_size,
         learning_rate=learning_rate,
+        X_dev=X_dev,
+        y_dev=y_dev,
+        metric=metric,
+        patience=patience,
+        lr_scheduler=lr_scheduler,
+        epoch_callback=epoch_callback,
     )
 
 
@@ -275,6 +478,12 @@ def train_linear_regression_probe(
     num_epochs=10,
     batch_size=32,
     learning_rate=0.001,
+    X_dev=None,
+    y_dev=None,
+    metric=None,
+    patience=None,
+    lr_scheduler=None,
+    epoch_callback=None,
 ):
     """
     Train a linear regression probe.
@@ -307,6 +516,36 @@ def train_linear_regression_probe(
         Batch size for the input to the linear model. Defaults to 32
     learning_rate : float, optional
         Learning rate for optimizing the linear model.
+    X_dev : numpy.ndarray, optional
+        Numpy Matrix of size [``NUM_DEV_TOKENS`` x ``NUM_NEURONS``] used for
+        validation after every epoch. If provided along with ``y_dev``, the
+        probe from the epoch with the best validation score is returned.
+        Defaults to None, i.e. no validation.
+    y_dev : numpy.ndarray, optional
+        Numpy Vector of size [``NUM_DEV_TOKENS``] with the labels for
+        ``X_dev``.
+    metric : str, optional
+        Metric to use for validation scores. For supported metrics see
+        ``interpretation.metrics``. Higher scores are considered better.
+        Defaults to "accuracy" for classification and "pearson" for regression.
+    patience : int, optional
+        Number of epochs without an improvement in the validation score after
+        which training is stopped early. Requires ``X_dev`` and ``y_dev``.
+        Defaults to None, i.e. all ``num_epochs`` are run.
+    lr_scheduler : function, optional
+        Function that takes the optimizer and returns a
+        ``torch.optim.lr_scheduler`` instance, e.g.
+        ``lambda opt: torch.optim.lr_scheduler.StepLR(opt, step_size=2)``.
+        The scheduler is stepped after every epoch.
+        ``torch.optim.lr_scheduler.ReduceLROnPlateau`` schedulers are stepped
+        with the validation score, so they should be created with
+        ``mode="max"``. Defaults to None, i.e. a constant learning rate.
+    epoch_callback : function, optional
+        Function that is called after every epoch with a dictionary containing
+        the ``epoch`` (1-indexed), the average ``loss``, the ``num_tokens``
+        seen, the training throughput in ``tokens_per_second``, the current
+        ``learning_rate`` and the validation ``score`` (None without
+        validation data). If the callback returns True, training is stopped.
 
     Returns
     -------
@@ -323,9 +562,166 @@ def train_linear_regression_probe(
         num_epochs=num_epochs,
         batch_size=batch_size,
         learning_rate=learning_rate,
+        X_dev=X_dev,
+        y_dev=y_dev,
+        metric=metric,
+        patience=patience,
+        lr_scheduler=lr_scheduler,
+        epoch_callback=epoch_callback,
     )
 
 
+def train_layerwise_probes(
+    X_train,
+    y_train,
+    num_layers,
+    task_type="classification",
+    lambda_l1=0,
+    lambda_l2=0,
+    num_epochs=10,
+    batch_size=32,
+    learning_rate=0.001,
+):
+    """
+    Train one linear probe per layer in a single pass over the data.
+
+    This method is equivalent to filtering ``X_train`` for every layer using
+    ``interpretation.ablation.filter_activations_by_layers`` and training a
+    separate probe on each filtered matrix, but every mini-batch is shared
+    across all per-layer probes and no copies of ``X_train`` are made. Since
+    the per-layer probes share no parameters and Adam updates every parameter
+    independently, each probe is optimized exactly as if it was trained on its
+    own.
+
+    Parameters
+    ----------
+    X_train : numpy.ndarray
+        Numpy Matrix of size [``NUM_TOKENS`` x ``NUM_NEURONS``]. Usually the
+        output of ``interpretation.utils.create_tensors``. The neurons of all
+        layers are expected to be concatenated in order, with the same number of
+        neurons in every layer.
+    y_train : numpy.ndarray
+        Numpy Vector of size [``NUM_TOKENS``] with class labels for each input
+        token. For classification, 0-indexed class labels for each input token
+        are expected. For regression, a real value per input token is expected.
+        Usually the output of ``interpretation.utils.create_tensors``.
+    num_layers : int
+        Total number of layers in ``X_train``.
+    task_type : str, optional
+        Either "classification" or "regression", indicate the kind of task that
+        is being probed. Defaults to "classification".
+    lambda_l1 : float, optional
+        L1 Penalty weight in the overall loss. Defaults to 0, i.e. no L1
+        regularization
+    lambda_l2 : float, optional
+        L2 Penalty weight in the overall loss. Defaults to 0, i.e. no L2
+        regularization
+    num_epochs : int, optional
+        Number of epochs to train the linear models for. Defaults to 10
+    batch_size : int, optional
+        Batch size for the input to the linear models. Defaults to 32
+    learning_rate : float, optional
+        Learning rate for optimizing the linear models.
+
+    Returns
+    -------
+    probes : list of interpretation.linear_probe.LinearProbe
+        List of ``num_layers`` trained probes, one per layer. Each probe can be
+        used with ``interpretation.linear_probe.evaluate_probe`` along with the
+        activations of its layer.
+
+    """
+    progressbar = utils.get_progress_bar()
+    print("Training %d layer-wise %s probes" % (num_layers, task_type))
+    # Check if we can use GPU's for training
+    use_gpu = torch.cuda.is_available()
+
+    if lambda_l1 is None or lambda_l2 is None:
+        raise ValueError("Regularization weights cannot be None")
+
+    if X_train.shape[1] % num_layers != 0:
+        raise ValueError(
+            "Number of neurons (%d) is not divisible by the number of layers (%d)"
+            % (X_train.shape[1], num_layers)
+        )
+    num_neurons_per_layer = X_train.shape[1] // num_layers
+
+    print("Creating model...")
+    if task_type == "classification":
+        num_classes = len(set(y_train))
+        if num_classes <= 1:
+            raise ValueError(
+                "Classification problem must have more than one target class"
+            )
+    else:
+        num_classes = 1
+    print("Number of training instances:", X_train.shape[0])
+    if task_type == "classification":
+        print("Number of classes:", num_classes)
+
+    probe = LayerwiseLinearProbe(num_layers, num_neurons_per_layer, num_classes)
+    if use_gpu:
+        probe = probe.cuda()
+
+    if task_type == "classification":
+        criterion = nn.CrossEntropyLoss()
+    elif task_type == "regression":
+        criterion = nn.MSELoss()
+    else:
+        raise ValueError("Invalid `task_type`")
+
+    optimizer = torch.optim.Adam(probe.parameters(), lr=learning_rate)
+
+    X_tensor = torch.from_numpy(X_train)
+    y_tensor = torch.from_numpy(y_train)
+
+    for epoch in range(num_epochs):
+        num_tokens = 0
+        avg_loss = 0
+        for inputs, labels in progressbar(
+            utils.batch_generator(X_tensor, y_tensor, batch_size=batch_size),
+            desc="epoch [%d/%d]" % (epoch + 1, num_epochs),
+        ):
+            num_tokens += inputs.shape[0]
+            if use_gpu:
+                inputs = inputs.cuda()
+                labels = labels.cuda()
+            inputs = inputs.float()
+
+            optimizer.zero_grad()
+
+            # [batch_size x num_layers x num_classes]
+            outputs = probe(inputs)
+            # Compare every layer's output with the same labels. The loss of
+            # each layer is a mean over the batch, and the layer losses are
+            # summed so that every probe receives its own unscaled gradient
+            if task_type == "regression":
+                outputs = outputs.squeeze(2)
+                layer_labels = labels.unsqueeze(1).expand(-1, num_layers).float()
+            else:
+                outputs = outputs.permute(0, 2, 1)
+                layer_labels = labels.unsqueeze(1).expand(-1, num_layers)
+            loss = criterion(outputs, layer_labels) * num_layers
+            for layer_weights in probe.weight:
+                loss = (
+                    loss
+                    + lambda_l1 * l1_penalty(layer_weights)
+                    + lambda_l2 * l2_penalty(layer_weights)
+                )
+            loss.backward()
+            optimizer.step()
+
+            avg_loss += loss.item()
+
+        print(
+            "Epoch: [%d/%d], Loss: %.4f"
+            % (epoch + 1, num_epochs, avg_loss / num_tokens)
+        )
+
+    probe = probe.cpu()
+    return [probe.get_layer_probe(layer) for layer in range(num_layers)]
+
+
 def evaluate_probe(
     probe,
     X,
@@ -333,7 +729,7 @@ def evaluate_probe(
     idx_to_class=None,
     return_predictions=False,
     source_tokens=None,
-    batch_size=32,
+    batch_size=4096,
     metric="accuracy",
 ):
     """
@@ -372,7 +768,7 @@ def evaluate_probe(
         ``return_predictions`` is True, each prediction will be paired with its
         original token. Defaults to None.
     batch_size : int, optional
-        Batch size for the input to the model. Defaults to 32
+        Batch size for the input to the model. Defaults to 4096
     metrics : str, optional
         Metric to use for evaluation scores. For supported metrics see
         ``interpretation.metrics``
@@ -389,8 +785,6 @@ def evaluate_probe(
         ``(source_token, predicted_class, was_predicted_correctly)``
 
     """
-    progressbar = utils.get_progress_bar()
-
     # Check if we can use GPU's for evaluation
     use_gpu = torch.cuda.is_available()
 
@@ -400,90 +794,477 @@ def evaluate_probe(
     # always evaluate in full precision
     probe = probe.float()
 
-    # Test the Model
-    y_pred = []
+    y_pred = _predict(probe, X, batch_size=batch_size)
 
-    def source_generator():
-        for s in source_tokens:
-            for t in s:
-                yield t
+    class_scores = _compute_class_scores(y_pred, y, idx_to_class, metric)
 
-    src_words = source_generator()
+    print("Score (%s) of the probe: %0.2f" % (metric, class_scores["__OVERALL__"]))
 
     if return_predictions:
-        predictions = []
-        src_word = -1
-
-    for inputs, labels in progressbar(
-        utils.batch_generator(
-            torch.from_numpy(X), torch.from_numpy(y), batch_size=batch_size
-        ),
-        desc="Evaluating",
-    ):
-        if use_gpu:
-            inputs = inputs.cuda()
-            labels = labels.cuda()
-
-        # always evaluate in full precision
-        inputs = inputs.float()
-
-        inputs = Variable(inputs)
-        labels = Variable(labels)
-
-        outputs = probe(inputs)
-
-        if outputs.data.shape[1] == 1:
-            # Regression
-            predicted = outputs.data
+        if source_tokens:
+            src_words = itertools.islice(
+                itertools.chain.from_iterable(source_tokens), y_pred.shape[0]
+            )
+        else:
+            src_words = range(y_pred.shape[0])
+
+        if idx_to_class:
+            keys = [idx_to_class[idx] for idx in y_pred.tolist()]
         else:
-            # Classification
-            _, predicted = torch.max(outputs.data, 1)
-        predicted = predicted.cpu().numpy()
-
-        for i in range(0, len(predicted)):
-            idx = predicted[i]
-            if idx_to_class:
-                key = idx_to_class[idx]
+            keys = y_pred.tolist()
+
+        predictions = list(zip(src_words, keys, (y_pred == y).tolist()))
+        return class_scores, predictions
+    return class_scores
+
+
+def _predict(probe, X, batch_size=4096):
+    """
+    Internal helper method to compute the predictions of a probe.
+
+    ``X`` is converted to full precision in batches, and the predictions are
+    written into a single preallocated array.
+
+    Parameters
+    ----------
+    probe : interpretation.linear_probe.LinearProbe
+        Trained probe model. The inputs are moved to the device of the probe.
+    X : numpy.ndarray
+        Numpy Matrix of size [``NUM_TOKENS`` x ``NUM_NEURONS``]
+    batch_size : int, optional
+        Batch size for the input to the model. Defaults to 4096
+
+    Returns
+    -------
+    y_pred : numpy.ndarray
+        Numpy Vector of size [``NUM_TOKENS``] with the predicted class indices
+        for classification probes and predicted values for regression probes
+
+    """
+    progressbar = utils.get_progress_bar()
+
+    weights = list(probe.parameters())[0]
+    device = weights.device
+    is_regression = weights.shape[0] == 1
+
+    y_pred = np.empty((X.shape[0],), dtype=np.float32 if is_regression else np.int64)
+
+    with torch.no_grad():
+        for start_idx in progressbar(
+            range(0, X.shape[0], batch_size), desc="Evaluating"
+        ):
+            inputs = torch.from_numpy(X[start_idx : start_idx + batch_size])
+            # always evaluate in full precision
+            inputs = inputs.to(device).float()
+
+            outputs = probe(inputs)
+
+            if is_regression:
+                predicted = outputs[:, 0]
             else:
-                key = idx
+                predicted = outputs.argmax(dim=1)
+            y_pred[start_idx : start_idx + inputs.shape[0]] = predicted.cpu().numpy()
 
-            y_pred.append(predicted[i])
+    return y_pred
 
-            if return_predictions:
-                if source_tokens:
-                    src_word = next(src_words)
-                else:
-                    src_word = src_word + 1
-                predictions.append((src_word, key, labels[i].item() == idx))
 
-    y_pred = np.array(y_pred)
+def _compute_class_scores(y_pred, y, idx_to_class=None, metric="accuracy"):
+    """
+    Internal helper method to compute overall and per-class scores.
 
-    result = metrics.compute_score(y_pred, y, metric)
+    Parameters
+    ----------
+    y_pred : numpy.ndarray
+        Numpy Vector of size [``NUM_TOKENS``] with the predictions of a probe
+    y : numpy.ndarray
+        Numpy Vector of size [``NUM_TOKENS``] with the gold labels
+    idx_to_class : dict, optional
+        Class index to name mapping. If provided, per-class scores are also
+        computed. Defaults to None.
+    metric : str, optional
+        Metric to use for evaluation scores. For supported metrics see
+        ``interpretation.metrics``
 
-    print("Score (%s) of the probe: %0.2f" % (metric, result))
+    Returns
+    -------
+    scores : dict
+        The overall score with the key ``__OVERALL__``, along with a key for
+        every class if ``idx_to_class`` is provided.
 
+    """
     class_scores = {}
-    class_scores["__OVERALL__"] = result
-
-    if idx_to_class:
+    class_scores["__OVERALL__"] = metrics.compute_score(y_pred, y, metric)
+
+    if not idx_to_class:
+        return class_scores
+
+    if metric == "accuracy" and np.issubdtype(y_pred.dtype, np.integer):
+        # The accuracy over the instances of a class is the recall of that
+        # class, which can be read off a single confusion matrix
+        y = y.astype(np.int64)
+        num_classes = int(max(max(idx_to_class), y.max(), y_pred.max())) + 1
+        confusion_matrix = np.bincount(
+            y * num_classes + y_pred, minlength=num_classes * num_classes
+        ).reshape(num_classes, num_classes)
+        class_totals = confusion_matrix.sum(axis=1)
+        class_correct = np.diag(confusion_matrix)
+        for i in idx_to_class:
+            if class_totals[i] == 0:
+                class_scores[idx_to_class[i]] = 0
+            else:
+                class_scores[idx_to_class[i]] = class_correct[i] / class_totals[i]
+    else:
+        # Group the instances of every class with a single sort
+        sorted_idx = np.argsort(y, kind="stable")
+        classes, class_starts, class_totals = np.unique(
+            y[sorted_idx], return_index=True, return_counts=True
+        )
+        class_instances = {
+            c: sorted_idx[start : start + total]
+            for c, start, total in zip(classes.tolist(), class_starts, class_totals)
+        }
         for i in idx_to_class:
-            class_name = idx_to_class[i]
-            class_instances_idx = np.where(y == i)[0]
-            y_pred_filtered = y_pred[class_instances_idx]
-            y_filtered = y[class_instances_idx]
-            total = y_filtered.shape
-            if total == 0:
-                class_scores[class_name] = 0
+            if i not in class_instances:
+                class_scores[idx_to_class[i]] = 0
             else:
-                class_scores[class_name] = metrics.compute_score(
-                    y_pred_filtered, y_filtered, metric
+                class_instances_idx = class_instances[i]
+                class_scores[idx_to_class[i]] = metrics.compute_score(
+                    y_pred[class_instances_idx], y[class_instances_idx], metric
                 )
 
-    if return_predictions:
-        return class_scores, predictions
     return class_scores
 
 
+def evaluate_layerwise_probes(
+    probes,
+    X,
+    y,
+    idx_to_class=None,
+    batch_size=4096,
+    metric="accuracy",
+):
+    """
+    Evaluates a set of per-layer probes in a single pass over the data.
+
+    This method is equivalent to calling
+    ``interpretation.linear_probe.evaluate_probe`` for every probe with the
+    activations of its layer, but the data is only iterated over once and no
+    copies of ``X`` are made.
+
+    Parameters
+    ----------
+    probes : list of interpretation.linear_probe.LinearProbe
+        Trained per-layer probes, usually returned by
+        ``interpretation.linear_probe.train_layerwise_probes``
+    X : numpy.ndarray
+        Numpy Matrix of size [``NUM_TOKENS`` x ``NUM_NEURONS``]. Usually the
+        output of ``interpretation.utils.create_tensors``. The neurons of all
+        layers are expected to be concatenated in order.
+    y : numpy.ndarray
+        Numpy Vector of size [``NUM_TOKENS``] with class labels for each input
+        token. For classification, 0-indexed class labels for each input token
+        are expected. For regression, a real value per input token is expected.
+        Usually the output of ``interpretation.utils.create_tensors``
+    idx_to_class : dict, optional
+        Class index to name mapping. Usually returned by
+        ``interpretation.utils.create_tensors``. If this mapping is provided,
+        per-class metrics are also computed. Defaults to None.
+    batch_size : int, optional
+        Batch size for the input to the model. Defaults to 4096
+    metric : str, optional
+        Metric to use for evaluation scores. For supported metrics see
+        ``interpretation.metrics``
+
+    Returns
+    -------
+    scores : list of dicts
+        List with the scores of every layer's probe, in the same format as
+        returned by ``interpretation.linear_probe.evaluate_probe``
+
+    """
+    progressbar = utils.get_progress_bar()
+
+    # Check if we can use GPU's for evaluation
+    use_gpu = torch.cuda.is_available()
+
+    probe = LayerwiseLinearProbe.from_layer_probes(probes)
+    if use_gpu:
+        probe = probe.cuda()
+
+    num_layers = len(probes)
+    is_regression = probe.num_classes == 1
+    y_pred = np.empty(
+        (X.shape[0], num_layers), dtype=np.float32 if is_regression else np.int64
+    )
+    with torch.no_grad():
+        for start_idx in progressbar(
+            range(0, X.shape[0], batch_size), desc="Evaluating"
+        ):
+            inputs = torch.from_numpy(X[start_idx : start_idx + batch_size])
+            if use_gpu:
+                inputs = inputs.cuda()
+
+            # always evaluate in full precision
+            outputs = probe(inputs.float())
+
+            if is_regression:
+                predicted = outputs[:, :, 0]
+            else:
+                predicted = outputs.argmax(dim=2)
+            y_pred[start_idx : start_idx + inputs.shape[0]] = predicted.cpu().numpy()
+
+    layer_scores = []
+    for layer in range(num_layers):
+        class_scores = _compute_class_scores(y_pred[:, layer], y, idx_to_class, metric)
+        print(
+            "Score (%s) of the layer %d probe: %0.2f"
+            % (metric, layer, class_scores["__OVERALL__"])
+        )
+        layer_scores.append(class_scores)
+
+    return layer_scores
+
+
+def _predict_stacked(weights, biases, X, batch_size=4096):
+    """
+    Internal helper method to compute the predictions of a stack of linear
+    models that share the same input in a single pass over the data.
+
+    Parameters
+    ----------
+    weights : torch.Tensor
+        Tensor of size [``NUM_MODELS`` x ``NUM_CLASSES`` x ``NUM_NEURONS``].
+        The inputs are moved to the device of the weights.
+    biases : torch.Tensor
+        Tensor of size [``NUM_MODELS`` x ``NUM_CLASSES``]
+    X : numpy.ndarray
+        Numpy Matrix of size [``NUM_TOKENS`` x ``NUM_NEURONS``]
+    batch_size : int, optional
+        Batch size for the input to the model. Defaults to 4096
+
+    Returns
+    -------
+    y_pred : numpy.ndarray
+        Numpy Matrix of size [``NUM_TOKENS`` x ``NUM_MODELS``] with the
+        predicted class indices for classification models and predicted values
+        for regression models
+
+    """
+    progressbar = utils.get_progress_bar()
+
+    num_models, num_classes, num_neurons = weights.shape
+    is_regression = num_classes == 1
+
+    y_pred = np.empty(
+        (X.shape[0], num_models), dtype=np.float32 if is_regression else np.int64
+    )
+    with torch.no_grad():
+        # All models are evaluated with a single matrix multiplication
+        stacked_weights = weights.reshape(num_models * num_classes, num_neurons).t()
+        stacked_biases = biases.reshape(num_models * num_classes)
+        for start_idx in progressbar(
+            range(0, X.shape[0], batch_size), desc="Evaluating"
+        ):
+            inputs = torch.from_numpy(X[start_idx : start_idx + batch_size])
+            # always evaluate in full precision
+            inputs = inputs.to(weights.device).float()
+
+            outputs = torch.addmm(stacked_biases, inputs, stacked_weights).view(
+                -1, num_models, num_classes
+            )
+
+            if is_regression:
+                predicted = outputs[:, :, 0]
+            else:
+                predicted = outputs.argmax(dim=2)
+            y_pred[start_idx : start_idx + inputs.shape[0]] = predicted.cpu().numpy()
+
+    return y_pred
+
+
+def evaluate_probe_with_masks(
+    probe,
+    X,
+    y,
+    masks,
+    idx_to_class=None,
+    batch_size=4096,
+    metric="accuracy",
+):
+    """
+    Evaluates a trained probe under several neuron ablations in a single pass.
+
+    Zeroing out a neuron's activations is equivalent to zeroing out the
+    corresponding column of the probe's weights, so every mask is applied to
+    the weights instead of the data. The masked weights of all experiments are
+    stacked, and the data is iterated over only once without making any
+    copies of ``X``.
+
+    Parameters
+    ----------
+    probe : interpretation.linear_probe.LinearProbe
+        Trained probe model
+    X : numpy.ndarray
+        Numpy Matrix of size [``NUM_TOKENS`` x ``NUM_NEURONS``]. Usually the
+        output of ``interpretation.utils.create_tensors``.
+    y : numpy.ndarray
+        Numpy Vector of size [``NUM_TOKENS``] with class labels for each input
+        token. For classification, 0-indexed class labels for each input token
+        are expected. For regression, a real value per input token is expected.
+        Usually the output of ``interpretation.utils.create_tensors``
+    masks : numpy.ndarray
+        Numpy Matrix of size [``NUM_MASKS`` x ``NUM_NEURONS``], which is zero
+        (or False) for every ablated neuron. Usually the output of
+        ``interpretation.ablation.create_neuron_masks``
+    idx_to_class : dict, optional
+        Class index to name mapping. Usually returned by
+        ``interpretation.utils.create_tensors``. If this mapping is provided,
+        per-class metrics are also computed. Defaults to None.
+    batch_size : int, optional
+        Batch size for the input to the model. Defaults to 4096
+    metric : str, optional
+        Metric to use for evaluation scores. For supported metrics see
+        ``interpretation.metrics``
+
+    Returns
+    -------
+    scores : list of dicts
+        List with the scores of every mask, in the same format as returned by
+        ``interpretation.linear_probe.evaluate_probe``
+
+    """
+    # Check if we can use GPU's for evaluation
+    use_gpu = torch.cuda.is_available()
+
+    if use_gpu:
+        probe = probe.cuda()
+
+    # always evaluate in full precision
+    probe = probe.float()
+
+    weights, bias = list(probe.parameters())[:2]
+    num_classes, num_neurons = weights.shape
+
+    masks = np.asarray(masks)
+    if masks.ndim != 2 or masks.shape[1] != num_neurons:
+        raise ValueError(
+            "masks must be of size [NUM_MASKS x %d], got %s"
+            % (num_neurons, masks.shape)
+        )
+    num_masks = masks.shape[0]
+
+    with torch.no_grad():
+        masks = torch.from_numpy(masks.astype(np.float32)).to(weights.device)
+        masked_weights = masks.unsqueeze(1) * weights.unsqueeze(0)
+        masked_biases = bias.unsqueeze(0).expand(num_masks, num_classes)
+
+    y_pred = _predict_stacked(masked_weights, masked_biases, X, batch_size=batch_size)
+
+    mask_scores = []
+    for mask_idx in range(num_masks):
+        class_scores = _compute_class_scores(
+            y_pred[:, mask_idx], y, idx_to_class, metric
+        )
+        print(
+            "Score (%s) of the probe with mask %d: %0.2f"
+            % (metric, mask_idx, class_scores["__OVERALL__"])
+        )
+        mask_scores.append(class_scores)
+
+    return mask_scores
+
+
+def evaluate_neuron_subset_probes(
+    probes,
+    neuron_lists,
+    X,
+    y,
+    idx_to_class=None,
+    batch_size=4096,
+    metric="accuracy",
+):
+    """
+    Evaluates a set of probes trained on different subsets of neurons in a
+    single pass.
+
+    This method is equivalent to calling
+    ``interpretation.linear_probe.evaluate_probe`` for every probe with
+    ``X[:, neurons]``, but the data is only iterated over once and no copies
+    of ``X`` are made. The weights of every probe are scattered into a matrix
+    over all neurons, with zeros for the neurons the probe was not trained on.
+
+    Parameters
+    ----------
+    probes : list of interpretation.linear_probe.LinearProbe
+        Trained probes, where the i-th probe was trained on the activations of
+        the neurons in ``neuron_lists[i]``
+    neuron_lists : list of lists
+        The neurons (in order) each probe was trained on
+    X : numpy.ndarray
+        Numpy Matrix of size [``NUM_TOKENS`` x ``NUM_NEURONS``] with the
+        activations of all neurons. Usually the output of
+        ``interpretation.utils.create_tensors``.
+    y : numpy.ndarray
+        Numpy Vector of size [``NUM_TOKENS``] with class labels for each input
+        token. For classification, 0-indexed class labels for each input token
+        are expected. For regression, a real value per input token is expected.
+        Usually the output of ``interpretation.utils.create_tensors``
+    idx_to_class : dict, optional
+        Class index to name mapping. Usually returned by
+        ``interpretation.utils.create_tensors``. If this mapping is provided,
+        per-class metrics are also computed. Defaults to None.
+    batch_size : int, optional
+        Batch size for the input to the model. Defaults to 4096
+    metric : str, optional
+        Metric to use for evaluation scores. For supported metrics see
+        ``interpretation.metrics``
+
+    Returns
+    -------
+    scores : list of dicts
+        List with the scores of every probe, in the same format as returned by
+        ``interpretation.linear_probe.evaluate_probe``
+
+    """
+    if len(probes) != len(neuron_lists):
+        raise ValueError("Every probe needs exactly one list of neurons")
+
+    # Check if we can use GPU's for evaluation
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    num_classes = list(probes[0].parameters())[0].shape[0]
+    weights = torch.zeros(
+        (len(probes), num_classes, X.shape[1]), dtype=torch.float32, device=device
+    )
+    biases = torch.zeros((len(probes), num_classes), dtype=torch.float32, device=device)
+    with torch.no_grad():
+        for probe_idx, (probe, neurons) in enumerate(zip(probes, neuron_lists)):
+            probe_weights, probe_bias = list(probe.parameters())[:2]
+            if probe_weights.shape != (num_classes, len(neurons)):
+                raise ValueError(
+                    "Probe %d does not match its list of %d neurons"
+                    % (probe_idx, len(neurons))
+                )
+            neurons = torch.as_tensor(np.asarray(neurons, dtype=np.int64))
+            weights[probe_idx][:, neurons.to(device)] = probe_weights.to(device).float()
+            biases[probe_idx] = probe_bias.to(device).float()
+
+    y_pred = _predict_stacked(weights, biases, X, batch_size=batch_size)
+
+    probe_scores = []
+    for probe_idx in range(len(probes)):
+        class_scores = _compute_class_scores(
+            y_pred[:, probe_idx], y, idx_to_class, metric
+        )
+        print(
+            "Score (%s) of probe %d: %0.2f"
+            % (metric, probe_idx, class_scores["__OVERALL__"])
+        )
+        probe_scores.append(class_scores)
+
+    return probe_scores
+
+
 ############################### Neuron Selection ###############################
 def get_top_neurons(probe, percentage, class_to_idx):
     """
@@ -688,6 +1469,66 @@ def get_random_neurons(probe, probability):
     return idx
 
 
+def _get_neuron_selection_steps(probe, class_to_idx, search_stride):
+    """
+    Internal helper method to compute when every neuron becomes a top neuron.
+
+    ``interpretation.linear_probe.get_top_neurons`` selects, for every class,
+    the neurons (sorted by weight in descending order) up to and including the
+    first neuron at which the cumulative weight mass reaches ``percentage`` of
+    the total weight mass. Hence the neuron at sorted position ``k > 0`` is
+    selected at a given percentage if and only if the cumulative mass of the
+    ``k`` neurons before it is strictly below the percentage threshold, and the
+    neuron at position 0 is always selected. This method sorts every class's
+    weights once and finds, with a single vectorized search over the
+    thresholds, the first percentage step ``p / search_stride`` at which every
+    neuron is selected for any class.
+
+    Parameters
+    ----------
+    probe : interpretation.linear_probe.LinearProbe
+        Trained probe model
+    class_to_idx : dict
+        Class to class index mapping. Usually returned by
+        ``interpretation.utils.create_tensors``.
+    search_stride : int
+        Defines how many pieces the percent weight mass selection is divided
+        into.
+
+    Returns
+    -------
+    selection_steps : numpy.ndarray
+        Numpy array of size ``NUM_NEURONS`` with the first step (between 0 and
+        ``search_stride``) at which each neuron is selected. Neurons that are
+        never selected have a step of ``search_stride + 1``.
+
+    """
+    weights = list(probe.parameters())[0].data.cpu()
+    weights = np.abs(weights.numpy())
+    num_neurons = weights.shape[1]
+
+    selection_steps = np.full((num_neurons,), search_stride + 1, dtype=np.int64)
+    percentages = np.arange(search_stride + 1) / search_stride
+    for c in class_to_idx:
+        class_weights = weights[class_to_idx[c], :]
+        total_mass = np.sum(class_weights)
+        sort_idx = np.argsort(class_weights)[::-1]
+        cum_sums = np.cumsum(class_weights[sort_idx])
+        # Thresholds are compared in the dtype of the weights, as in
+        # ``get_top_neurons``, so that ties are resolved identically
+        thresholds = (total_mass * percentages).astype(class_weights.dtype)
+
+        # Cumulative mass before every sorted position
+        preceding_mass = cum_sums[:-1]
+        class_steps = np.empty((num_neurons,), dtype=np.int64)
+        class_steps[0] = 0
+        class_steps[1:] = np.searchsorted(thresholds, preceding_mass, side="right")
+
+        selection_steps[sort_idx] = np.minimum(selection_steps[sort_idx], class_steps)
+
+    return selection_steps
+
+
 def get_neuron_ordering(probe, class_to_idx, search_stride=100):
     """
     Get global ordering of neurons from a trained probe.
@@ -735,25 +1576,17 @@ def get_neuron_ordering(probe, class_to_idx, search_stride=100):
         cutoff values are arbitrarily ordered.
 
     """
-    progressbar = utils.get_progress_bar()
+    selection_steps = _get_neuron_selection_steps(probe, class_to_idx, search_stride)
 
-    neuron_orderings = [
-        get_top_neurons(probe, p / search_stride, class_to_idx)[0]
-        for p in progressbar(range(search_stride + 1))
-    ]
+    # Neurons are ordered by the step at which they are first selected, and by
+    # their index within each step. Neurons that are never selected are left out
+    ordering = np.argsort(selection_steps, kind="stable")
+    ordering = ordering[selection_steps[ordering] <= search_stride]
 
-    considered_neurons = set()
-    ordering = []
-    cutoffs = []
-    for local_ordering in neuron_orderings:
-        local_ordering = list(local_ordering)
-        new_neurons = set(local_ordering).difference(considered_neurons)
-        ordering = ordering + list(new_neurons)
-        considered_neurons = considered_neurons.union(new_neurons)
+    cutoffs = np.cumsum(np.bincount(selection_steps, minlength=search_stride + 2))
+    cutoffs = cutoffs[: search_stride + 1]
 
-        cutoffs.append(len(ordering))
-
-    return ordering, cutoffs
+    return ordering.tolist(), cutoffs.tolist()
 
 
 def get_neuron_ordering_granular(
@@ -801,26 +1634,32 @@ def get_neuron_ordering_granular(
         cutoff values (i.e. a chunk) are arbitrarily ordered.
 
     """
-    progressbar = utils.get_progress_bar()
+    selection_steps = _get_neuron_selection_steps(probe, class_to_idx, search_stride)
+    num_neurons = selection_steps.shape[0]
 
-    weights = list(probe.parameters())[0].data.cpu()
-    num_neurons = weights.numpy().shape[1]
-    neuron_orderings = [
-        get_top_neurons(probe, p / search_stride, class_to_idx)[0]
-        for p in progressbar(range(search_stride + 1))
+    neuron_ordering = np.argsort(selection_steps, kind="stable")
+    # Number of neurons selected at every step
+    num_selected = np.cumsum(np.bincount(selection_steps, minlength=search_stride + 2))[
+        : search_stride + 1
     ]
 
-    sliding_idx = 0
-    considered_neurons = set()
+    # For every chunk, find the first step that selects at least as many
+    # neurons as requested
+    chunk_sizes = np.arange(0, num_neurons + 1, granularity)
+    chunk_steps = np.searchsorted(num_selected, chunk_sizes, side="left")
+    if chunk_steps[-1] > search_stride:
+        raise IndexError("Not enough neurons are selected at 100% weight mass")
+
     ordering = []
     cutoffs = []
-    for i in range(0, num_neurons + 1, granularity):
-        while len(neuron_orderings[sliding_idx]) < i:
-            sliding_idx = sliding_idx + 1
-        new_neurons = set(neuron_orderings[sliding_idx]).difference(considered_neurons)
-        if len(new_neurons) != 0:
-            ordering = ordering + list(new_neurons)
-            considered_neurons = considered_neurons.union(new_neurons)
+    num_considered = 0
+    for step in chunk_steps:
+        if num_selected[step] > num_considered:
+            # Neurons within a chunk are arbitrarily ordered, so they are
+            # returned in order of their index
+            new_neurons = np.sort(neuron_ordering[num_considered : num_selected[step]])
+            ordering.extend(new_neurons.tolist())
+            num_considered = num_selected[step]
 
             cutoffs.append(len(ordering))
 
@@ -6,38 +6,143 @@ entire property set (e.g Part of speech) without training any probes.
 .. seealso::
         `Antverg, Omer and Belinkov, Yonatan "On The Pitfalls Of Analyzing Idividual Neurons in Language Models." In Proceedings of the 10th International Conference on Learning Representations (ICLR). <https://arxiv.org/abs/2110.07483>`_
 """
-import itertools
-
 import numpy as np
 
 
-def _get_mean_vectors(X_train, y_train):
-    embeddings_by_labels = {}
-    average_embeddings_by_label = {}
-    rankings_per_label = {}
+def get_mean_vectors_from_chunks(chunks):
+    """
+    Computes the mean activation vector of every class from chunks of data
 
-    for words_idx in range(y_train.size):
-        label = y_train[words_idx]
-        if label in embeddings_by_labels:
-            embeddings_by_labels[label].append(X_train[words_idx])
-        else:
-            vector = []
-            vector.append(X_train[words_idx])
-            embeddings_by_labels[label] = vector
+    The per-class sums are accumulated over the chunks, so only one chunk of
+    activations has to be in memory at any time, e.g. when reading
+    activations from disk.
 
-    for k, v in embeddings_by_labels.items():
-        average_embeddings_by_label[k] = np.mean(v, axis=0)
+    Parameters
+    ----------
+    chunks : iterable of tuples
+        Iterable of ``(X, y)`` tuples, where ``X`` is a matrix of size
+        [``NUM_CHUNK_TOKENS`` x ``NUM_NEURONS``] and ``y`` a vector of size
+        [``NUM_CHUNK_TOKENS``] with the class label of every token.
 
-    avg_embeddings = list(average_embeddings_by_label.values())
+    Returns
+    -------
+    mean_vectors : dict
+        Dictionary with the mean vector of every class, with the class label
+        as the key. Classes are in the order of their first appearance.
 
-    return avg_embeddings, average_embeddings_by_label
+    """
+    label_to_idx = {}
+    sums, counts = [], []
+    dtype = None
+    for X, y in chunks:
+        X = np.asarray(X)
+        y = np.asarray(y)
+        if X.shape[0] == 0:
+            continue
+        dtype = X.dtype
+
+        # Sort tokens by label so that the sums of all labels in the chunk
+        # are computed with a single reduction
+        labels, label_starts, inverse, label_counts = np.unique(
+            y, return_index=True, return_inverse=True, return_counts=True
+        )
+        order = np.argsort(inverse, kind="stable")
+        group_starts = np.concatenate(([0], np.cumsum(label_counts)[:-1]))
+        label_sums = np.add.reduceat(
+            X[order].astype(np.float64, copy=False), group_starts, axis=0
+        )
+
+        # Register new labels in order of their first appearance
+        for label_idx in np.argsort(label_starts, kind="stable"):
+            label = labels[label_idx].item()
+            if label not in label_to_idx:
+                label_to_idx[label] = len(label_to_idx)
+                sums.append(np.zeros(X.shape[1], dtype=np.float64))
+                counts.append(0)
+        for label, label_sum, label_count in zip(
+            labels.tolist(), label_sums, label_counts
+        ):
+            sums[label_to_idx[label]] += label_sum
+            counts[label_to_idx[label]] += label_count
+
+    if not np.issubdtype(dtype, np.floating):
+        dtype = np.float64
+    return {
+        label: (sums[idx] / counts[idx]).astype(dtype)
+        for label, idx in label_to_idx.items()
+    }
+
+
+def get_mean_vectors(X_train, y_train, batch_size=4096):
+    """
+    Computes the mean activation vector of every class
 
+    The result can be passed to the ``get_neuron_ordering*`` functions in this
+    module via their ``mean_vectors`` argument, so that the class means are
+    only computed once for several rankings.
+
+    Parameters
+    ----------
+    X_train : numpy.ndarray
+        Numpy Matrix of size [``NUM_TOKENS`` x ``NUM_NEURONS``]. Usually the
+        output of ``interpretation.utils.create_tensors``
+    y_train : numpy.ndarray
+        Numpy Vector of size [``NUM_TOKENS``] with class labels for each input
+        token. Usually the output of ``interpretation.utils.create_tensors``.
+    batch_size : int, optional
+        Number of tokens that are processed together. Defaults to 4096.
+
+    Returns
+    -------
+    mean_vectors : dict
+        Dictionary with the mean vector of every class, with the class label
+        as the key. Classes are in the order of their first appearance.
+
+    """
+    return get_mean_vectors_from_chunks(
+        (X_train[start : start + batch_size], y_train[start : start + batch_size])
+        for start in range(0, y_train.shape[0], batch_size)
+    )
 
-def _get_overall_ranking(mean_vectors):
-    overall = np.zeros_like(mean_vectors[0])
 
-    for couple in itertools.combinations(mean_vectors, 2):
-        overall += np.abs(couple[0] - couple[1])
+def _get_mean_vectors(X_train, y_train, mean_vectors=None):
+    if mean_vectors is None:
+        mean_vectors = get_mean_vectors(X_train, y_train)
+    return list(mean_vectors.values()), mean_vectors
+
+
+def _get_pairwise_distance_sums(mean_vectors):
+    """
+    Computes ``sum_j |mean_vectors[i] - mean_vectors[j]|`` for every class
+    ``i`` and every neuron. The class means are sorted per neuron, so that the
+    sums of the smaller and larger means can be read off prefix sums instead
+    of comparing all pairs of classes.
+    """
+    mean_vectors = np.asarray(mean_vectors, dtype=np.float64)  # [C x D]
+    num_classes = mean_vectors.shape[0]
+
+    order = np.argsort(mean_vectors, axis=0)
+    sorted_means = np.take_along_axis(mean_vectors, order, axis=0)
+    cumulative_sums = np.cumsum(sorted_means, axis=0)
+    sums_below = cumulative_sums - sorted_means
+    sums_above = cumulative_sums[-1] - cumulative_sums
+
+    # The i-th smallest mean is larger than i means and smaller than
+    # num_classes - 1 - i means
+    num_below = np.arange(num_classes).reshape(-1, 1)
+    num_above = num_classes - 1 - num_below
+    sorted_distance_sums = (
+        sorted_means * num_below - sums_below + sums_above - sorted_means * num_above
+    )
+
+    distance_sums = np.empty_like(sorted_distance_sums)
+    np.put_along_axis(distance_sums, order, sorted_distance_sums, axis=0)
+    return distance_sums
+
+
+def _get_overall_ranking(mean_vectors):
+    # Every pair of classes is counted twice in the per-class sums
+    overall = _get_pairwise_distance_sums(mean_vectors).sum(axis=0) / 2
 
     ranking = np.argsort(overall)[::-1].tolist()
     return ranking
@@ -45,17 +150,15 @@ def _get_overall_ranking(mean_vectors):
 
 def _get_tag_wise_ranking(mean_vectors_by_label, tag):
     qz = mean_vectors_by_label[tag]
-    summation = np.abs(np.subtract(qz, qz))
-
-    for c, qzz in mean_vectors_by_label.items():
-        if tag != c:
-            summation = np.add(summation, np.abs(np.subtract(qz, qzz)))
+    summation = np.abs(
+        np.asarray(list(mean_vectors_by_label.values()), dtype=np.float64) - qz
+    ).sum(axis=0)
 
     ranking = np.argsort(summation)[::-1].tolist()
     return summation, ranking
 
 
-def get_neuron_ordering(X_train, y_train):
+def get_neuron_ordering(X_train, y_train, mean_vectors=None):
     """
     Returns a list of top neurons w.r.t the overall task e.g. POS
 
@@ -67,19 +170,24 @@ def get_neuron_ordering(X_train, y_train):
     y_train : numpy.ndarray
         Numpy Vector of size [``NUM_TOKENS``] with class labels for each input
         token. Usually the output of ``interpretation.utils.create_tensors``.
+    mean_vectors : dict, optional
+        Class mean vectors as returned by ``get_mean_vectors``. If provided,
+        ``X_train`` and ``y_train`` are not used and can be None.
 
     Returns
     -------
     ranking : list
         list of ``NUM_NEURONS`` neuron indices, in decreasing order of importance.
     """
-    avg_embeddings, average_embeddings_by_label = _get_mean_vectors(X_train, y_train)
+    avg_embeddings, average_embeddings_by_label = _get_mean_vectors(
+        X_train, y_train, mean_vectors
+    )
     ranking = _get_overall_ranking(avg_embeddings)
 
     return ranking
 
 
-def get_neuron_ordering_for_tag(X_train, y_train, label2idx, tag):
+def get_neuron_ordering_for_tag(X_train, y_train, label2idx, tag, mean_vectors=None):
     """
     Returns a list of top neurons w.r.t a tag e.g. noun
 
@@ -96,6 +204,9 @@ def get_neuron_ordering_for_tag(X_train, y_train, label2idx, tag):
         ``interpretation.utils.create_tensors``.
     tag : string
         tag for which rankings are extracted
+    mean_vectors : dict, optional
+        Class mean vectors as returned by ``get_mean_vectors``. If provided,
+        ``X_train`` and ``y_train`` are not used and can be None.
 
     Returns
     -------
@@ -103,7 +214,9 @@ def get_neuron_ordering_for_tag(X_train, y_train, label2idx, tag):
         list of ``NUM_NEURONS`` neuron indices, in decreasing order of importance.
 
     """
-    avg_embeddings, average_embeddings_by_label = _get_mean_vectors(X_train, y_train)
+    avg_embeddings, average_embeddings_by_label = _get_mean_vectors(
+        X_train, y_train, mean_vectors
+    )
     summation, ranking = _get_tag_wise_ranking(
         average_embeddings_by_label, label2idx[tag]
     )
@@ -111,7 +224,7 @@ def get_neuron_ordering_for_tag(X_train, y_train, label2idx, tag):
     return ranking
 
 
-def get_neuron_ordering_for_all_tags(X_train, y_train, idx2label):
+def get_neuron_ordering_for_all_tags(X_train, y_train, idx2label, mean_vectors=None):
     """
     Returns a dictionary of tags along with top neurons for each tag
     Returns a list of overall ranking
@@ -127,6 +240,9 @@ def get_neuron_ordering_for_all_tags(X_train, y_train, idx2label):
     idx2label: dict
         Class index to name mapping. Usually returned by
         ``interpretation.utils.create_tensors``.
+    mean_vectors : dict, optional
+        Class mean vectors as returned by ``get_mean_vectors``. If provided,
+        ``X_train`` and ``y_train`` are not used and can be None.
 
     Returns
     -------
@@ -138,15 +254,16 @@ def get_neuron_ordering_for_all_tags(X_train, y_train, idx2label):
     """
     # TODO: switch to label2idx for consistency
     ranking_per_tag = {}
-    avg_embeddings, average_embeddings_by_label = _get_mean_vectors(X_train, y_train)
-
-    overall = np.zeros_like(X_train[0])
+    avg_embeddings, average_embeddings_by_label = _get_mean_vectors(
+        X_train, y_train, mean_vectors
+    )
 
-    for c, qz in average_embeddings_by_label.items():
-        summation, ranking = _get_tag_wise_ranking(average_embeddings_by_label, c)
-        overall = np.add(overall, summation)
-        ranking_per_tag[idx2label[c]] = ranking
+    distance_sums = _get_pairwise_distance_sums(avg_embeddings)
+    rankings = np.argsort(distance_sums, axis=1)[:, ::-1]
+    for c, ranking in zip(average_embeddings_by_label, rankings):
+        ranking_per_tag[idx2label[c]] = ranking.tolist()
 
+    overall = distance_sums.sum(axis=0)
     overall_ranking = np.argsort(overall)[::-1].tolist()
 
     return overall_ranking, ranking_per_tag
@@ -1,8 +1,9 @@
+import json
 import math
 
+import h5py
 import numpy as np
-
-from imblearn.under_sampling import RandomUnderSampler
+import torch
 
 
 def isnotebook():
@@ -506,7 +507,79 @@ def print_machine_stats(all_results):
 
 
 ################################ Data Balancing ################################
-def balance_binary_class_data(X, y):
+def get_balanced_indices(y, num_instances_per_class=None, random_state=None):
+    """
+    Method to compute the indices of a randomly under-sampled, balanced subset
+    of the data.
+
+    Only the labels are needed, so the activations can be selected afterwards
+    with a single gather (or not at all).
+
+    Parameters
+    ----------
+    y : numpy.ndarray
+        Numpy vector of size [``NUM_TOKENS``]. Usually returned from
+        ``interpretation.utils.create_tensors``
+    num_instances_per_class : dict, optional
+        Number of instances to sample for every class, with the class label as
+        the key. Classes with fewer instances keep all of their instances. If
+        not provided, all classes are sampled to the size of the minority
+        class.
+    random_state : int, optional
+        Seed for the random sampling. If not provided, numpy's global random
+        state is used.
+
+    Returns
+    -------
+    indices : numpy.ndarray
+        Sorted numpy vector with the indices of the selected tokens
+
+    """
+    y = np.asarray(y)
+    classes, inverse, counts = np.unique(y, return_inverse=True, return_counts=True)
+    if num_instances_per_class is None:
+        class_sizes = np.full(classes.shape[0], counts.min())
+    else:
+        class_sizes = np.array(
+            [num_instances_per_class.get(c, count) for c, count in zip(classes, counts)]
+        )
+    class_sizes = np.minimum(class_sizes, counts)
+
+    rng = np.random if random_state is None else np.random.RandomState(random_state)
+
+    # Group the tokens by class in a random order within every class, and keep
+    # the first ``class_sizes`` tokens of every group
+    permutation = rng.permutation(y.shape[0])
+    permutation = permutation[np.argsort(inverse[permutation], kind="stable")]
+    class_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    positions = np.arange(y.shape[0]) - np.repeat(class_starts, counts)
+    selected = positions < np.repeat(class_sizes, counts)
+
+    return np.sort(permutation[selected])
+
+
+def _take_rows(X, indices, batch_size=4096):
+    """
+    Selects rows of ``X`` with a single gather. Lazy sources such as
+    ``h5py.Dataset`` objects are read in batches of rows.
+    """
+    # All rows are selected (``indices`` is sorted)
+    select_all = indices.shape[0] == X.shape[0]
+    if isinstance(X, np.ndarray) and not isinstance(X, np.memmap):
+        return X if select_all else X[indices]
+
+    X_selected = np.empty((indices.shape[0],) + X.shape[1:], dtype=X.dtype)
+    for start in range(0, indices.shape[0], batch_size):
+        if select_all:
+            X_selected[start : start + batch_size] = X[start : start + batch_size]
+        else:
+            X_selected[start : start + batch_size] = X[
+                indices[start : start + batch_size]
+            ]
+    return X_selected
+
+
+def balance_binary_class_data(X, y, random_state=None):
     """
     Method to balance binary class data.
 
@@ -518,26 +591,32 @@ def balance_binary_class_data(X, y):
     ----------
     X : numpy.ndarray
         Numpy Matrix of size [``NUM_TOKENS`` x ``NUM_NEURONS``]. Usually
-        returned from ``interpretation.utils.create_tensors``
+        returned from ``interpretation.utils.create_tensors``. Lazy sources
+        such as ``numpy.memmap`` or ``h5py.Dataset`` are also supported, in
+        which case only the selected rows are read.
     y : numpy.ndarray
         Numpy vector of size [``NUM_TOKENS``]. Usually returned from
         ``interpretation.utils.create_tensors``
+    random_state : int, optional
+        Seed for the random sampling. If not provided, numpy's global random
+        state is used.
 
     Returns
     -------
     X_balanced : numpy.ndarray
-        Numpy matrix of size [``NUM_BALANCED_TOKENS`` x ``NUM_NEURONS``]
+        Numpy matrix of size [``NUM_BALANCED_TOKENS`` x ``NUM_NEURONS``]. The
+        selected tokens are in their original order. If the data is already
+        balanced, ``X`` is returned as is.
     y_balanced : numpy.ndarray
         Numpy vector of size [``NUM_BALANCED_TOKENS``]
 
     """
-    rus = RandomUnderSampler()
-    X_res, y_res = rus.fit_resample(X, y)
+    indices = get_balanced_indices(y, random_state=random_state)
 
-    return X_res, y_res
+    return _take_rows(X, indices), _take_rows(np.asarray(y), indices)
 
 
-def balance_multi_class_data(X, y, num_required_instances=None):
+def balance_multi_class_data(X, y, num_required_instances=None, random_state=None):
     """
     Method to balance multi class data.
 
@@ -551,22 +630,31 @@ def balance_multi_class_data(X, y, num_required_instances=None):
     ----------
     X : numpy.ndarray
         Numpy Matrix of size [``NUM_TOKENS`` x ``NUM_NEURONS``]. Usually
-        returned from ``interpretation.utils.create_tensors``
+        returned from ``interpretation.utils.create_tensors``. Lazy sources
+        such as ``numpy.memmap`` or ``h5py.Dataset`` are also supported, in
+        which case only the selected rows are read.
     y : numpy.ndarray
         Numpy vector of size [``NUM_TOKENS``]. Usually returned from
         ``interpretation.utils.create_tensors``
     num_required_instances : int, optional
         Total number of required instances. All classes are sampled
         proportionally.
+    random_state : int, optional
+        Seed for the random sampling. If not provided, numpy's global random
+        state is used.
 
     Returns
     -------
     X_balanced : numpy.ndarray
-        Numpy matrix of size [``NUM_BALANCED_TOKENS`` x ``NUM_NEURONS``]
+        Numpy matrix of size [``NUM_BALANCED_TOKENS`` x ``NUM_NEURONS``]. The
+        selected tokens are in their original order. If no token is dropped,
+        ``X`` is returned as is.
     y_balanced : numpy.ndarray
         Numpy vector of size [``NUM_BALANCED_TOKENS``]
 
     """
+    y = np.asarray(y)
+    num_instances_per_class = None
     if num_required_instances:
         total = y.shape[0]
         unique, counts = np.unique(y, return_counts=True)
@@ -576,29 +664,45 @@ def balance_multi_class_data(X, y, num_required_instances=None):
             for key, count in class_counts.items()
         }
         print(num_instances_per_class)
-        rus = RandomUnderSampler(sampling_strategy=num_instances_per_class)
-    else:
-        rus = RandomUnderSampler()
 
-    X_res, y_res = rus.fit_resample(X, y)
+    indices = get_balanced_indices(
+        y, num_instances_per_class=num_instances_per_class, random_state=random_state
+    )
+
+    return _take_rows(X, indices), _take_rows(y, indices)
+
 
-    return X_res, y_res
+PROBE_FORMAT_VERSION = 1
 
 
-def load_probe(probe_path):
+def _encode_mappings(mappings):
+    # Dictionaries are stored as lists of (key, value) pairs so that integer
+    # keys (e.g. in ``idx2label``) survive the round trip through json
+    return json.dumps([list(mapping.items()) for mapping in mappings])
+
+
+def _decode_mappings(encoded_mappings):
+    return [
+        {key: value for key, value in mapping}
+        for mapping in json.loads(encoded_mappings)
+    ]
+
+
+def save_probe(probe_path, probe, mappings, metadata=None):
     """
-    Loads a probe and its associated mappings from probe_path
+    Saves a probe, its associated mappings and training metadata at probe_path
 
-    .. warning::
-        This method is currently not implemented.
+    The probe is stored in an hdf5 file. The weight matrix and bias vector are
+    stored as uncompressed contiguous datasets (``weight`` and ``bias``), so
+    that they can be memory-mapped directly by ``load_probe_weights``.
+    Everything else (probe configuration, mappings and metadata) is stored in
+    the file's attributes, which can be read without touching the weights
+    using ``load_probe_metadata``.
 
     Parameters
     ----------
     probe_path : str
-        Path to a pkl object saved by interpretation.utils.save_probe
-
-    Returns
-    -------
+        Path to save the probe at, usually with an ``.hdf5`` extension
     probe : interpretation.linear_probe.LinearProbe
         Trained probe model
     mappings : list of dicts
@@ -607,22 +711,122 @@ def load_probe(probe_path):
         ``idx2src`` for regression tasks. Each dict represents either the
         mapping from class labels to indices and source tokens to indices or
         vice versa.
+    metadata : dict, optional
+        Any json-serializable information about the probe, e.g. the training
+        hyperparameters or the layers the activations were taken from.
 
     """
-    pass
+    weight = probe.linear.weight.detach().cpu().numpy()
+    bias = probe.linear.bias.detach().cpu().numpy()
+
+    with h5py.File(probe_path, "w") as probe_file:
+        probe_file.attrs["format_version"] = PROBE_FORMAT_VERSION
+        probe_file.attrs["probe_type"] = probe.__class__.__name__
+        probe_file.attrs["input_size"] = weight.shape[1]
+        probe_file.attrs["num_classes"] = weight.shape[0]
+        probe_file.attrs["mappings"] = _encode_mappings(mappings)
+        probe_file.attrs["metadata"] = json.dumps(metadata or {})
 
+        probe_file.create_dataset("weight", data=weight)
+        probe_file.create_dataset("bias", data=bias)
 
-def save_probe(probe_path, probe, mappings):
+
+def load_probe_metadata(probe_path):
     """
-    Saves a model and its associated mappings as a pkl object at probe_path
+    Loads the configuration, mappings and metadata of a saved probe without
+    reading its weights.
 
-    .. warning::
-        This method is currently not implemented.
+    Parameters
+    ----------
+    probe_path : str
+        Path to a probe saved by ``interpretation.utils.save_probe``
+
+    Returns
+    -------
+    info : dict
+        Dictionary with the ``format_version``, ``probe_type``, ``input_size``
+        and ``num_classes`` of the probe, along with its ``mappings`` and the
+        ``metadata`` it was saved with.
+
+    """
+    with h5py.File(probe_path, "r") as probe_file:
+        attrs = probe_file.attrs
+        format_version = int(attrs.get("format_version", 0))
+        if format_version != PROBE_FORMAT_VERSION:
+            raise ValueError(
+                "Unsupported probe format version %d in %s"
+                % (format_version, probe_path)
+            )
+        return {
+            "format_version": format_version,
+            "probe_type": attrs["probe_type"],
+            "input_size": int(attrs["input_size"]),
+            "num_classes": int(attrs["num_classes"]),
+            "mappings": _decode_mappings(attrs["mappings"]),
+            "metadata": json.loads(attrs["metadata"]),
+        }
+
+
+def _load_dataset(probe_path, dataset_name, mmap=True):
+    with h5py.File(probe_path, "r") as probe_file:
+        dataset = probe_file[dataset_name]
+        offset = dataset.id.get_offset()
+        if not mmap or offset is None:
+            # Dataset is chunked, compressed or empty and cannot be mapped
+            return dataset[()]
+        shape, dtype = dataset.shape, dataset.dtype
+
+    return np.memmap(probe_path, mode="r", dtype=dtype, shape=shape, offset=offset)
+
+
+def load_probe_weights(probe_paths, mmap=True):
+    """
+    Loads the weights of several saved probes in bulk.
+
+    The weights are memory-mapped from the probe files by default, so loading
+    a large number of probes is cheap and only the parts of the weights that
+    are actually accessed are read from disk.
+
+    Parameters
+    ----------
+    probe_paths : list of str
+        Paths to probes saved by ``interpretation.utils.save_probe``
+    mmap : bool, optional
+        Whether to memory-map the weights (read-only) or read them into
+        memory. Defaults to True.
+
+    Returns
+    -------
+    weights : list of numpy.ndarray
+        List of weight matrices of size [``NUM_CLASSES`` x ``NUM_NEURONS``],
+        one for each of the probes in ``probe_paths``
+    biases : list of numpy.ndarray
+        List of bias vectors of size [``NUM_CLASSES``], one for each of the
+        probes in ``probe_paths``
+
+    """
+    weights, biases = [], []
+    for probe_path in probe_paths:
+        load_probe_metadata(probe_path)
+        weights.append(_load_dataset(probe_path, "weight", mmap=mmap))
+        biases.append(_load_dataset(probe_path, "bias", mmap=mmap))
+
+    return weights, biases
+
+
+def load_probe(probe_path, return_metadata=False):
+    """
+    Loads a probe and its associated mappings from probe_path
 
     Parameters
     ----------
     probe_path : str
-        Path to save a pkl object
+        Path to a probe saved by ``interpretation.utils.save_probe``
+    return_metadata : bool, optional
+        If True, the metadata the probe was saved with is also returned.
+
+    Returns
+    -------
     probe : interpretation.linear_probe.LinearProbe
         Trained probe model
     mappings : list of dicts
@@ -631,6 +835,25 @@ def save_probe(probe_path, probe, mappings):
         ``idx2src`` for regression tasks. Each dict represents either the
         mapping from class labels to indices and source tokens to indices or
         vice versa.
+    metadata : dict
+        Metadata the probe was saved with. Only returned if ``return_metadata``
+        is True.
 
     """
-    pass
+    from .linear_probe import LinearProbe
+
+    info = load_probe_metadata(probe_path)
+    if info["probe_type"] != LinearProbe.__name__:
+        raise ValueError("Unsupported probe type %s" % (info["probe_type"]))
+
+    probe = LinearProbe(info["input_size"], info["num_classes"])
+    with h5py.File(probe_path, "r") as probe_file:
+        state_dict = {
+            "linear.weight": torch.from_numpy(probe_file["weight"][()]),
+            "linear.bias": torch.from_numpy(probe_file["bias"][()]),
+        }
+    probe.load_state_dict(state_dict)
+
+    if return_metadata:
+        return probe, info["mappings"], info["metadata"]
+    return probe, info["mappings"]
@@ -25,7 +25,6 @@ setup(
     packages=find_packages(where="."),
     install_requires=[
         "h5py>=3.6.0",
-        "imbalanced-learn>=0.8.0",
         "numpy>=1.21,<2",
         "scikit-learn>=1.0",
         "scipy>=1.7.3",
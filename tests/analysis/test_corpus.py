@@ -88,3 +88,179 @@ class TestGetTopWords(unittest.TestCase):
             num_tokens=10,
             min_threshold=0.5,
         )
+
+
+class TestGetTopWordsForNeurons(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        vocabulary = ["word_%d" % idx for idx in range(20)]
+        self.tokens = {
+            "source": [
+                [vocabulary[idx] for idx in rng.randint(0, 20, size=num_tokens)]
+                for num_tokens in [5, 12, 8, 20]
+            ]
+        }
+        self.activations = [
+            rng.randn(len(sentence), 4).astype(np.float32)
+            for sentence in self.tokens["source"]
+        ]
+
+    def test_get_top_words_for_neurons(self):
+        "Batched top words match top words of individual neurons"
+        top_words = corpus.get_top_words_for_neurons(
+            self.tokens, self.activations, [3, 0, 2]
+        )
+
+        self.assertListEqual(list(top_words.keys()), [3, 0, 2])
+        for neuron, neuron_top_words in top_words.items():
+            expected_top_words = corpus.get_top_words(
+                self.tokens, self.activations, neuron
+            )
+            self.assertListEqual(
+                [token for token, _ in neuron_top_words],
+                [token for token, _ in expected_top_words],
+            )
+            np.testing.assert_allclose(
+                [score for _, score in neuron_top_words],
+                [score for _, score in expected_top_words],
+            )
+
+    def test_get_top_words_for_neurons_limit_tokens(self):
+        "Batched top words with limit on the number of tokens"
+        top_words = corpus.get_top_words_for_neurons(
+            self.tokens, self.activations, [0, 1], num_tokens=3
+        )
+
+        for neuron in [0, 1]:
+            self.assertEqual(len(top_words[neuron]), 3)
+            self.assertEqual(top_words[neuron][0][1], 1.0)
+
+
+class TestCorpusIndex(unittest.TestCase):
+    def setUp(self):
+        self.tokens = {"source": [["a", "b", "a"], ["c", "b"], ["a"]]}
+        self.activations = [
+            np.array([[1.0, 0.0], [2.0, 1.0], [3.0, 0.0]], dtype=np.float32),
+            np.array([[4.0, 1.0], [5.0, 0.0]], dtype=np.float32),
+            np.array([[6.0, 1.0]], dtype=np.float32),
+        ]
+        self.index = corpus.CorpusIndex(self.tokens, self.activations)
+
+    def test_corpus_index(self):
+        "Index holds flattened activations, type ids and statistics"
+        self.assertListEqual(self.index.types, ["a", "b", "c"])
+        np.testing.assert_array_equal(self.index.token_ids, [0, 1, 0, 2, 1, 0])
+        np.testing.assert_array_equal(self.index.sentence_offsets, [0, 3, 5, 6])
+        np.testing.assert_array_equal(
+            self.index.activations, np.concatenate(self.activations)
+        )
+        np.testing.assert_allclose(
+            self.index.means, np.concatenate(self.activations).mean(axis=0)
+        )
+        np.testing.assert_allclose(
+            self.index.stds, np.concatenate(self.activations).std(axis=0)
+        )
+
+    def test_corpus_index_flattened_activations(self):
+        "A single activation matrix is used without copying"
+        X = np.concatenate(self.activations)
+        index = corpus.CorpusIndex(self.tokens, X)
+
+        self.assertIs(index.activations, X)
+
+    def test_corpus_index_mismatched_activations(self):
+        "Number of tokens and activations must match"
+        self.assertRaises(
+            ValueError, corpus.CorpusIndex, self.tokens, self.activations[:2]
+        )
+
+    def test_get_occurrences(self):
+        "Occurrences and activations of a token type"
+        np.testing.assert_array_equal(self.index.get_occurrences("a"), [0, 2, 5])
+        np.testing.assert_array_equal(
+            self.index.get_type_activations("b", neurons=[0]), [[2.0], [5.0]]
+        )
+        self.assertEqual(self.index.get_position(4), (1, 1))
+        self.assertEqual(self.index.get_position(5), (2, 0))
+
+    def test_get_top_words(self):
+        "Top words from the index match get_top_words"
+        for neuron in range(2):
+            self.assertListEqual(
+                [token for token, _ in self.index.get_top_words(neuron)],
+                [
+                    token
+                    for token, _ in corpus.get_top_words(
+                        self.tokens, self.activations, neuron
+                    )
+                ],
+            )
+
+
+class TestGetTopActivations(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.tokens = {
+            "source": [
+                ["token_%d_%d" % (s, t) for t in range(num_tokens)]
+                for s, num_tokens in enumerate([4, 9, 1, 6, 7])
+            ]
+        }
+        self.activations = [
+            rng.randn(len(sentence), 5).astype(np.float32)
+            for sentence in self.tokens["source"]
+        ]
+        self.flattened_activations = np.concatenate(self.activations)
+
+    def test_get_top_activations(self):
+        "Top occurrences are in decreasing order of activation with context"
+        top_activations = corpus.get_top_activations(
+            self.tokens, iter(self.activations), [1, 4], num_occurrences=5
+        )
+
+        for neuron in [1, 4]:
+            self.assertEqual(len(top_activations[neuron]), 5)
+            np.testing.assert_array_equal(
+                [activation for _, activation, _, _, _ in top_activations[neuron]],
+                np.sort(self.flattened_activations[:, neuron])[::-1][:5],
+            )
+            for token, activation, sentence_idx, token_idx, sentence in top_activations[
+                neuron
+            ]:
+                self.assertEqual(sentence, self.tokens["source"][sentence_idx])
+                self.assertEqual(token, sentence[token_idx])
+                self.assertEqual(
+                    activation, self.activations[sentence_idx][token_idx, neuron]
+                )
+
+    def test_get_top_activations_absolute(self):
+        "Top occurrences ranked by absolute activation"
+        top_activations = corpus.get_top_activations(
+            self.tokens, self.activations, [2], num_occurrences=3, use_absolute=True
+        )
+
+        np.testing.assert_array_equal(
+            [abs(activation) for _, activation, _, _, _ in top_activations[2]],
+            np.sort(np.abs(self.flattened_activations[:, 2]))[::-1][:3],
+        )
+
+    def test_get_top_activations_no_occurrences(self):
+        "No occurrences are returned if none are requested"
+        top_activations = corpus.get_top_activations(
+            self.tokens, self.activations, [1, 4], num_occurrences=0
+        )
+
+        self.assertDictEqual(top_activations, {1: [], 4: []})
+
+    def test_corpus_index_get_top_activations(self):
+        "Top occurrences from the index match the streaming computation"
+        index = corpus.CorpusIndex(self.tokens, self.activations)
+        top_activations = corpus.get_top_activations(
+            self.tokens, self.activations, range(5), num_occurrences=4
+        )
+
+        for neuron in range(5):
+            self.assertListEqual(
+                index.get_top_activations(neuron, num_occurrences=4),
+                top_activations[neuron],
+            )
@@ -111,6 +111,30 @@ class TestCreateBinaryData(unittest.TestCase):
         self.assertEqual(words.count(test_word), 5)
         self.assertEqual(labels.count("positive"), labels.count("negative"))
 
+    def test_balanced_negative_examples_keep_order(self):
+        "Balanced negative examples are a sorted subset of all negative examples"
+
+        words, labels, activations = annotate._create_binary_data(
+            self.tokens, self.activations, {"test"}, balance_data=True
+        )
+
+        all_words = [word for sentence in self.tokens["source"] for word in sentence]
+        all_activations = torch.cat(self.activations)
+        negative_positions = [
+            torch.nonzero((all_activations == act).all(dim=1)).item()
+            for act, label in zip(activations, labels)
+            if label == "negative"
+        ]
+
+        self.assertEqual(len(negative_positions), 5)
+        self.assertListEqual(negative_positions, sorted(set(negative_positions)))
+        for word, position in zip(
+            [w for w, label in zip(words, labels) if label == "negative"],
+            negative_positions,
+        ):
+            self.assertNotEqual(word, "test")
+            self.assertEqual(word, all_words[position])
+
     def test_if_positive_class_is_zero(self):
         "Check if specific pattern or word does not exist in the list of sentences. Positive class will be zero"
 
@@ -223,10 +247,11 @@ class TestAnnotateData(unittest.TestCase):
 
     @patch("neurox.data.annotate._create_binary_data")
     def test_binary_data_wrapper(self, mock_create_binary_data):
+        word_activations = torch.rand((len(self.test_sentences), self.num_layers * 768))
         mock_create_binary_data.return_value = (
             self.test_sentences,
             self.test_sentences,
-            self.activations,
+            word_activations,
         )
 
         annotate.annotate_data(
@@ -246,13 +271,39 @@ class TestAnnotateData(unittest.TestCase):
         )
         self.assertEqual(self.num_layers, test_num_layers)
 
-        gold_activations = [a.reshape((a.shape[1], -1)) for a in self.activations]
+        # Every word is saved as a sentence with a single token
         for act_idx, act in enumerate(test_activations):
             self.assertTrue(
-                torch.allclose(gold_activations[act_idx], torch.FloatTensor(act))
+                torch.allclose(word_activations[[act_idx]], torch.FloatTensor(act))
             )
 
         # # Check hdf5 structure
         # self.assertEqual(len(saved_activations.keys()), len(self.test_sentences) + 1)
         # self.assertTrue("sentence_to_index" in saved_activations)
         # self.assertTrue(torch.equal(torch.FloatTensor(saved_activations[idx]), self.expected_activations[int(idx)]))
+
+    def test_annotate_data(self):
+        "Annotated activations are the activations of the selected words"
+        annotate.annotate_data(
+            f"{self.tmpdir.name}/gold.word",
+            f"{self.tmpdir.name}/gold.hdf5",
+            {"test", "book"},
+            f"{self.tmpdir.name}/test",
+        )
+
+        with open(f"{self.tmpdir.name}/test.word") as fp:
+            words = [line.strip() for line in fp]
+        with open(f"{self.tmpdir.name}/test.label") as fp:
+            labels = [line.strip() for line in fp]
+        test_activations, _ = data_loader.load_activations(
+            f"{self.tmpdir.name}/test.hdf5"
+        )
+
+        self.assertListEqual(words[:7], ["test"] * 4 + ["book"] * 2 + ["test"])
+        self.assertEqual(labels.count("positive"), 7)
+        self.assertEqual(len(test_activations), len(words))
+        # The second positive example is the second "test" of the first sentence
+        expected_activations = self.activations[0][:, 5, :].reshape((1, -1))
+        self.assertTrue(
+            torch.allclose(expected_activations, torch.FloatTensor(test_activations[1]))
+        )
@@ -146,3 +146,21 @@ class TestCreateSeqLabelingControlTaskDatasets(unittest.TestCase):
             200,
             msg="label distribution in the ct data roughly matches the label distribution in the training data",
         )
+
+    def test_seeded_labels_are_reproducible_across_shards(self):
+        """With a seed, every type gets the same label in every shard"""
+        [ct_tokens] = ct.create_sequence_labeling_dataset(
+            self.modulo_seven_dataset, sample_from="uniform", seed=13
+        )
+        [ct_tokens_shard] = ct.create_sequence_labeling_dataset(
+            {
+                "source": self.modulo_seven_dataset["source"][500:],
+                "target": self.modulo_seven_dataset["target"][500:],
+            },
+            sample_from="uniform",
+            seed=13,
+        )
+        self.assertEqual(ct_tokens["target"][500:], ct_tokens_shard["target"])
+
+        labels_flat = [l for sublist in ct_tokens["target"] for l in sublist]
+        self.assertEqual(set(labels_flat), {0, 1})
@@ -0,0 +1,136 @@
+import pickle
+import unittest
+
+from tempfile import TemporaryDirectory
+
+import h5py
+import numpy as np
+import torch
+
+from neurox.data import loader
+from neurox.data.converter import convert_activations
+
+
+class TestConvertActivations(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+
+        self.num_layers = 3
+        self.num_neurons_per_layer = 4
+        self.sentence_lengths = [3, 1, 5, 2]
+
+        rng = np.random.RandomState(0)
+        # [NUM_LAYERS x NUM_SENTENCES x LEN x NUM_NEURONS_PER_LAYER]
+        self.layer_activations = [
+            [
+                rng.randn(length, self.num_neurons_per_layer).astype(np.float32)
+                for length in self.sentence_lengths
+            ]
+            for _ in range(self.num_layers)
+        ]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assertSameActivations(self, input_path, output_path):
+        expected_activations, expected_num_layers = loader.load_activations(
+            input_path, num_neurons_per_layer=self.num_neurons_per_layer
+        )
+        activations, num_layers = loader.load_activations(output_path)
+
+        self.assertEqual(num_layers, expected_num_layers)
+        self.assertEqual(len(activations), len(expected_activations))
+        for sentence_acts, expected_sentence_acts in zip(
+            activations, expected_activations
+        ):
+            np.testing.assert_array_equal(
+                sentence_acts, np.asarray(expected_sentence_acts)
+            )
+
+    def test_convert_pt_activations(self):
+        "Conversion of pt activations"
+        input_path = f"{self.tmpdir.name}/activations.pt"
+        output_path = f"{self.tmpdir.name}/activations.hdf5"
+        torch.save(
+            [
+                [
+                    [
+                        torch.from_numpy(layer[sentence_idx][token_idx])
+                        for layer in self.layer_activations
+                    ]
+                    for token_idx in range(length)
+                ]
+                for sentence_idx, length in enumerate(self.sentence_lengths)
+            ],
+            input_path,
+        )
+
+        num_layers = convert_activations(
+            input_path,
+            output_path,
+            num_neurons_per_layer=self.num_neurons_per_layer,
+            batch_size=4,
+        )
+
+        self.assertEqual(num_layers, self.num_layers)
+        self.assertSameActivations(input_path, output_path)
+        with h5py.File(output_path, "r") as hdf5_file:
+            self.assertListEqual(
+                hdf5_file["sentence_offsets"][()].tolist(), [0, 3, 4, 9, 11]
+            )
+
+    def test_convert_acts_activations(self):
+        "Conversion of pickled acts activations"
+        input_path = f"{self.tmpdir.name}/activations.acts"
+        output_path = f"{self.tmpdir.name}/activations.hdf5"
+        with open(input_path, "wb") as activations_file:
+            pickle.dump(
+                [
+                    (
+                        f"layer{layer_idx}",
+                        [list(sentence_acts) for sentence_acts in layer],
+                    )
+                    for layer_idx, layer in enumerate(self.layer_activations)
+                ],
+                activations_file,
+            )
+
+        convert_activations(
+            input_path, output_path, num_neurons_per_layer=self.num_neurons_per_layer
+        )
+
+        self.assertSameActivations(input_path, output_path)
+
+    def test_convert_activations_dtype(self):
+        "Conversion to half-precision activations"
+        input_path = f"{self.tmpdir.name}/activations.pt"
+        output_path = f"{self.tmpdir.name}/activations.hdf5"
+        torch.save(
+            [
+                [
+                    [torch.ones(self.num_neurons_per_layer)] * self.num_layers
+                    for _ in range(length)
+                ]
+                for length in self.sentence_lengths
+            ],
+            input_path,
+        )
+
+        convert_activations(
+            input_path,
+            output_path,
+            num_neurons_per_layer=self.num_neurons_per_layer,
+            dtype="float16",
+        )
+
+        activations, _ = loader.load_activations(output_path)
+        self.assertEqual(activations[0].dtype, np.float16)
+
+    def test_convert_activations_wrong_extension(self):
+        "Conversion to a non-hdf5 output file"
+        self.assertRaises(
+            ValueError,
+            convert_activations,
+            f"{self.tmpdir.name}/activations.pt",
+            f"{self.tmpdir.name}/activations.json",
+        )
@@ -0,0 +1,97 @@
+import unittest
+
+import neurox.data.representations as representations
+import numpy as np
+import torch
+
+
+class TestBPEAggregation(unittest.TestCase):
+    def setUp(self):
+        self.tokens = {
+            "source": [["Hello", "world"], ["unbelievable", "!"]],
+            "source_aux": [["Hel@@", "lo", "world"], ["un@@", "believ@@", "able", "!"]],
+        }
+        self.activations = [torch.rand((3, 6)), torch.rand((4, 6))]
+
+    def test_bpe_get_avg_activations(self):
+        "Subwords are averaged per word"
+        all_activations = representations.bpe_get_avg_activations(
+            self.tokens, self.activations, num_workers=2
+        )
+
+        np.testing.assert_allclose(
+            all_activations[0],
+            np.stack([self.activations[0][:2].mean(dim=0), self.activations[0][2]]),
+            rtol=1e-6,
+        )
+        np.testing.assert_allclose(
+            all_activations[1],
+            np.stack([self.activations[1][:3].mean(dim=0), self.activations[1][3]]),
+            rtol=1e-6,
+        )
+
+    def test_bpe_get_last_activations(self):
+        "Forward activations of the last and backward of the first subword"
+        all_activations = representations.bpe_get_last_activations(
+            self.tokens, self.activations
+        )
+
+        expected = np.concatenate(
+            [self.activations[1][[2, 3], :3], self.activations[1][[0, 3], 3:]], axis=1
+        )
+        np.testing.assert_allclose(all_activations[1], expected)
+
+        all_activations = representations.bpe_get_last_activations(
+            self.tokens, self.activations, is_brnn=False
+        )
+        np.testing.assert_allclose(all_activations[1], self.activations[1][[2, 3]])
+
+    def test_bpe_empty_sentence(self):
+        "Empty sentences are aggregated to empty activations"
+        tokens = {
+            "source": self.tokens["source"] + [[]],
+            "source_aux": self.tokens["source_aux"] + [[]],
+        }
+        activations = self.activations + [torch.rand((0, 6))]
+
+        for all_activations in [
+            representations.bpe_get_avg_activations(tokens, activations),
+            representations.bpe_get_last_activations(tokens, activations),
+            representations.bpe_get_last_activations(
+                tokens, activations, is_brnn=False
+            ),
+        ]:
+            self.assertEqual(len(all_activations), 3)
+            self.assertEqual(all_activations[2].shape, (0, 6))
+
+
+class TestCharAggregation(unittest.TestCase):
+    def setUp(self):
+        self.tokens = {
+            "source": [["ab", "c", "def"]],
+            "source_aux": [list("ab_c_def")],
+        }
+        self.activations = [torch.rand((8, 4))]
+
+    def test_char_get_avg_activations(self):
+        "Characters are averaged per word, ignoring separators"
+        all_activations = representations.char_get_avg_activations(
+            self.tokens, self.activations
+        )
+
+        expected = np.stack(
+            [
+                self.activations[0][0:2].mean(dim=0),
+                self.activations[0][3],
+                self.activations[0][5:8].mean(dim=0),
+            ]
+        )
+        np.testing.assert_allclose(all_activations[0], expected, rtol=1e-6)
+
+    def test_char_get_last_activations(self):
+        "Last characters of every word"
+        all_activations = representations.char_get_last_activations(
+            self.tokens, self.activations, is_brnn=False
+        )
+
+        np.testing.assert_allclose(all_activations[0], self.activations[0][[1, 3, 7]])
@@ -486,3 +486,113 @@ class TestDecompositionAndFiltering(unittest.TestCase):
                 self.assertTrue(
                     torch.allclose(curr_saved_activations, curr_expected_activations)
                 )
+
+
+class TestWriteBatch(unittest.TestCase):
+    def setUp(self):
+        self.num_layers = 13
+        self.tmpdir = TemporaryDirectory()
+
+        self.words = ["This", "is", "a", "sentence", "with", "words"]
+        self.expected_activations = torch.rand((self.num_layers, len(self.words), 32))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_batches(self, writer, batch_size=4):
+        for start_idx in range(0, len(self.words), batch_size):
+            writer.write_batch(
+                start_idx,
+                self.words[start_idx : start_idx + batch_size],
+                self.expected_activations[:, start_idx : start_idx + batch_size, :],
+            )
+        writer.close()
+
+    def test_write_batch_hdf5(self):
+        "Batches are stored contiguously and loaded as single word sentences"
+        output_file = f"{self.tmpdir.name}/somename.hdf5"
+        self.write_batches(ActivationsWriter.get_writer(output_file))
+
+        with h5py.File(output_file, "r") as saved_activations:
+            self.assertListEqual(
+                sorted(saved_activations.keys()), ["activations", "sentence_offsets"]
+            )
+            self.assertEqual(
+                saved_activations["activations"].shape,
+                (len(self.words), self.num_layers, 32),
+            )
+
+        saved_activations, num_layers = loader.load_activations(output_file)
+        self.assertEqual(self.num_layers, num_layers)
+        self.assertEqual(len(saved_activations), len(self.words))
+        for word_idx, word_activations in enumerate(saved_activations):
+            self.assertTrue(
+                torch.equal(
+                    torch.FloatTensor(word_activations),
+                    self.expected_activations[:, [word_idx], :]
+                    .swapaxes(0, 1)
+                    .reshape(1, -1),
+                )
+            )
+
+    def test_write_batch_json(self):
+        "Batches give the same json output as single word sentences"
+        output_file = f"{self.tmpdir.name}/somename.json"
+        expected_output_file = f"{self.tmpdir.name}/expected.json"
+        self.write_batches(ActivationsWriter.get_writer(output_file))
+
+        writer = ActivationsWriter.get_writer(expected_output_file)
+        for word_idx, word in enumerate(self.words):
+            writer.write_activations(
+                word_idx, [word], self.expected_activations[:, [word_idx], :]
+            )
+        writer.close()
+
+        with open(output_file) as fp, open(expected_output_file) as expected_fp:
+            self.assertEqual(fp.read(), expected_fp.read())
+
+    def test_write_batch_decomposition_hdf5(self):
+        "Batches with filtered and decomposed layers"
+        output_file = f"{self.tmpdir.name}/somename.hdf5"
+        filter_layers = [5, 2]
+        self.write_batches(
+            ActivationsWriter.get_writer(
+                output_file,
+                decompose_layers=True,
+                filter_layers=",".join(map(str, filter_layers)),
+            )
+        )
+
+        for layer_idx in filter_layers:
+            saved_activations, num_layers = loader.load_activations(
+                f"{self.tmpdir.name}/somename-layer{layer_idx}.hdf5"
+            )
+            self.assertEqual(1, num_layers)
+            for word_idx, word_activations in enumerate(saved_activations):
+                self.assertTrue(
+                    torch.equal(
+                        torch.FloatTensor(word_activations),
+                        self.expected_activations[layer_idx, [word_idx], :],
+                    )
+                )
+
+    def test_write_batch_invalid(self):
+        "Batches out of order or mixed with single sentences"
+        writer = HDF5ActivationsWriter(f"{self.tmpdir.name}/somename.hdf5")
+        writer.write_batch(0, self.words[:2], self.expected_activations[:, :2, :])
+
+        self.assertRaises(
+            ValueError,
+            writer.write_batch,
+            3,
+            self.words[3:],
+            self.expected_activations[:, 3:, :],
+        )
+        self.assertRaises(
+            ValueError,
+            writer.write_activations,
+            2,
+            self.words[2:3],
+            self.expected_activations[:, 2:3, :],
+        )
+        writer.close()
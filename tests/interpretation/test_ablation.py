@@ -3,6 +3,7 @@ import unittest
 from unittest.mock import MagicMock, patch
 
 import neurox.interpretation.ablation as ablation
+import neurox.interpretation.linear_probe as linear_probe
 
 import numpy as np
 
@@ -173,6 +174,30 @@ class TestZeroOutActivationsRemoveNeurons(unittest.TestCase):
         np.testing.assert_array_almost_equal(filtered_activations, expected_activations)
 
 
+class TestCreateNeuronMasks(unittest.TestCase):
+    def test_create_neuron_masks(self):
+        "Masks match zeroed out activations"
+        activations = np.random.random((10, 20))
+        neuron_lists = [[0, 5, 7], [], np.arange(20)]
+
+        for mode, zero_out_fn in [
+            ("keep", ablation.zero_out_activations_keep_neurons),
+            ("remove", ablation.zero_out_activations_remove_neurons),
+        ]:
+            masks = ablation.create_neuron_masks(20, neuron_lists, mode=mode)
+            self.assertEqual(masks.shape, (3, 20))
+            for mask, neurons in zip(masks, neuron_lists):
+                np.testing.assert_array_equal(
+                    activations * mask, zero_out_fn(activations, neurons)
+                )
+
+    def test_create_neuron_masks_invalid_mode(self):
+        "Unknown masking mode"
+        self.assertRaises(
+            ValueError, ablation.create_neuron_masks, 20, [[0]], mode="filter"
+        )
+
+
 class TestFilterActivationsByLayers(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -235,6 +260,31 @@ class TestFilterActivationsByLayers(unittest.TestCase):
         )
         np.testing.assert_array_almost_equal(filtered_activations, expected_output)
 
+    def test_filter_activations_by_layers_view(self):
+        "Filter activations by contiguous layers (View)"
+
+        for selected_layers in [[2], [1, 2, 3]]:
+            filtered_activations = ablation.filter_activations_by_layers(
+                self.activations, selected_layers, self.num_layers
+            )
+            expected_output = np.concatenate(
+                [self.layer_activations[s_l] for s_l in selected_layers], axis=1
+            )
+            np.testing.assert_array_equal(filtered_activations, expected_output)
+            self.assertTrue(np.shares_memory(filtered_activations, self.activations))
+
+    def test_filter_activations_by_layers_unordered(self):
+        "Filter activations by layers (Unordered layers)"
+
+        selected_layers = [3, 0, 1]
+        filtered_activations = ablation.filter_activations_by_layers(
+            self.activations, selected_layers, self.num_layers
+        )
+        expected_output = np.concatenate(
+            [self.layer_activations[s_l] for s_l in selected_layers], axis=1
+        )
+        np.testing.assert_array_equal(filtered_activations, expected_output)
+
     def test_filter_activations_by_layers_bidi_forward(self):
         "Filter activations by layer (Bi-directional forward)"
 
@@ -306,3 +356,120 @@ class TestFilterActivationsByLayers(unittest.TestCase):
             axis=1,
         )
         np.testing.assert_array_almost_equal(filtered_activations, expected_output)
+
+
+class TestRunAblationSweep(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.num_examples = 40
+        cls.num_neurons = 20
+        cls.num_classes = 3
+
+        cls.X = np.random.random((cls.num_examples, cls.num_neurons)).astype(np.float32)
+        cls.y = np.concatenate(
+            (
+                np.arange(cls.num_classes),
+                np.random.randint(
+                    0, cls.num_classes, size=cls.num_examples - cls.num_classes
+                ),
+            )
+        )
+        cls.probe = linear_probe.train_logistic_regression_probe(
+            cls.X, cls.y, num_epochs=2
+        )
+        cls.ordering = np.random.permutation(cls.num_neurons).tolist()
+
+    def test_run_ablation_sweep(self):
+        "Sweep without retraining matches zeroed out activations"
+        results = ablation.run_ablation_sweep(
+            self.ordering, [5, 0.5], self.X, self.y, probe=self.probe, seed=0
+        )
+
+        # 2 sizes x 3 selections x 2 modes
+        self.assertEqual(len(results), 12)
+        for result in results:
+            self.assertFalse(result["retrained"])
+            if result["mode"] == "keep":
+                X = ablation.zero_out_activations_keep_neurons(
+                    self.X, result["neurons"]
+                )
+            else:
+                X = ablation.zero_out_activations_remove_neurons(
+                    self.X,
+                    np.setdiff1d(np.arange(self.num_neurons), result["neurons"]),
+                )
+            self.assertDictEqual(
+                result["scores"], linear_probe.evaluate_probe(self.probe, X, self.y)
+            )
+
+    def test_run_ablation_sweep_selections(self):
+        "Top and bottom neurons are taken from the ordering"
+        results = ablation.run_ablation_sweep(
+            self.ordering,
+            [5],
+            self.X,
+            self.y,
+            probe=self.probe,
+            selections=["top", "bottom"],
+            modes=["keep"],
+        )
+
+        self.assertListEqual(results[0]["neurons"].tolist(), sorted(self.ordering[:5]))
+        self.assertListEqual(results[1]["neurons"].tolist(), sorted(self.ordering[-5:]))
+
+    def test_run_ablation_sweep_retrain(self):
+        "Sweep with retraining in several processes"
+        results = ablation.run_ablation_sweep(
+            self.ordering,
+            [5],
+            self.X,
+            self.y,
+            X_train=self.X,
+            y_train=self.y,
+            retrain=True,
+            selections=["top", "random"],
+            num_workers=2,
+            train_kwargs={"num_epochs": 2},
+        )
+
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertTrue(result["retrained"])
+            self.assertIn("__OVERALL__", result["scores"])
+
+    def test_run_ablation_sweep_invalid(self):
+        "Sweeps without a probe or with too many neurons"
+        self.assertRaises(
+            ValueError, ablation.run_ablation_sweep, self.ordering, [5], self.X, self.y
+        )
+        self.assertRaises(
+            ValueError,
+            ablation.run_ablation_sweep,
+            self.ordering,
+            [self.num_neurons + 1],
+            self.X,
+            self.y,
+            probe=self.probe,
+        )
+
+    def test_run_ablation_sweep_retrain_without_neurons(self):
+        "Retraining is rejected for sweeps that keep no neurons"
+        for size, mode in [(0, "keep"), (1.0, "remove")]:
+            self.assertRaises(
+                ValueError,
+                ablation.run_ablation_sweep,
+                self.ordering,
+                [5, size],
+                self.X,
+                self.y,
+                X_train=self.X,
+                y_train=self.y,
+                retrain=True,
+                modes=[mode],
+            )
+
+        # Without retraining, keeping no neurons is a valid ablation
+        results = ablation.run_ablation_sweep(
+            self.ordering, [0], self.X, self.y, probe=self.probe, modes=["keep"]
+        )
+        self.assertEqual(len(results), 3)
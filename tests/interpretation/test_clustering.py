@@ -0,0 +1,129 @@
+import unittest
+
+import neurox.interpretation.clustering as clustering
+
+import numpy as np
+
+from scipy.spatial.distance import squareform
+
+
+class TestCreateCorrelationClusters(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # 30 neurons that are noisy copies of 3 underlying signals
+        signals = rng.randn(500, 3)
+        self.expected_groups = np.repeat(np.arange(3), 10)
+        self.X = (signals[:, self.expected_groups] + rng.randn(500, 30) * 0.1).astype(
+            np.float32
+        )
+        # Flip some neurons, which is ignored with absolute correlations
+        self.X[:, ::4] *= -1
+
+    def assertSameClusters(self, labels, expected_labels):
+        # Cluster ids may differ, but the partitions have to be the same
+        pairs = set(zip(labels.tolist(), expected_labels.tolist()))
+        self.assertEqual(len(pairs), len(set(labels.tolist())))
+        self.assertEqual(len(pairs), len(set(expected_labels.tolist())))
+
+    def test_condensed_dissimilarities(self):
+        "Blockwise dissimilarities match the full correlation matrix"
+        X = self.X.copy()
+        X[:, 7] = 1.0  # Constant neurons have zero correlation
+
+        corr = np.nan_to_num(np.corrcoef(X.T))
+        np.fill_diagonal(corr, 1)
+
+        for use_abs_correlation in [True, False]:
+            expected = 1 - (np.abs(corr) if use_abs_correlation else corr)
+            dissimilarities = clustering._get_condensed_dissimilarities(
+                X, use_abs_correlation, block_size=7, batch_size=64
+            )
+            np.testing.assert_allclose(
+                dissimilarities, squareform(expected, checks=False), atol=1e-5
+            )
+
+    def test_create_correlation_clusters(self):
+        "Correlated neurons are clustered together"
+        labels = clustering.create_correlation_clusters(
+            self.X, block_size=8, batch_size=100
+        )
+
+        self.assertSameClusters(labels, self.expected_groups)
+
+    def test_create_correlation_clusters_neighbors(self):
+        "Approximate neighbor based clustering finds the same clusters"
+        labels = clustering.create_correlation_clusters(
+            self.X, num_neighbors=5, block_size=8, batch_size=100
+        )
+
+        self.assertEqual(labels.min(), 1)
+        self.assertSameClusters(labels, self.expected_groups)
+
+    def test_create_correlation_clusters_accumulator(self):
+        "Clusters from accumulated statistics match clusters from activations"
+        accumulator = clustering.CorrelationAccumulator.from_chunks(
+            self.X[i : i + 64] for i in range(0, 500, 64)
+        )
+
+        np.testing.assert_array_equal(
+            clustering.create_correlation_clusters(accumulator),
+            clustering.create_correlation_clusters(self.X),
+        )
+        _, clusters = clustering.scikit_extract_independent_neurons(accumulator)
+        _, expected_clusters = clustering.scikit_extract_independent_neurons(
+            self.X.astype(np.float64)
+        )
+        np.testing.assert_array_equal(clusters, expected_clusters)
+
+
+class TestCorrelationAccumulator(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.X = rng.randn(200, 6) * 3 + 100
+        self.X[:, 1] += self.X[:, 0]
+
+    def test_correlation(self):
+        "Correlations from chunks match correlations of all data"
+        accumulator = clustering.CorrelationAccumulator()
+        for start in range(0, 200, 30):
+            accumulator.update(self.X[start : start + 30])
+
+        self.assertEqual(accumulator.num_tokens, 200)
+        np.testing.assert_allclose(accumulator.means, self.X.mean(axis=0))
+        np.testing.assert_allclose(
+            accumulator.covariance(), np.cov(self.X, rowvar=False)
+        )
+        np.testing.assert_allclose(
+            accumulator.correlation(), np.corrcoef(self.X, rowvar=False)
+        )
+
+    def test_merge(self):
+        "Merged shards give the same statistics as a single accumulator"
+        shards = [
+            clustering.CorrelationAccumulator.from_chunks([self.X[:50]]),
+            clustering.CorrelationAccumulator.from_chunks([self.X[50:120]]),
+            clustering.CorrelationAccumulator(num_neurons=6),
+            clustering.CorrelationAccumulator.from_chunks([self.X[120:]]),
+        ]
+        merged = clustering.CorrelationAccumulator()
+        for shard in shards:
+            merged.merge(shard)
+
+        np.testing.assert_allclose(
+            merged.correlation(), np.corrcoef(self.X, rowvar=False)
+        )
+
+    def test_update_wrong_number_of_neurons(self):
+        "Chunks with a different number of neurons are rejected"
+        accumulator = clustering.CorrelationAccumulator().update(self.X)
+
+        self.assertRaises(ValueError, accumulator.update, self.X[:, :3])
+
+    def test_constant_neurons(self):
+        "Constant neurons have zero correlation with other neurons"
+        self.X[:, 2] = 1.0
+        accumulator = clustering.CorrelationAccumulator().update(self.X)
+
+        correlations = accumulator.correlation()
+        self.assertTrue(np.all(correlations[2, [0, 1, 3, 4, 5]] == 0))
+        self.assertEqual(correlations[2, 2], 1)
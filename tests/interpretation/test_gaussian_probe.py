@@ -4,7 +4,13 @@ import unittest
 import numpy as np
 import torch
 
-from neurox.interpretation.gaussian_probe import get_neuron_ordering, train_probe
+from neurox.interpretation.gaussian_probe import (
+    evaluate_probe,
+    evaluate_probe_streaming,
+    get_neuron_ordering,
+    train_probe,
+    train_probe_streaming,
+)
 
 
 class TestGetNeuronOrdering(unittest.TestCase):
@@ -28,3 +34,128 @@ class TestGetNeuronOrdering(unittest.TestCase):
         probe = train_probe(X, y)
         selected_neurons = get_neuron_ordering(probe, 3)
         self.assertListEqual(list(selected_neurons), expected_neuron_order)
+
+    def test_get_neuron_ordering_matches_greedy_selection(self):
+        "Incremental selection matches refitting the probe for every candidate"
+        rng = np.random.RandomState(0)
+        y = rng.randint(0, 3, size=200)
+        X = rng.randn(200, 12) + y[:, None] * rng.randn(1, 12) * 0.5
+        probe = train_probe(X, y)
+
+        expected_neuron_order = []
+        for _ in range(5):
+            best_neuron, best_mi = -1, float("-inf")
+            for neuron in range(X.shape[1]):
+                if neuron in expected_neuron_order:
+                    continue
+                probe._get_distributions(expected_neuron_order + [neuron])
+                probe._compute_probs(expected_neuron_order + [neuron], "train")
+                _, _, _, mi, _ = probe._predict("train")
+                if mi > best_mi:
+                    best_neuron, best_mi = neuron, mi
+            expected_neuron_order.append(best_neuron)
+
+        selected_neurons = get_neuron_ordering(probe, 5, batch_size=64)
+        self.assertListEqual(selected_neurons, expected_neuron_order)
+
+
+class TestTrainProbeStreaming(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.y = rng.randint(0, 3, size=300)
+        self.X = (
+            rng.randn(300, 10) * 2 + 50 + self.y[:, None] * rng.randn(1, 10)
+        ).astype(np.float32)
+        self.chunks = [
+            (self.X[start : start + 64], self.y[start : start + 64])
+            for start in range(0, 300, 64)
+        ]
+
+    def test_train_probe_streaming(self):
+        "Probe trained on chunks matches probe trained on all data"
+        probe = train_probe(self.X, self.y)
+        streamed_probe = train_probe_streaming(iter(self.chunks))
+
+        self.assertFalse(hasattr(streamed_probe, "train_features"))
+        self.assertTrue(torch.allclose(probe.mu_star, streamed_probe.mu_star))
+        self.assertTrue(torch.allclose(probe.sigma_star, streamed_probe.sigma_star))
+        self.assertTrue(
+            torch.allclose(probe.train_categorical, streamed_probe.train_categorical)
+        )
+
+    def test_evaluate_probe_streaming(self):
+        "Streaming evaluation matches evaluation on all data"
+        probe = train_probe(self.X, self.y)
+
+        preds, score = evaluate_probe(probe, self.X, self.y, return_predictions=True)
+        streamed_preds, streamed_score = evaluate_probe_streaming(
+            probe, iter(self.chunks), return_predictions=True
+        )
+
+        self.assertEqual(score, streamed_score)
+        self.assertTrue(torch.equal(preds, streamed_preds))
+
+    def test_get_neuron_ordering_streaming(self):
+        "Neurons of a streamed probe are selected on the given chunks"
+        probe = train_probe(self.X, self.y)
+        streamed_probe = train_probe_streaming(self.chunks)
+
+        self.assertRaises(ValueError, get_neuron_ordering, streamed_probe, 3)
+        self.assertListEqual(
+            get_neuron_ordering(streamed_probe, 3, chunks=self.chunks),
+            get_neuron_ordering(probe, 3),
+        )
+        # Chunks can also be streamed from a function that is called once per
+        # selected neuron, while one-shot iterators are rejected
+        self.assertListEqual(
+            get_neuron_ordering(streamed_probe, 3, chunks=lambda: iter(self.chunks)),
+            get_neuron_ordering(probe, 3),
+        )
+        self.assertRaises(
+            ValueError,
+            get_neuron_ordering,
+            streamed_probe,
+            3,
+            chunks=iter(self.chunks),
+        )
+
+
+class TestComputeLogProbs(unittest.TestCase):
+    def test_compute_log_probs(self):
+        "Batched log probabilities match per-class multivariate normals"
+        rng = np.random.RandomState(0)
+        y = rng.randint(0, 3, size=100)
+        X = rng.randn(100, 8) + y[:, None] * rng.randn(1, 8)
+        probe = train_probe(X, y)
+        selected_neurons = [5, 1, 2]
+
+        log_probs = probe._compute_log_probs(
+            probe.train_features, selected_neurons, batch_size=16
+        )
+
+        for label in range(3):
+            distribution = torch.distributions.MultivariateNormal(
+                probe.mu_star[label, selected_neurons],
+                probe.sigma_star[label, selected_neurons][:, selected_neurons],
+            )
+            expected_log_probs = (
+                distribution.log_prob(probe.train_features[:, selected_neurons])
+                + probe.train_categorical[label].log()
+            )
+            self.assertTrue(torch.allclose(log_probs[:, label], expected_log_probs))
+
+
+class TestTrainProbe(unittest.TestCase):
+    def test_train_probe_empty_class(self):
+        "Classes without training data are rejected"
+        rng = np.random.RandomState(0)
+        X = rng.randn(20, 4)
+        y = np.array([0, 2] * 10)
+
+        self.assertRaisesRegex(ValueError, r"\[1\]", train_probe, X, y)
+        self.assertRaisesRegex(
+            ValueError,
+            r"\[1\]",
+            train_probe_streaming,
+            [(X[:10], y[:10]), (X[10:], y[10:])],
+        )
@@ -6,6 +6,8 @@ import neurox.interpretation.iou_probe as iou_probe
 import numpy as np
 import torch
 
+from sklearn.metrics import average_precision_score
+
 
 class TestGetNeuronOrdering(unittest.TestCase):
     def test_get_neuron_ordering(self):
@@ -20,3 +22,34 @@ class TestGetNeuronOrdering(unittest.TestCase):
         ordering = iou_probe.get_neuron_ordering(X, y)
 
         self.assertListEqual(list(ordering), expected_neuron_order)
+
+    def test_get_neuron_ordering_matches_average_precision(self):
+        "Ranking matches per-neuron average precision from sklearn"
+        rng = np.random.RandomState(0)
+        y = rng.randint(0, 2, size=500)
+        X = rng.randn(500, 40) + y[:, None] * rng.randn(1, 40)
+        # Introduce ties in activation values
+        X[:, :10] = np.round(X[:, :10])
+
+        thresholded_X = X.copy()
+        thresholded_X[np.abs(thresholded_X) < 0.05] = 0
+        expected_scores = np.array(
+            [average_precision_score(y, thresholded_X[:, i]) for i in range(40)]
+        )
+        np.testing.assert_allclose(
+            iou_probe._average_precision(thresholded_X, y == 1), expected_scores
+        )
+
+        original_X = X.copy()
+        ordering = iou_probe.get_neuron_ordering(X, y, block_size=16, num_workers=2)
+
+        self.assertListEqual(list(ordering), list(np.argsort(expected_scores)[::-1]))
+        # Input is not modified
+        np.testing.assert_array_equal(X, original_X)
+
+    def test_get_neuron_ordering_multiclass_labels(self):
+        "Labels other than 0 and 1 are rejected"
+        X = np.random.randn(6, 3)
+        y = np.array([0, 1, 2, 0, 1, 2])
+
+        self.assertRaises(ValueError, iou_probe.get_neuron_ordering, X, y)
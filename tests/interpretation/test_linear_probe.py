@@ -4,6 +4,7 @@ import unittest
 from unittest.mock import ANY, MagicMock, patch
 
 import neurox.interpretation.linear_probe as linear_probe
+import neurox.interpretation.metrics as metrics
 
 import numpy as np
 import torch
@@ -138,6 +139,91 @@ class TestTrainProbe(unittest.TestCase):
 
         self.assertEqual(optimizer_step_fn.call_count, 10)
 
+    @patch("torch.optim.Adam.step")
+    def test_train_probe_early_stopping(self, optimizer_step_fn):
+        "Training stops once the validation score does not improve"
+        # Adam.step is mocked, so the validation score never improves after
+        # the first epoch
+        linear_probe._train_probe(
+            self.X,
+            self.y_classification,
+            "classification",
+            num_epochs=10,
+            X_dev=self.X,
+            y_dev=self.y_classification,
+            patience=2,
+        )
+
+        self.assertEqual(optimizer_step_fn.call_count, 3)
+
+    def test_train_probe_early_stopping_without_validation(self):
+        "Early stopping requires validation data"
+        self.assertRaises(
+            ValueError,
+            linear_probe._train_probe,
+            self.X,
+            self.y_classification,
+            "classification",
+            patience=2,
+        )
+
+    def test_train_probe_partial_validation_data(self):
+        "Validation requires both validation inputs and labels"
+        self.assertRaises(
+            ValueError,
+            linear_probe._train_probe,
+            self.X,
+            self.y_classification,
+            "classification",
+            X_dev=self.X,
+        )
+
+    def test_train_probe_restores_best_checkpoint(self):
+        "The probe from the epoch with the best validation score is returned"
+        scores = []
+        probe = linear_probe._train_probe(
+            self.X,
+            self.y_regression,
+            "regression",
+            num_epochs=5,
+            learning_rate=0.1,
+            X_dev=self.X,
+            y_dev=self.y_regression,
+            metric="pearson",
+            epoch_callback=lambda stats: scores.append(stats["score"]),
+        )
+
+        final_score = metrics.compute_score(
+            linear_probe._predict(probe, self.X), self.y_regression, "pearson"
+        )
+        self.assertAlmostEqual(final_score, max(scores), places=5)
+
+    def test_train_probe_epoch_callback(self):
+        "Epoch callback receives training statistics and can stop training"
+        stats = []
+
+        def callback(epoch_stats):
+            stats.append(epoch_stats)
+            return epoch_stats["epoch"] == 3
+
+        linear_probe._train_probe(
+            self.X,
+            self.y_classification,
+            "classification",
+            num_epochs=10,
+            lr_scheduler=lambda opt: torch.optim.lr_scheduler.StepLR(
+                opt, step_size=1, gamma=0.5
+            ),
+            epoch_callback=callback,
+        )
+
+        self.assertEqual(len(stats), 3)
+        self.assertEqual([s["epoch"] for s in stats], [1, 2, 3])
+        self.assertEqual(stats[0]["num_tokens"], self.num_examples)
+        self.assertGreater(stats[0]["tokens_per_second"], 0)
+        self.assertIsNone(stats[0]["score"])
+        self.assertAlmostEqual(stats[1]["learning_rate"], 0.0005)
+
 
 class TestEvaluateProbe(unittest.TestCase):
     @classmethod
@@ -234,6 +320,155 @@ class TestEvaluateProbe(unittest.TestCase):
         )
         self.assertNotEqual([p[1] for p in predictions], list(y_true))
 
+    def test_evaluate_probe_class_scores(self):
+        "Per-class scores match the accuracy over each class's instances"
+
+        X = np.random.random((self.num_examples, self.num_features)).astype(np.float32)
+        y_true = np.random.randint(0, self.num_classes, size=self.num_examples)
+        idx_to_class = {0: "class0", 1: "class1", 2: "class2", 3: "class3"}
+        scores, predictions = linear_probe.evaluate_probe(
+            self.trained_probe,
+            X,
+            y_true,
+            idx_to_class=idx_to_class,
+            return_predictions=True,
+            batch_size=3,
+        )
+
+        name_to_idx = {v: k for k, v in idx_to_class.items()}
+        y_pred = np.array([name_to_idx[p[1]] for p in predictions])
+        for class_idx, class_name in idx_to_class.items():
+            class_instances = y_true == class_idx
+            if class_instances.sum() == 0:
+                # Classes without any instances get a score of 0
+                self.assertEqual(scores[class_name], 0)
+            else:
+                self.assertAlmostEqual(
+                    scores[class_name],
+                    (y_pred[class_instances] == class_idx).mean(),
+                )
+        self.assertListEqual([p[2] for p in predictions], list(y_pred == y_true))
+
+    def test_evaluate_probe_with_source_tokens(self):
+        "Probe evaluation with predictions paired with source tokens"
+
+        source_tokens = [["a", "b", "c"], ["d", "e", "f", "g"], ["h", "i", "j"]]
+        scores, predictions = linear_probe.evaluate_probe(
+            self.trained_probe,
+            np.random.random((self.num_examples, self.num_features)).astype(np.float32),
+            np.random.randint(0, self.num_classes, size=self.num_examples),
+            return_predictions=True,
+            source_tokens=source_tokens,
+        )
+        self.assertListEqual(
+            [p[0] for p in predictions], [t for s in source_tokens for t in s]
+        )
+
+
+class TestEvaluateProbeWithMasks(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.num_examples = 30
+        cls.num_features = 20
+        cls.num_classes = 3
+
+        cls.X = np.random.random((cls.num_examples, cls.num_features)).astype(
+            np.float32
+        )
+        cls.y_classification = np.concatenate(
+            (
+                np.arange(cls.num_classes),
+                np.random.randint(
+                    0, cls.num_classes, size=cls.num_examples - cls.num_classes
+                ),
+            )
+        )
+        cls.y_regression = np.random.random((cls.num_examples,)).astype(np.float32)
+
+        cls.trained_probe = linear_probe._train_probe(
+            cls.X, cls.y_classification, "classification"
+        )
+        cls.trained_regression_probe = linear_probe._train_probe(
+            cls.X, cls.y_regression, "regression"
+        )
+
+        cls.masks = np.random.random((5, cls.num_features)) > 0.5
+
+    def test_evaluate_probe_with_masks(self):
+        "Masked evaluation matches evaluation on zeroed out activations"
+        idx_to_class = {0: "class0", 1: "class1", 2: "class2"}
+
+        mask_scores = linear_probe.evaluate_probe_with_masks(
+            self.trained_probe,
+            self.X,
+            self.y_classification,
+            self.masks,
+            idx_to_class=idx_to_class,
+            batch_size=7,
+        )
+
+        self.assertEqual(len(mask_scores), self.masks.shape[0])
+        for scores, mask in zip(mask_scores, self.masks):
+            expected_scores = linear_probe.evaluate_probe(
+                self.trained_probe,
+                self.X * mask,
+                self.y_classification,
+                idx_to_class=idx_to_class,
+            )
+            self.assertDictEqual(scores, expected_scores)
+
+    def test_evaluate_regression_probe_with_masks(self):
+        "Masked evaluation of regression probes"
+        mask_scores = linear_probe.evaluate_probe_with_masks(
+            self.trained_regression_probe,
+            self.X,
+            self.y_regression,
+            self.masks,
+            metric="pearson",
+        )
+
+        for scores, mask in zip(mask_scores, self.masks):
+            expected_scores = linear_probe.evaluate_probe(
+                self.trained_regression_probe,
+                self.X * mask,
+                self.y_regression,
+                metric="pearson",
+            )
+            self.assertAlmostEqual(
+                scores["__OVERALL__"], expected_scores["__OVERALL__"], places=5
+            )
+
+    def test_evaluate_neuron_subset_probes(self):
+        "Probes on neuron subsets match evaluation on filtered activations"
+        neuron_lists = [[0, 3, 5], [19, 2], list(range(self.num_features))]
+        probes = [
+            linear_probe._train_probe(
+                self.X[:, neurons], self.y_classification, "classification"
+            )
+            for neurons in neuron_lists
+        ]
+
+        probe_scores = linear_probe.evaluate_neuron_subset_probes(
+            probes, neuron_lists, self.X, self.y_classification, batch_size=7
+        )
+
+        for scores, probe, neurons in zip(probe_scores, probes, neuron_lists):
+            expected_scores = linear_probe.evaluate_probe(
+                probe, self.X[:, neurons], self.y_classification
+            )
+            self.assertDictEqual(scores, expected_scores)
+
+    def test_evaluate_probe_with_invalid_masks(self):
+        "Masks with the wrong number of neurons"
+        self.assertRaises(
+            ValueError,
+            linear_probe.evaluate_probe_with_masks,
+            self.trained_probe,
+            self.X,
+            self.y_classification,
+            self.masks[:, :5],
+        )
+
 
 class TestGetTopNeurons(unittest.TestCase):
     @patch("neurox.interpretation.linear_probe.LinearProbe")
@@ -383,6 +618,58 @@ class TestGetNeuronOrdering(unittest.TestCase):
 
         self.assertListEqual(ordering, expected_neuron_order)
 
+    @patch("neurox.interpretation.linear_probe.LinearProbe")
+    def test_get_neuron_ordering_matches_top_neurons(self, probe_mock):
+        "Neuron ordering matches top neuron selection at every percentage"
+
+        search_stride = 20
+        mock_weight_matrix = torch.rand((4, 50))
+        mock_weight_matrix[:, :5] = 0
+        probe_mock.parameters.return_value = [mock_weight_matrix]
+        class_to_idx = {"class%d" % i: i for i in range(4)}
+
+        ordering, cutoffs = linear_probe.get_neuron_ordering(
+            probe_mock, class_to_idx, search_stride=search_stride
+        )
+
+        self.assertEqual(len(cutoffs), search_stride + 1)
+        for p, cutoff in enumerate(cutoffs):
+            top_neurons, _ = linear_probe.get_top_neurons(
+                probe_mock, p / search_stride, class_to_idx
+            )
+            self.assertSetEqual(set(ordering[:cutoff]), set(top_neurons.tolist()))
+
+    @patch("neurox.interpretation.linear_probe.LinearProbe")
+    def test_get_neuron_ordering_tied_weights(self, probe_mock):
+        "Neuron ordering matches top neuron selection for tied weights"
+
+        # Tied weights put the cumulative weight mass exactly on the
+        # percentage thresholds
+        search_stride = 10
+        mock_weight_matrix = torch.full((2, 10), 0.7)
+        mock_weight_matrix[1, :] = 0.3
+        mock_weight_matrix[1, 0] = 5
+        probe_mock.parameters.return_value = [mock_weight_matrix]
+        class_to_idx = {"class0": 0, "class1": 1}
+
+        ordering, cutoffs = linear_probe.get_neuron_ordering(
+            probe_mock, class_to_idx, search_stride=search_stride
+        )
+
+        expected_ordering, expected_cutoffs = [], []
+        for p in range(search_stride + 1):
+            top_neurons, _ = linear_probe.get_top_neurons(
+                probe_mock, p / search_stride, class_to_idx
+            )
+            expected_ordering += sorted(set(top_neurons) - set(expected_ordering))
+            expected_cutoffs.append(len(expected_ordering))
+
+        self.assertListEqual(cutoffs, expected_cutoffs)
+        for start, end in zip([0] + cutoffs[:-1], cutoffs):
+            self.assertSetEqual(
+                set(ordering[start:end]), set(expected_ordering[start:end])
+            )
+
 
 class TestGetNeuronOrderingGranular(unittest.TestCase):
     @patch("neurox.interpretation.linear_probe.LinearProbe")
@@ -446,6 +733,12 @@ class TestTrainClassificationProbe(unittest.TestCase):
             lambda_l2=ANY,
             learning_rate=ANY,
             num_epochs=ANY,
+            X_dev=ANY,
+            y_dev=ANY,
+            metric=ANY,
+            patience=ANY,
+            lr_scheduler=ANY,
+            epoch_callback=ANY,
         )
 
 
@@ -471,4 +764,113 @@ class TestTrainRegressionProbe(unittest.TestCase):
             lambda_l2=ANY,
             learning_rate=ANY,
             num_epochs=ANY,
+            X_dev=ANY,
+            y_dev=ANY,
+            metric=ANY,
+            patience=ANY,
+            lr_scheduler=ANY,
+            epoch_callback=ANY,
+        )
+
+
+class TestTrainLayerwiseProbes(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.num_examples = 20
+        cls.num_layers = 3
+        cls.num_neurons_per_layer = 10
+        cls.num_classes = 3
+
+        cls.X = np.random.random(
+            (cls.num_examples, cls.num_layers * cls.num_neurons_per_layer)
+        ).astype(np.float32)
+
+        # Ensure y has all class labels atleast once for classification
+        cls.y_classification = np.concatenate(
+            (
+                np.arange(cls.num_classes),
+                np.random.randint(
+                    0, cls.num_classes, size=cls.num_examples - cls.num_classes
+                ),
+            )
+        )
+        cls.y_regression = np.random.random((cls.num_examples)).astype(np.float32)
+
+    @patch("torch.optim.Adam.step")
+    def test_train_layerwise_probes_single_pass(self, optimizer_step_fn):
+        "Layer-wise probes share every optimization step"
+        num_epochs = 5
+
+        probes = linear_probe.train_layerwise_probes(
+            self.X, self.y_classification, self.num_layers, num_epochs=num_epochs
         )
+
+        self.assertEqual(optimizer_step_fn.call_count, num_epochs)
+        self.assertEqual(len(probes), self.num_layers)
+        for probe in probes:
+            self.assertIsInstance(probe, linear_probe.LinearProbe)
+            self.assertEqual(probe.linear.in_features, self.num_neurons_per_layer)
+            self.assertEqual(probe.linear.out_features, self.num_classes)
+
+    def test_train_layerwise_probes_invalid_num_layers(self):
+        "Layer-wise probes with indivisible number of layers"
+        self.assertRaises(
+            ValueError,
+            linear_probe.train_layerwise_probes,
+            self.X,
+            self.y_classification,
+            7,
+        )
+
+    def test_layerwise_probes_independent(self):
+        "Layer-wise probes only depend on their own layer"
+        probes = linear_probe.train_layerwise_probes(
+            self.X, self.y_classification, self.num_layers
+        )
+
+        # Only layer 1 changes, so layers 0 and 2 must have the same outputs
+        X = self.X.copy()
+        X[:, self.num_neurons_per_layer : 2 * self.num_neurons_per_layer] = 0
+        combined_probe = linear_probe.LayerwiseLinearProbe.from_layer_probes(probes)
+        with torch.no_grad():
+            original = combined_probe(torch.from_numpy(self.X))
+            modified = combined_probe(torch.from_numpy(X))
+        torch.testing.assert_close(original[:, 0], modified[:, 0])
+        torch.testing.assert_close(original[:, 2], modified[:, 2])
+
+    def test_evaluate_layerwise_probes(self):
+        "Layer-wise evaluation matches per-layer evaluation"
+        probes = linear_probe.train_layerwise_probes(
+            self.X, self.y_classification, self.num_layers
+        )
+        idx_to_class = {0: "class0", 1: "class1", 2: "class2"}
+
+        layer_scores = linear_probe.evaluate_layerwise_probes(
+            probes, self.X, self.y_classification, idx_to_class=idx_to_class
+        )
+
+        self.assertEqual(len(layer_scores), self.num_layers)
+        for layer, probe in enumerate(probes):
+            start = layer * self.num_neurons_per_layer
+            end = start + self.num_neurons_per_layer
+            expected_scores = linear_probe.evaluate_probe(
+                probe,
+                self.X[:, start:end],
+                self.y_classification,
+                idx_to_class=idx_to_class,
+            )
+            self.assertDictEqual(layer_scores[layer], expected_scores)
+
+    def test_evaluate_layerwise_regression_probes(self):
+        "Layer-wise regression probes"
+        probes = linear_probe.train_layerwise_probes(
+            self.X, self.y_regression, self.num_layers, task_type="regression"
+        )
+
+        layer_scores = linear_probe.evaluate_layerwise_probes(
+            probes, self.X, self.y_regression, metric="pearson"
+        )
+
+        self.assertEqual(len(layer_scores), self.num_layers)
+        for scores in layer_scores:
+            self.assertIn("__OVERALL__", scores)
@@ -0,0 +1,91 @@
+import unittest
+
+import neurox.interpretation.probeless as probeless
+
+import numpy as np
+
+
+class TestGetMeanVectors(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.X = rng.randn(50, 8).astype(np.float32)
+        self.y = rng.randint(0, 4, size=50)
+
+    def test_get_mean_vectors(self):
+        "Mean vectors of every class in order of first appearance"
+        mean_vectors = probeless.get_mean_vectors(self.X, self.y, batch_size=7)
+
+        expected_labels = list(dict.fromkeys(self.y.tolist()))
+        self.assertListEqual(list(mean_vectors.keys()), expected_labels)
+        for label, mean_vector in mean_vectors.items():
+            self.assertEqual(mean_vector.dtype, np.float32)
+            np.testing.assert_allclose(
+                mean_vector, self.X[self.y == label].mean(axis=0), rtol=1e-5
+            )
+
+    def test_get_mean_vectors_from_chunks(self):
+        "Mean vectors from streamed chunks match mean vectors from all data"
+        chunks = ((self.X[i : i + 10], self.y[i : i + 10]) for i in range(0, 50, 10))
+        mean_vectors = probeless.get_mean_vectors_from_chunks(chunks)
+        expected_mean_vectors = probeless.get_mean_vectors(self.X, self.y)
+
+        self.assertListEqual(
+            list(mean_vectors.keys()), list(expected_mean_vectors.keys())
+        )
+        for label in mean_vectors:
+            np.testing.assert_allclose(
+                mean_vectors[label], expected_mean_vectors[label], rtol=1e-5
+            )
+
+    def test_get_neuron_ordering_with_mean_vectors(self):
+        "Precomputed mean vectors give the same rankings as the data"
+        mean_vectors = probeless.get_mean_vectors(self.X, self.y)
+        idx2label = {idx: "tag%d" % idx for idx in range(4)}
+        label2idx = {label: idx for idx, label in idx2label.items()}
+
+        self.assertListEqual(
+            probeless.get_neuron_ordering(None, None, mean_vectors=mean_vectors),
+            probeless.get_neuron_ordering(self.X, self.y),
+        )
+        self.assertListEqual(
+            probeless.get_neuron_ordering_for_tag(
+                None, None, label2idx, "tag1", mean_vectors=mean_vectors
+            ),
+            probeless.get_neuron_ordering_for_tag(self.X, self.y, label2idx, "tag1"),
+        )
+        self.assertEqual(
+            probeless.get_neuron_ordering_for_all_tags(
+                None, None, idx2label, mean_vectors=mean_vectors
+            ),
+            probeless.get_neuron_ordering_for_all_tags(self.X, self.y, idx2label),
+        )
+
+
+class TestGetPairwiseDistanceSums(unittest.TestCase):
+    def test_get_pairwise_distance_sums(self):
+        "Per-class sums of absolute mean differences match all pairs"
+        rng = np.random.RandomState(0)
+        mean_vectors = rng.randn(6, 10)
+        # Introduce ties between classes
+        mean_vectors[3, :5] = mean_vectors[1, :5]
+
+        expected_sums = np.array(
+            [
+                np.sum([np.abs(qz - qzz) for qzz in mean_vectors], axis=0)
+                for qz in mean_vectors
+            ]
+        )
+
+        np.testing.assert_allclose(
+            probeless._get_pairwise_distance_sums(mean_vectors), expected_sums
+        )
+
+    def test_get_overall_ranking(self):
+        "Overall ranking orders neurons by the sum of pairwise differences"
+        mean_vectors = [
+            np.array([0.0, 1.0, 0.0]),
+            np.array([0.0, -1.0, 0.5]),
+            np.array([0.1, 0.0, 0.0]),
+        ]
+
+        self.assertListEqual(probeless._get_overall_ranking(mean_vectors), [1, 2, 0])
@@ -1,11 +1,14 @@
 import unittest
 
+from tempfile import TemporaryDirectory
 from unittest.mock import MagicMock, patch
 
+import h5py
+
 import neurox.interpretation.linear_probe as linear_probe
 import neurox.interpretation.utils as utils
-
 import numpy as np
+import torch
 
 
 class TestIsNotebook(unittest.TestCase):
@@ -370,3 +373,133 @@ class TestBalanceMultiClassData(unittest.TestCase):
                 if found:
                     break
             self.assertTrue(found)
+
+
+class TestGetBalancedIndices(unittest.TestCase):
+    def setUp(self):
+        self.y = np.concatenate((np.zeros((10,)), np.ones((20,)), np.ones((70,)) * 2))
+        np.random.shuffle(self.y)
+
+    def test_get_balanced_indices(self):
+        "Balanced indices are sorted and sample every class equally"
+        indices = utils.get_balanced_indices(self.y, random_state=0)
+
+        np.testing.assert_array_equal(indices, np.unique(indices))
+        self.assertListEqual(
+            np.bincount(self.y[indices].astype(int)).tolist(), [10] * 3
+        )
+        np.testing.assert_array_equal(
+            indices, utils.get_balanced_indices(self.y, random_state=0)
+        )
+
+    def test_get_balanced_indices_per_class(self):
+        "Classes with fewer instances than requested keep all instances"
+        indices = utils.get_balanced_indices(
+            self.y, num_instances_per_class={0: 20, 1: 5, 2: 30}
+        )
+
+        self.assertListEqual(
+            np.bincount(self.y[indices].astype(int)).tolist(), [10, 5, 30]
+        )
+
+    def test_balance_hdf5_data(self):
+        "Balance data stored in an hdf5 file"
+        X = np.random.random((100, 8)).astype(np.float32)
+
+        with TemporaryDirectory() as tmpdir:
+            with h5py.File(f"{tmpdir}/activations.hdf5", "w") as f:
+                f.create_dataset("activations", data=X)
+            with h5py.File(f"{tmpdir}/activations.hdf5", "r") as f:
+                balanced_X, balanced_y = utils.balance_multi_class_data(
+                    f["activations"], self.y, random_state=0
+                )
+
+        expected_X, expected_y = utils.balance_multi_class_data(
+            X, self.y, random_state=0
+        )
+        np.testing.assert_array_equal(balanced_X, expected_X)
+        np.testing.assert_array_equal(balanced_y, expected_y)
+
+    def test_take_all_rows_hdf5_data(self):
+        "All rows of an hdf5 dataset are read into memory"
+        X = np.random.random((100, 8)).astype(np.float32)
+
+        with TemporaryDirectory() as tmpdir:
+            with h5py.File(f"{tmpdir}/activations.hdf5", "w") as f:
+                f.create_dataset("activations", data=X)
+            with h5py.File(f"{tmpdir}/activations.hdf5", "r") as f:
+                selected_X = utils._take_rows(
+                    f["activations"], np.arange(100), batch_size=30
+                )
+
+        self.assertIsInstance(selected_X, np.ndarray)
+        np.testing.assert_array_equal(selected_X, X)
+
+
+class TestSaveLoadProbe(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.probe = linear_probe.LinearProbe(20, 3)
+        self.mappings = [
+            {"class0": 0, "class1": 1, "class2": 2},
+            {0: "class0", 1: "class1", 2: "class2"},
+            {"a": 0, "b": 1},
+            {0: "a", 1: "b"},
+        ]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_save_load_probe(self):
+        "Saved probe and mappings are loaded back identically"
+        probe_path = f"{self.tmpdir.name}/probe.hdf5"
+        utils.save_probe(probe_path, self.probe, self.mappings)
+
+        probe, mappings = utils.load_probe(probe_path)
+
+        self.assertIsInstance(probe, linear_probe.LinearProbe)
+        for param, loaded_param in zip(self.probe.parameters(), probe.parameters()):
+            self.assertTrue(torch.equal(param, loaded_param))
+        self.assertEqual(mappings, self.mappings)
+
+    def test_save_load_probe_metadata(self):
+        "Metadata is loaded without loading the probe"
+        probe_path = f"{self.tmpdir.name}/probe.hdf5"
+        metadata = {"layers": [1, 2], "lambda_l1": 0.001}
+        utils.save_probe(probe_path, self.probe, self.mappings, metadata=metadata)
+
+        info = utils.load_probe_metadata(probe_path)
+
+        self.assertEqual(info["probe_type"], "LinearProbe")
+        self.assertEqual(info["input_size"], 20)
+        self.assertEqual(info["num_classes"], 3)
+        self.assertEqual(info["metadata"], metadata)
+        self.assertEqual(info["mappings"], self.mappings)
+
+        _, _, loaded_metadata = utils.load_probe(probe_path, return_metadata=True)
+        self.assertEqual(loaded_metadata, metadata)
+
+    def test_load_probe_weights(self):
+        "Weights of several probes are memory-mapped in bulk"
+        probes = [linear_probe.LinearProbe(20, 3) for _ in range(3)]
+        probe_paths = []
+        for probe_idx, probe in enumerate(probes):
+            probe_path = f"{self.tmpdir.name}/probe_{probe_idx}.hdf5"
+            utils.save_probe(probe_path, probe, self.mappings)
+            probe_paths.append(probe_path)
+
+        weights, biases = utils.load_probe_weights(probe_paths)
+
+        for probe, weight, bias in zip(probes, weights, biases):
+            self.assertIsInstance(weight, np.memmap)
+            np.testing.assert_array_equal(weight, probe.linear.weight.detach().numpy())
+            np.testing.assert_array_equal(bias, probe.linear.bias.detach().numpy())
+
+    def test_load_probe_unsupported_version(self):
+        "Loading a file with an unknown format version raises an error"
+        probe_path = f"{self.tmpdir.name}/probe.hdf5"
+        utils.save_probe(probe_path, self.probe, self.mappings)
+        with h5py.File(probe_path, "a") as probe_file:
+            probe_file.attrs["format_version"] = 1000
+
+        self.assertRaises(ValueError, utils.load_probe, probe_path)